@@ -0,0 +1,182 @@
+"""Cache de respostas em dois níveis, na frente do query engine.
+
+1. Exato: chave = pergunta normalizada (minúsculas, sem acentos, espaços e
+   pontuação final uniformizados).
+2. Semântico: compara o embedding da pergunta (o mesmo usado na recuperação)
+   com os embeddings das perguntas já respondidas; devolve a resposta guardada
+   quando a similaridade de cosseno passa de ``similarity_threshold``.
+
+A memória é limitada: no máximo ``max_entries`` respostas (LRU) e uma matriz
+pré-alocada de ``max_entries x dim`` floats para o nível semântico. Entradas
+expiram após ``ttl_seconds``. O cache inteiro é descartado quando a versão
+(índice + template de prompt) muda.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_question(text):
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text.casefold()).strip()
+    return text.rstrip("?!.;: ")
+
+
+def index_fingerprint(path):
+    """Identifica uma versão do índice pelos nomes, tamanhos e mtimes dos arquivos."""
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        stat = os.stat(os.path.join(path, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def cache_version(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class AnswerCache:
+    def __init__(self, max_entries=1000, ttl_seconds=24 * 3600, similarity_threshold=0.95,
+                 version=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.version = version
+        self._lock = threading.Lock()
+        # chave normalizada -> (resposta, criado_em, slot na matriz ou None)
+        self._entries = OrderedDict()
+        self._matrix = None  # alocada no primeiro embedding (dimensão do modelo)
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    # --- Versão (índice + prompt) ---
+    def set_version(self, version):
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self._stats["invalidations"] += 1
+            self._clear_locked()
+            self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def _clear_locked(self):
+        self._entries.clear()
+        if self._matrix is not None:
+            self._matrix[:] = 0.0
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    # --- Consulta ---
+    def get_exact(self, question):
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._get_live_locked(key)
+            if entry is None:
+                return None
+            self._stats["exact_hits"] += 1
+            return entry[0]
+
+    def get_semantic(self, embedding):
+        """Melhor resposta com similaridade >= limiar, ou None (conta como miss)."""
+        with self._lock:
+            if embedding is not None and self._matrix is not None and self._entries:
+                query = self._normalize(embedding)
+                scores = self._matrix @ query
+                for slot in np.argsort(-scores):
+                    if scores[slot] < self.similarity_threshold:
+                        break
+                    key = self._slot_keys[slot]
+                    if key is None:
+                        continue
+                    entry = self._get_live_locked(key)
+                    if entry is not None:
+                        self._stats["semantic_hits"] += 1
+                        return entry[0]
+            self._stats["misses"] += 1
+            return None
+
+    def _get_live_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.ttl_seconds:
+            self._remove_locked(key)
+            self._stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    # --- Escrita ---
+    def put(self, question, answer, embedding=None):
+        if self.max_entries <= 0:
+            return  # max_entries=0 desliga o cache (ex.: benchmarks do pipeline inteiro)
+        key = normalize_question(question)
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            while len(self._entries) >= self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+                self._stats["evictions"] += 1
+
+            slot = None
+            if embedding is not None:
+                vector = self._normalize(embedding)
+                if self._matrix is None:
+                    self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                slot = self._free_slots.pop()
+                self._matrix[slot] = vector
+                self._slot_keys[slot] = key
+            self._entries[key] = (answer, time.monotonic(), slot)
+
+    def _remove_locked(self, key):
+        _, _, slot = self._entries.pop(key)
+        if slot is not None:
+            self._matrix[slot] = 0.0
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # --- Estatísticas ---
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+            stats.update({
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity_threshold,
+                "hit_rate": (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0,
+                "matrix_bytes": self._matrix.nbytes if self._matrix is not None else 0,
+                "version": self.version,
+            })
+            return stats
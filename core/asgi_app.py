@@ -0,0 +1,213 @@
+"""Modo de serviço assíncrono (ASGI) para o chatbot.
+
+Com gunicorn síncrono cada /ask prende um processo inteiro durante a chamada
+ao Gemini/Ollama. Aqui um único processo mantém muitas requisições em voo
+(``aquery`` do LlamaIndex), com um limite configurável de concorrência e uma
+fila limitada: quando a fila enche, a resposta é 429 (backpressure).
+
+Uso (a partir de core/, reaproveitando o pipeline de chatbot.py no perfil escolhido):
+    CHATBOT_PROFILE=gemini uvicorn asgi_app:app --host 0.0.0.0 --port 5001
+    CHATBOT_PROFILE=local  uvicorn asgi_app:app --host 0.0.0.0 --port 5001
+
+Variáveis: ASYNC_MAX_IN_FLIGHT (padrão 32) e ASYNC_MAX_QUEUE (padrão 64).
+"""
+import asyncio
+import importlib
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# Permite importar os módulos de core/ também quando carregado como core.asgi_app
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import metrics
+from single_flight import SingleFlightTimeout
+
+CHATBOT_MODULE = os.getenv("CHATBOT_MODULE", "chatbot")
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "32"))
+ASYNC_MAX_QUEUE = int(os.getenv("ASYNC_MAX_QUEUE", "64"))
+
+logger = logging.getLogger("asgi_app")
+
+
+class Overloaded(Exception):
+    pass
+
+
+class ConcurrencyLimiter:
+    """No máximo ``max_in_flight`` requisições ativas e ``max_queue`` esperando."""
+
+    def __init__(self, max_in_flight, max_queue):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.completed = 0
+
+    async def __aenter__(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self.completed += 1
+        self._semaphore.release()
+        return False
+
+    def stats(self):
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "completed": self.completed,
+        }
+
+
+def create_app(get_service, get_api_secret=lambda: None, max_in_flight=ASYNC_MAX_IN_FLIGHT,
+               max_queue=ASYNC_MAX_QUEUE, on_startup=None, get_boot=lambda: None):
+    """Monta a aplicação Starlette.
+
+    ``get_service`` devolve o RagService atual (ou None enquanto não está
+    pronto) e ``get_api_secret`` a chave exigida em X-API-Key (ou None);
+    ``on_startup`` é chamado uma vez, numa thread, antes de aceitar requisições;
+    ``get_boot`` devolve o BootTracker do módulo do pipeline (para /readyz).
+    """
+    limiter = ConcurrencyLimiter(max_in_flight, max_queue)
+
+    def check_api_key(request):
+        api_secret = get_api_secret()
+        if api_secret and request.headers.get("X-API-Key") != api_secret:
+            logger.warning(f"Tentativa de acesso não autorizada ao endpoint {request.url.path}.")
+            return JSONResponse(
+                {"error": "Acesso não autorizado. Chave de API inválida ou ausente."}, status_code=401
+            )
+        return None
+
+    async def ask(request):
+        start = time.perf_counter()
+        request_id = metrics.new_request(request.headers.get("X-Request-ID"))
+        response = await handle_ask(request)
+        seconds = time.perf_counter() - start
+        metrics.REQUESTS.inc(endpoint="/ask", status=response.status_code)
+        metrics.REQUEST_SECONDS.observe(seconds, endpoint="/ask")
+        response.headers["X-Request-ID"] = request_id
+        logger.info(metrics.request_summary("/ask", response.status_code, seconds))
+        return response
+
+    async def handle_ask(request):
+        unauthorized = check_api_key(request)
+        if unauthorized:
+            return unauthorized
+
+        service = get_service()
+        if service is None:
+            return JSONResponse({"error": "Serviço de chatbot não está pronto"}, status_code=503)
+
+        try:
+            data = await request.json()
+        except Exception:
+            data = None
+        if not isinstance(data, dict) or "question" not in data:
+            return JSONResponse({"error": "JSON inválido ou chave 'question' ausente"}, status_code=400)
+        question = data["question"]
+        if not isinstance(question, str) or not question.strip():
+            return JSONResponse({"error": "Pergunta não pode ser vazia"}, status_code=400)
+
+        try:
+            async with limiter:
+                answer = await service.aanswer(question)
+        except Overloaded:
+            logger.warning("Fila cheia, requisição recusada (429).")
+            return JSONResponse(
+                {"error": "Servidor ocupado, tente novamente em instantes"},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+        except SingleFlightTimeout as e:
+            logger.warning(f"Tempo esgotado esperando pergunta igual em andamento: {e}")
+            return JSONResponse({"error": "Tempo esgotado ao processar a pergunta"}, status_code=504)
+        except Exception as e:
+            logger.error(f"Erro ao processar a query '{question}': {e}", exc_info=True)
+            return JSONResponse({"error": "Erro interno ao processar a pergunta"}, status_code=500)
+        return JSONResponse({"answer": answer})
+
+    async def queue_stats(request):
+        unauthorized = check_api_key(request)
+        if unauthorized:
+            return unauthorized
+        return JSONResponse(limiter.stats())
+
+    async def metrics_endpoint(request):
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    async def healthz(request):
+        return JSONResponse({"status": "ok", "pid": os.getpid()})
+
+    async def readyz(request):
+        boot = get_boot()
+        if boot is None:
+            ready = get_service() is not None
+            return JSONResponse({"status": "ready" if ready else "starting"},
+                                status_code=200 if ready else 503)
+        return JSONResponse(boot.status(), status_code=200 if boot.ready else 503)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        if on_startup is not None:
+            await asyncio.to_thread(on_startup)
+        yield
+
+    app = Starlette(
+        routes=[
+            Route("/ask", ask, methods=["POST"]),
+            Route("/queue/stats", queue_stats, methods=["GET"]),
+            Route("/metrics", metrics_endpoint, methods=["GET"]),
+            Route("/healthz", healthz, methods=["GET"]),
+            Route("/readyz", readyz, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.limiter = limiter
+    return app
+
+
+def _module_app():
+    # O módulo do pipeline (torch, modelos, índice) só é importado no startup do servidor
+    backend = {}
+
+    def on_startup():
+        module = importlib.import_module(CHATBOT_MODULE)
+        if not module.initialize_rag_pipeline():
+            raise RuntimeError(f"Falha ao inicializar o pipeline RAG de '{CHATBOT_MODULE}'.")
+        backend["module"] = module
+        logger.info(
+            f"Pipeline '{CHATBOT_MODULE}' pronto (modo assíncrono: "
+            f"{ASYNC_MAX_IN_FLIGHT} em voo, fila de {ASYNC_MAX_QUEUE})."
+        )
+
+    return create_app(
+        lambda: getattr(backend.get("module"), "rag_service", None),
+        get_api_secret=lambda: getattr(backend.get("module"), "CHATBOT_API_SHARED_SECRET", None),
+        on_startup=on_startup,
+        get_boot=lambda: getattr(backend.get("module"), "boot", None),
+    )
+
+
+app = _module_app()
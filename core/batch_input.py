@@ -0,0 +1,76 @@
+"""Leitura da entrada do endpoint /ask/batch.
+
+Formatos aceitos:
+    JSON  -> {"questions": ["pergunta 1", {"id": "x", "question": "pergunta 2"}, ...]}
+    JSONL -> uma pergunta por linha (Content-Type application/x-ndjson ou
+             application/jsonl, ou ?format=jsonl), no formato do requests.jsonl
+             da raiz do repositório: {"request_id": ..., "title": ..., "body": ...}.
+             Também aceita linhas {"id": ..., "question": ...}.
+"""
+import json
+
+JSONL_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+
+
+class BatchInputError(ValueError):
+    pass
+
+
+def _item_from_dict(entry, position):
+    item_id = entry.get("id", entry.get("request_id", position))
+    question = entry.get("question") or entry.get("body") or entry.get("title")
+    if not isinstance(question, str):
+        raise BatchInputError(f"Item {position}: campo 'question' (ou 'body') ausente.")
+    return {"id": item_id, "question": question}
+
+
+def parse_batch_items(request, max_items):
+    """Devolve uma lista de {"id", "question"}; levanta BatchInputError se a entrada for inválida."""
+    is_jsonl = (
+        request.args.get("format") == "jsonl"
+        or request.mimetype in JSONL_CONTENT_TYPES
+    )
+    if is_jsonl:
+        entries = []
+        for line_number, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                raise BatchInputError(f"Linha {line_number} não é um JSON válido.")
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("questions"), list):
+            raise BatchInputError("JSON inválido ou chave 'questions' ausente.")
+        entries = data["questions"]
+
+    if not entries:
+        raise BatchInputError("Lote vazio.")
+    if len(entries) > max_items:
+        raise BatchInputError(f"Lote com {len(entries)} perguntas excede o limite de {max_items}.")
+
+    items = []
+    for position, entry in enumerate(entries):
+        if isinstance(entry, str):
+            items.append({"id": position, "question": entry})
+        elif isinstance(entry, dict):
+            items.append(_item_from_dict(entry, position))
+        else:
+            raise BatchInputError(f"Item {position} deve ser texto ou objeto.")
+    return items
+
+
+def answer_items(rag_service, items, max_concurrency):
+    """Responde os itens válidos em lote e devolve um resultado por item, na ordem de entrada."""
+    valid = [item["question"] for item in items if item["question"].strip()]
+    answers = iter(rag_service.answer_batch(valid, max_concurrency=max_concurrency) if valid else [])
+    results = []
+    for item in items:
+        result = {"id": item["id"]}
+        if item["question"].strip():
+            result.update(next(answers))
+        else:
+            result["error"] = "Pergunta não pode ser vazia"
+        results.append(result)
+    return results
@@ -0,0 +1,156 @@
+"""Teste de carga: workers síncronos (gunicorn sync) vs. modo assíncrono (asgi_app).
+
+Usa um LLM stub local (latência fixa, sem gastar cota do Gemini) e um índice
+sintético pequeno, então mede apenas o efeito do modelo de concorrência.
+
+Uso (a partir de core/):
+    python bench_async.py --requests 200 --llm-latency 1.0 --sync-workers 4 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+from llama_index.core import MockEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import TextNode
+
+from asgi_app import create_app
+from numpy_retriever import NumpyRetriever
+from rag_service import RagService
+
+EMBED_DIM = 64
+
+
+class StubLLM(CustomLLM):
+    """LLM falso: espera ``latency`` segundos e devolve um texto fixo."""
+
+    latency: float = 1.0
+
+    @property
+    def metadata(self):
+        return LLMMetadata(model_name="stub")
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        time.sleep(self.latency)
+        return CompletionResponse(text="Resposta do LLM stub.")
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        await asyncio.sleep(self.latency)
+        return CompletionResponse(text="Resposta do LLM stub.")
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        time.sleep(self.latency)
+        yield CompletionResponse(text="Resposta do LLM stub.", delta="Resposta do LLM stub.")
+
+
+def build_service(llm_latency, n_nodes=200, seed=0):
+    rng = np.random.default_rng(seed)
+    nodes = [TextNode(text=f"Trecho sintético {i} sobre cultivo de cogumelos.") for i in range(n_nodes)]
+    embed_model = MockEmbedding(embed_dim=EMBED_DIM)
+    retriever = NumpyRetriever(
+        rng.normal(size=(n_nodes, EMBED_DIM)),
+        lambda indices: [nodes[int(i)] for i in indices],
+        similarity_top_k=5,
+        embed_model=embed_model,
+    )
+    query_engine = RetrieverQueryEngine.from_args(retriever, llm=StubLLM(latency=llm_latency))
+    return RagService(query_engine, cache=None, embed_model=embed_model)
+
+
+def summarize(mode, latencies, elapsed, n_requests, rejected=0):
+    ok = len(latencies)
+    return {
+        "mode": mode,
+        "requests": n_requests,
+        "ok": ok,
+        "rejected_429": rejected,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies) * 1000) if latencies else None,
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000) if latencies else None,
+    }
+
+
+def run_sync(service, n_requests, workers):
+    """Simula ``workers`` processos gunicorn síncronos: cada um atende uma requisição por vez."""
+    def one(i):
+        start = time.perf_counter()
+        service.answer(f"Pergunta {i} sobre shiitake?")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = list(executor.map(one, range(n_requests)))
+    return summarize(f"sync ({workers} workers)", latencies, time.perf_counter() - start, n_requests)
+
+
+async def run_async(service, n_requests, concurrency, max_in_flight, max_queue):
+    """Um único processo ASGI recebendo ``concurrency`` clientes simultâneos."""
+    app = create_app(lambda: service, max_in_flight=max_in_flight, max_queue=max_queue)
+    client_slots = asyncio.Semaphore(concurrency)
+    latencies, rejected = [], 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                 base_url="http://bench", timeout=None) as client:
+        async def one(i):
+            nonlocal rejected
+            async with client_slots:
+                start = time.perf_counter()
+                response = await client.post("/ask", json={"question": f"Pergunta {i} sobre shiitake?"})
+                if response.status_code == 429:
+                    rejected += 1
+                else:
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - start
+
+    return summarize(f"async (1 processo, {max_in_flight} em voo)", latencies, elapsed,
+                     n_requests, rejected)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga sync vs. async com LLM stub")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Segundos por chamada ao LLM")
+    parser.add_argument("--sync-workers", type=int, default=4, help="Workers gunicorn síncronos simulados")
+    parser.add_argument("--concurrency", type=int, default=64, help="Clientes simultâneos")
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--output", help="Salva os resultados em JSON")
+    args = parser.parse_args(argv)
+
+    service = build_service(args.llm_latency)
+    results = [
+        run_sync(service, args.requests, args.sync_workers),
+        asyncio.run(run_async(service, args.requests, args.concurrency,
+                              args.max_in_flight, args.max_queue)),
+    ]
+    for r in results:
+        print(
+            f"{r['mode']:<32} {r['throughput_rps']:>8.2f} req/s  p50 {r['p50_ms']} ms  "
+            f"p95 {r['p95_ms']} ms  429: {r['rejected_429']}"
+        )
+    print(f"Ganho de throughput: {results[1]['throughput_rps'] / results[0]['throughput_rps']:.1f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
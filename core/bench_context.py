@@ -0,0 +1,156 @@
+"""Tokens do prompt antes x depois da montagem de contexto (context_assembly.py).
+
+Para cada pergunta do conjunto rotulado (retrieval_eval.jsonl) recupera os
+``--top-k`` nós, monta o contexto com cada orçamento de ``--budgets`` e mede:
+    tokens do prompt (template + pergunta + contexto) antes e depois,
+    nós antes e depois, tempo da montagem,
+    retenção: perguntas com página relevante no contexto depois / antes.
+
+A recuperação é BM25 por padrão (não precisa do modelo de embedding); use
+``--mode dense`` ou ``hybrid`` com o índice mmap e o modelo disponíveis.
+
+Uso (a partir de core/):
+    python bench_context.py --persist-dir ../storage_gemini_llm --top-k 5 --budgets 600 1000 1500
+    python bench_context.py --mode dense --mmap-dir ../storage_gemini_llm_mmap --output context.json
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+import numpy as np
+from llama_index.core.prompts.default_prompts import DEFAULT_TEXT_QA_PROMPT_TMPL
+from llama_index.core.schema import NodeWithScore
+
+from context_assembly import (
+    CONTEXT_MIN_PARTIAL_TOKENS,
+    CONTEXT_MIN_SCORE_RATIO,
+    CONTEXT_TOKEN_BUDGET,
+    ContextAssembler,
+)
+from eval_retrieval import EMBEDDING_MODEL_NAME, load_labels, load_nodes
+from hybrid_retriever import HYBRID_CANDIDATES, reciprocal_rank_fusion
+from index_lifecycle import load_lexical, load_retriever
+
+MODES = ("lexical", "dense", "hybrid")
+
+
+def retrieve(args, questions, nodes, index_dir, node_ids, logger):
+    """(posições, scores) dos ``top_k`` nós de cada pergunta."""
+    lexical = load_lexical(index_dir, len(nodes), node_ids, lambda: nodes, logger)
+    candidates = max(args.top_k, HYBRID_CANDIDATES)
+    if args.mode == "lexical":
+        return [lexical.search(q, args.top_k) for q in questions]
+
+    from fast_embedding import create_embed_model
+
+    dense, _ = load_retriever(args.mmap_dir, args.persist_dir, args.top_k, logger, mode="dense")
+    embed_model = create_embed_model(EMBEDDING_MODEL_NAME, "cpu", logger, backend=args.backend, warmup_runs=0)
+    embeddings = np.asarray([embed_model.get_query_embedding(q) for q in questions], dtype=np.float32)
+    if args.mode == "dense":
+        indices, scores = dense.top_k(embeddings, args.top_k)
+        return list(zip(indices, scores))
+    dense_top, _ = dense.top_k(embeddings, candidates)
+    return [
+        reciprocal_rank_fusion([d, lexical.search(q, candidates)[0]], args.top_k)
+        for d, q in zip(dense_top, questions)
+    ]
+
+
+def relevant_in(nodes, item):
+    relevant = set(item["relevant_pages"])
+    file_name = item.get("file_name")
+    return any(
+        n.node.metadata.get("page_label") in relevant
+        and (not file_name or n.node.metadata.get("file_name") == file_name)
+        for n in nodes
+    )
+
+
+def _summary(values):
+    return {
+        "mean": round(float(np.mean(values)), 1),
+        "p50": round(float(np.percentile(values, 50)), 1),
+        "p95": round(float(np.percentile(values, 95)), 1),
+    }
+
+
+def run(args, logger):
+    labels = load_labels(args.questions)
+    questions = [item["question"] for item in labels]
+    index_dir, node_ids, nodes = load_nodes(args.mmap_dir, args.persist_dir)
+    results = retrieve(args, questions, nodes, index_dir, node_ids, logger)
+    template = DEFAULT_TEXT_QA_PROMPT_TMPL
+    if args.template:
+        with open(args.template, encoding="utf-8") as f:
+            template = f.read()
+
+    quiet = logging.getLogger("bench_context.assembler")
+    quiet.setLevel(logging.WARNING)
+    report = {"index": index_dir, "mode": args.mode, "top_k": args.top_k, "questions": len(labels), "budgets": {}}
+    for budget in args.budgets:
+        assembler = ContextAssembler(template, quiet, token_budget=budget,
+                                     min_score_ratio=0.0 if args.mode == "hybrid" else args.min_score_ratio,
+                                     min_partial_tokens=args.min_partial_tokens)
+        before, after, nodes_before, nodes_after, seconds = [], [], [], [], []
+        kept_before = kept_after = 0
+        for question, item, (indices, scores) in zip(questions, labels, results):
+            retrieved = [NodeWithScore(node=nodes[int(i)], score=float(s)) for i, s in zip(indices, scores)]
+            fixed = assembler.prompt_tokens + assembler.count_tokens(question)
+            start = time.perf_counter()
+            assembled = assembler.assemble(retrieved)
+            seconds.append(time.perf_counter() - start)
+            before.append(fixed + assembler.context_tokens(retrieved))
+            after.append(fixed + assembler.context_tokens(assembled))
+            nodes_before.append(len(retrieved))
+            nodes_after.append(len(assembled))
+            kept_before += relevant_in(retrieved, item)
+            kept_after += relevant_in(assembled, item)
+
+        row = {
+            "prompt_tokens_before": _summary(before),
+            "prompt_tokens_after": _summary(after),
+            "reduction": round(1 - sum(after) / sum(before), 4),
+            "nodes_before": round(float(np.mean(nodes_before)), 2),
+            "nodes_after": round(float(np.mean(nodes_after)), 2),
+            "relevant_before": kept_before,
+            "relevant_after": kept_after,
+            "assembly_p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 3),
+            "assembly_p95_ms": round(float(np.percentile(seconds, 95)) * 1000, 3),
+        }
+        report["budgets"][budget] = row
+        print(f"orçamento {budget:>5}: tokens {row['prompt_tokens_before']['mean']:>7} -> "
+              f"{row['prompt_tokens_after']['mean']:>7} (-{row['reduction']:.1%}), "
+              f"nós {row['nodes_before']} -> {row['nodes_after']}, "
+              f"página relevante {kept_before} -> {kept_after}/{len(labels)}, "
+              f"montagem p95 {row['assembly_p95_ms']} ms")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tokens do prompt antes x depois da montagem de contexto")
+    parser.add_argument("--questions", default="retrieval_eval.jsonl")
+    parser.add_argument("--mmap-dir", default="../storage_gemini_llm_mmap")
+    parser.add_argument("--persist-dir", default="../storage_gemini_llm")
+    parser.add_argument("--mode", choices=MODES, default="lexical")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[CONTEXT_TOKEN_BUDGET])
+    parser.add_argument("--min-score-ratio", type=float, default=CONTEXT_MIN_SCORE_RATIO)
+    parser.add_argument("--min-partial-tokens", type=int, default=CONTEXT_MIN_PARTIAL_TOKENS)
+    parser.add_argument("--template", help="Arquivo com o prompt ({context_str}, {query_str}); "
+                                           "padrão: o do LlamaIndex")
+    parser.add_argument("--backend", default="torch", help="Backend de embedding (fast_embedding.py)")
+    parser.add_argument("--output", help="Salva os resultados em JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    report = run(args, logging.getLogger("bench_context"))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
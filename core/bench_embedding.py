@@ -0,0 +1,186 @@
+"""Precisão e latência dos backends de embedding de CPU (fast_embedding.py).
+
+    check: compara, para um conjunto de perguntas, os top-k recuperados do
+           índice com o embedding fp32 original e com o backend escolhido;
+    bench: mede o tempo de carga e a latência (p50/p95) por pergunta de cada backend.
+
+Uso (a partir de core/):
+    python bench_embedding.py check --backend onnx-int8 --mmap-dir ../storage_gemini_llm_mmap
+    python bench_embedding.py bench --backends torch int8 onnx onnx-int8 --runs 50 --threads 4
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from fast_embedding import BACKENDS, create_embed_model
+from index_lifecycle import load_retriever
+
+EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large"
+
+DEFAULT_QUESTIONS = [
+    "Qual a temperatura ideal para o cultivo de shiitake?",
+    "Como preparar o substrato para o shimeji?",
+    "Qual a umidade relativa recomendada na frutificação?",
+    "Quanto tempo dura a incubação do shiitake em toras?",
+    "Como pasteurizar o substrato de palha?",
+    "Quais são as principais pragas no cultivo de cogumelos?",
+    "Como evitar contaminação por Trichoderma?",
+    "Qual a proporção de farelo de trigo no substrato?",
+    "O que é o spawn ou semente de cogumelo?",
+    "Como fazer a inoculação em toras de eucalipto?",
+    "Qual a luminosidade necessária para a frutificação?",
+    "Como armazenar cogumelos frescos após a colheita?",
+    "Qual o pH adequado do substrato?",
+    "Como cultivar champignon em composto?",
+    "Quais cuidados de higiene no local de cultivo?",
+    "Como é feita a indução da frutificação por choque térmico?",
+    "Quais espécies de Pleurotus são cultivadas no Brasil?",
+    "Qual a produtividade esperada por bloco de substrato?",
+    "Como secar cogumelos para conservação?",
+    "Qual a diferença entre cultivo axênico e cultivo em composto?",
+]
+LONG_QUERY = " ".join(DEFAULT_QUESTIONS[:8])
+
+
+def load_questions(path):
+    """Arquivo texto (uma pergunta por linha) ou JSONL no formato do requests.jsonl."""
+    if path is None:
+        return DEFAULT_QUESTIONS
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                line = item.get("question") or item.get("body") or item.get("title") or ""
+            if line:
+                questions.append(line)
+    return questions
+
+
+def percentile_ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2)
+
+
+def check(args, logger):
+    retriever, index_dir = load_retriever(args.mmap_dir, args.persist_dir, args.top_k, logger,
+                                           mode="dense")
+    questions = load_questions(args.questions)
+    reference = create_embed_model(EMBEDDING_MODEL_NAME, "cpu", logger, backend="torch", warmup_runs=0)
+    candidate = create_embed_model(EMBEDDING_MODEL_NAME, "cpu", logger, backend=args.backend,
+                                   num_threads=args.threads, warmup_runs=0)
+
+    ref_vectors = np.asarray([reference.get_query_embedding(q) for q in questions], dtype=np.float32)
+    cand_vectors = np.asarray([candidate.get_query_embedding(q) for q in questions], dtype=np.float32)
+    ref_top, _ = retriever.top_k(ref_vectors, args.top_k)
+    cand_top, _ = retriever.top_k(cand_vectors, args.top_k)
+
+    same_order = same_set = 0
+    for question, ref_row, cand_row in zip(questions, ref_top, cand_top):
+        if list(ref_row) == list(cand_row):
+            same_order += 1
+        if set(ref_row) == set(cand_row):
+            same_set += 1
+        else:
+            logger.warning(f"Top-{args.top_k} diferente para '{question}': {list(ref_row)} x {list(cand_row)}")
+    cosines = np.sum(ref_vectors * cand_vectors, axis=1)
+
+    result = {
+        "index": index_dir,
+        "backend": args.backend,
+        "questions": len(questions),
+        "top_k": args.top_k,
+        "same_top_k_set": same_set,
+        "same_top_k_order": same_order,
+        "set_match_rate": round(same_set / len(questions), 4),
+        "min_query_cosine": round(float(cosines.min()), 6),
+        "mean_query_cosine": round(float(cosines.mean()), 6),
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return result, result["set_match_rate"] >= args.min_match
+
+
+def bench(args, logger):
+    results = []
+    for backend in args.backends:
+        start = time.perf_counter()
+        embed_model = create_embed_model(EMBEDDING_MODEL_NAME, "cpu", logger, backend=backend,
+                                         num_threads=args.threads, warmup_runs=args.warmup)
+        load_s = time.perf_counter() - start
+
+        short = []
+        for i in range(args.runs):
+            t = time.perf_counter()
+            embed_model.get_query_embedding(DEFAULT_QUESTIONS[i % len(DEFAULT_QUESTIONS)])
+            short.append(time.perf_counter() - t)
+        long = []
+        for _ in range(max(1, args.runs // 5)):
+            t = time.perf_counter()
+            embed_model.get_query_embedding(LONG_QUERY)
+            long.append(time.perf_counter() - t)
+
+        result = {
+            "backend": backend,
+            "threads": args.threads,
+            "load_and_warmup_s": round(load_s, 2),
+            "short_p50_ms": percentile_ms(short, 50),
+            "short_p95_ms": percentile_ms(short, 95),
+            "short_mean_ms": round(statistics.mean(short) * 1000, 2),
+            "long_p50_ms": percentile_ms(long, 50),
+        }
+        results.append(result)
+        print(
+            f"{backend:<10} carga {result['load_and_warmup_s']:>6.2f} s  "
+            f"curta p50 {result['short_p50_ms']:>8.2f} ms  p95 {result['short_p95_ms']:>8.2f} ms  "
+            f"longa p50 {result['long_p50_ms']:>8.2f} ms"
+        )
+        del embed_model
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precisão e latência dos backends de embedding")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = sub.add_parser("check", help="Top-k do backend x fp32 no índice existente")
+    check_parser.add_argument("--backend", choices=BACKENDS[1:], default="onnx-int8")
+    check_parser.add_argument("--mmap-dir", default="../storage_gemini_llm_mmap")
+    check_parser.add_argument("--persist-dir", default="../storage_gemini_llm")
+    check_parser.add_argument("--questions", help="Arquivo de perguntas (texto ou JSONL)")
+    check_parser.add_argument("--top-k", type=int, default=5)
+    check_parser.add_argument("--min-match", type=float, default=0.95,
+                              help="Fração mínima de perguntas com o mesmo conjunto top-k")
+    check_parser.add_argument("--threads", type=int, default=0)
+
+    bench_parser = sub.add_parser("bench", help="Latência por pergunta de cada backend")
+    bench_parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    bench_parser.add_argument("--runs", type=int, default=50)
+    bench_parser.add_argument("--threads", type=int, default=0)
+    bench_parser.add_argument("--warmup", type=int, default=3)
+
+    for p in (check_parser, bench_parser):
+        p.add_argument("--output", help="Salva os resultados em JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    logger = logging.getLogger("bench_embedding")
+
+    if args.command == "check":
+        results, ok = check(args, logger)
+    else:
+        results, ok = bench(args, logger), True
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""Replay de perguntas contra os servidores de core/, com o LLM stub (stub_llm_server.py).
+
+Para cada módulo o script sobe o stub (Ollama + Gemini) e o servidor apontando
+para ele, espera o /readyz e dispara as perguntas com a concorrência pedida:
+primeiro no /ask (latência e throughput), depois no /ask/stream (tempo até o
+primeiro token). O cache de respostas é desligado (CACHE_MAX_ENTRIES=0) para
+medir o pipeline inteiro; use --keep-cache para manter.
+
+Os resultados vão para ``bench_baselines/<nome>.json``. Com --compare o
+resultado é comparado com o baseline salvo (sem sobrescrever) e o script sai
+com código 1 se p95, TTFT p95 ou throughput piorarem além de --tolerance.
+
+Uso (a partir de core/):
+    python bench_replay.py --modules localchatbot geminichatbot --questions perguntas.jsonl --concurrency 8 --requests 200
+    python bench_replay.py --modules geminichatbot --compare
+    python bench_replay.py --url http://127.0.0.1:5001 --name producao --requests 50   # servidor já no ar
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from bench_embedding import load_questions
+
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES = ("chatbot", "geminichatbot", "localchatbot", "geminichatbot_railway", "asgi_app")
+# asgi_app não tem /ask/stream
+STREAM_MODULES = ("chatbot", "geminichatbot", "localchatbot", "geminichatbot_railway")
+BASELINE_DIR = os.path.join(CORE_DIR, "bench_baselines")
+
+
+def summarize(samples, wall_s, concurrency):
+    latencies = [s[0] for s in samples if s[2] is None]
+    ttfts = [s[1] for s in samples if s[2] is None and s[1] is not None]
+    errors = [s[2] for s in samples if s[2] is not None]
+
+    def percentiles(values):
+        if not values:
+            return None
+        ms = np.asarray(values) * 1000
+        return {
+            "p50": round(float(np.percentile(ms, 50)), 1),
+            "p95": round(float(np.percentile(ms, 95)), 1),
+            "p99": round(float(np.percentile(ms, 99)), 1),
+            "mean": round(float(ms.mean()), 1),
+            "max": round(float(ms.max()), 1),
+        }
+
+    return {
+        "requests": len(samples),
+        "ok": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "concurrency": concurrency,
+        "wall_s": round(wall_s, 2),
+        "throughput_rps": round(len(latencies) / wall_s, 3) if wall_s else 0.0,
+        "latency_ms": percentiles(latencies),
+        "ttft_ms": percentiles(ttfts),
+    }
+
+
+async def run_load(base_url, questions, n_requests, concurrency, stream, headers, timeout):
+    """Dispara ``n_requests`` perguntas (em ciclo) com no máximo ``concurrency`` em voo."""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=timeout, limits=limits) as client:
+        async def one(i):
+            payload = {"question": questions[i % len(questions)]}
+            async with semaphore:
+                start = time.perf_counter()
+                ttft = None
+                try:
+                    if stream:
+                        async with client.stream("POST", "/ask/stream?format=ndjson", json=payload) as r:
+                            r.raise_for_status()
+                            async for line in r.aiter_lines():
+                                if not line.strip():
+                                    continue
+                                item = json.loads(line)
+                                if "error" in item:
+                                    raise RuntimeError(item["error"])
+                                if ttft is None and "token" in item:
+                                    ttft = time.perf_counter() - start
+                    else:
+                        r = await client.post("/ask", json=payload)
+                        r.raise_for_status()
+                except Exception as e:
+                    return time.perf_counter() - start, None, repr(e)[:200]
+                return time.perf_counter() - start, ttft, None
+
+        start = time.perf_counter()
+        samples = await asyncio.gather(*(one(i) for i in range(n_requests)))
+        return summarize(samples, time.perf_counter() - start, concurrency)
+
+
+def wait_ready(url, process, log_path, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Processo saiu com código {process.returncode}; veja {log_path}")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} não ficou pronto em {timeout} s; veja {log_path}")
+
+
+def start_process(cmd, env, log_path):
+    log = open(log_path, "w", encoding="utf-8")
+    return subprocess.Popen(cmd, cwd=CORE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_process(process):
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def server_command(module, port):
+    if module == "asgi_app":
+        return [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1",
+                "--port", str(port), "--log-level", "warning"]
+    # O import já inicializa o pipeline (mesmo caminho do gunicorn); depois sobe o Flask
+    return [sys.executable, "-c",
+            f"import {module}; {module}.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+
+
+def stub_command(args):
+    return [sys.executable, "stub_llm_server.py", "--port", str(args.stub_port),
+            "--latency", str(args.stub_latency), "--tokens-per-second", str(args.stub_tps),
+            "--completion-tokens", str(args.stub_tokens), "--embed-dim", str(args.stub_embed_dim)]
+
+
+def server_env(args):
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    env = dict(os.environ)
+    env.pop("CHATBOT_PREFORK", None)
+    env.update({"OLLAMA_BASE_URL": stub_url, "GEMINI_API_BASE": stub_url, "PYTHONUNBUFFERED": "1"})
+    env.setdefault("GEMINI_API_KEY", "stub")
+    if not args.keep_cache:
+        env["CACHE_MAX_ENTRIES"] = "0"
+    return env
+
+
+def bench_target(name, base_url, questions, args, stream):
+    headers = {}
+    if os.getenv("CHATBOT_API_SHARED_SECRET"):
+        headers["X-API-Key"] = os.getenv("CHATBOT_API_SHARED_SECRET")
+    if args.warmup:
+        asyncio.run(run_load(base_url, questions, args.warmup, 1, False, headers, args.timeout))
+
+    print(f"[{name}] /ask: {args.requests} requisições, concorrência {args.concurrency}...")
+    ask = asyncio.run(run_load(base_url, questions, args.requests, args.concurrency, False, headers, args.timeout))
+    result = {"ask": ask, "stream": None}
+    if stream:
+        n_stream = args.stream_requests if args.stream_requests is not None else args.requests
+        print(f"[{name}] /ask/stream: {n_stream} requisições...")
+        result["stream"] = asyncio.run(
+            run_load(base_url, questions, n_stream, args.concurrency, True, headers, args.timeout)
+        )
+    return result
+
+
+def bench_module(module, questions, args):
+    os.makedirs(args.log_dir, exist_ok=True)
+    env = server_env(args)
+    stub = server = None
+    try:
+        stub_log = os.path.join(args.log_dir, "stub_llm_server.log")
+        stub = start_process(stub_command(args), env, stub_log)
+        wait_ready(f"http://127.0.0.1:{args.stub_port}/stub/stats", stub, stub_log, 30)
+
+        server_log = os.path.join(args.log_dir, f"{module}.log")
+        print(f"[{module}] Subindo servidor (log em {server_log})...")
+        server = start_process(server_command(module, args.port), env, server_log)
+        base_url = f"http://127.0.0.1:{args.port}"
+        start = time.perf_counter()
+        wait_ready(f"{base_url}/readyz", server, server_log, args.boot_timeout)
+        boot_s = time.perf_counter() - start
+
+        result = bench_target(module, base_url, questions, args, module in STREAM_MODULES)
+        result["boot_s"] = round(boot_s, 2)
+        result["stub_calls"] = httpx.get(f"http://127.0.0.1:{args.stub_port}/stub/stats").json()["calls"]
+        return result
+    finally:
+        stop_process(server)
+        stop_process(stub)
+
+
+def compare(baseline, result, tolerance):
+    """Lista de regressões (métrica, baseline, atual) acima da tolerância."""
+    regressions = []
+    for section in ("ask", "stream"):
+        old, new = baseline.get(section), result.get(section)
+        if not old or not new:
+            continue
+        for metric, key in (("latency_ms", "p95"), ("ttft_ms", "p95")):
+            if old.get(metric) and new.get(metric) and new[metric][key] > old[metric][key] * (1 + tolerance):
+                regressions.append((f"{section}.{metric}.{key}", old[metric][key], new[metric][key]))
+        if new["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append((f"{section}.throughput_rps", old["throughput_rps"], new["throughput_rps"]))
+        if new["errors"] > old["errors"]:
+            regressions.append((f"{section}.errors", old["errors"], new["errors"]))
+    return regressions
+
+
+def print_result(name, result):
+    for section in ("ask", "stream"):
+        summary = result.get(section)
+        if not summary:
+            continue
+        latency, ttft = summary["latency_ms"] or {}, summary["ttft_ms"] or {}
+        line = (
+            f"{name:<22} {section:<6} ok {summary['ok']}/{summary['requests']}  "
+            f"{summary['throughput_rps']:.2f} req/s  p50 {latency.get('p50')} ms  "
+            f"p95 {latency.get('p95')} ms  p99 {latency.get('p99')} ms"
+        )
+        if ttft:
+            line += f"  TTFT p50 {ttft['p50']} ms  p95 {ttft['p95']} ms"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay de perguntas com LLM stub: latência, throughput e TTFT")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--modules", nargs="+", choices=MODULES, default=["geminichatbot"])
+    target.add_argument("--url", help="Servidor já no ar (não sobe stub nem servidor)")
+    parser.add_argument("--name", help="Nome do baseline quando usar --url")
+    parser.add_argument("--questions", help="Perguntas em texto ou JSONL (formato do requests.jsonl)")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--stream-requests", type=int, help="Padrão: o mesmo de --requests")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--stub-port", type=int, default=18000)
+    parser.add_argument("--stub-latency", type=float, default=0.5)
+    parser.add_argument("--stub-tps", type=float, default=80.0)
+    parser.add_argument("--stub-tokens", type=int, default=120)
+    parser.add_argument("--stub-embed-dim", type=int, default=768)
+    parser.add_argument("--boot-timeout", type=float, default=600.0)
+    parser.add_argument("--keep-cache", action="store_true", help="Não desliga o cache de respostas")
+    parser.add_argument("--baseline-dir", default=BASELINE_DIR)
+    parser.add_argument("--log-dir", default=os.path.join(BASELINE_DIR, "logs"))
+    parser.add_argument("--compare", action="store_true", help="Compara com o baseline salvo em vez de gravar")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    config = {
+        "questions": args.questions or "DEFAULT_QUESTIONS",
+        "n_questions": len(questions),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "cache": args.keep_cache,
+    }
+    if args.url:
+        targets = [(args.name or "url", None)]
+    else:
+        config["stub"] = {
+            "latency_s": args.stub_latency,
+            "tokens_per_second": args.stub_tps,
+            "completion_tokens": args.stub_tokens,
+        }
+        targets = [(module, module) for module in args.modules]
+
+    os.makedirs(args.baseline_dir, exist_ok=True)
+    failed = False
+    for name, module in targets:
+        try:
+            if module is None:
+                result = bench_target(name, args.url.rstrip("/"), questions, args, stream=True)
+            else:
+                result = bench_module(module, questions, args)
+        except (RuntimeError, TimeoutError) as e:
+            print(f"[{name}] Falhou: {e}")
+            failed = True
+            continue
+        result.update({
+            "name": name,
+            "config": config,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "host": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        })
+        print_result(name, result)
+
+        path = os.path.join(args.baseline_dir, f"{name}.json")
+        if args.compare:
+            if not os.path.exists(path):
+                print(f"[{name}] Sem baseline em {path}.")
+                failed = True
+                continue
+            with open(path, encoding="utf-8") as f:
+                regressions = compare(json.load(f), result, args.tolerance)
+            for metric, old, new in regressions:
+                print(f"[{name}] REGRESSÃO {metric}: {old} -> {new}")
+            failed = failed or bool(regressions)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+            print(f"[{name}] Baseline salvo em {path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Verificação e benchmark do NumpyRetriever.
+
+Uso (a partir de core/):
+    # Confere se o NumpyRetriever devolve os mesmos top-k que o query engine atual
+    python bench_retriever.py check ../storage_gemini_llm --top-k 5
+
+    # Latência por consulta conforme o corpus cresce (chunks sintéticos)
+    python bench_retriever.py bench --sizes 1000 10000 100000 --dim 1024
+
+A verificação não precisa do modelo de embedding: usa como consultas os
+próprios vetores dos nós (com ruído) e vetores aleatórios, passando o
+embedding pronto no QueryBundle para os dois retrievers.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from llama_index.core.indices.query.embedding_utils import get_top_k_embeddings
+from llama_index.core.schema import QueryBundle
+
+from numpy_retriever import NumpyRetriever
+
+
+def check(persist_dir, top_k, n_random, seed):
+    from llama_index.core import Settings, StorageContext, load_index_from_storage
+
+    # As consultas já levam o embedding; nenhum modelo precisa ser carregado.
+    Settings.embed_model = None
+    storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+    index = load_index_from_storage(storage_context)
+    embedding_dict = index.vector_store.data.embedding_dict
+    if not embedding_dict:
+        print(f"Sem embeddings em '{persist_dir}' (default__vector_store.json ausente?).")
+        return 1
+
+    baseline = index.as_retriever(similarity_top_k=top_k)
+    retriever = NumpyRetriever.from_index(index, similarity_top_k=top_k)
+
+    rng = np.random.default_rng(seed)
+    matrix = np.array(list(embedding_dict.values()), dtype=np.float32)
+    queries = list(matrix + rng.normal(scale=0.01, size=matrix.shape).astype(np.float32))
+    queries += list(rng.normal(size=(n_random, matrix.shape[1])).astype(np.float32))
+
+    mismatches = 0
+    for query in queries:
+        expected = [n.node_id for n in baseline.retrieve(QueryBundle("", embedding=query.tolist()))]
+        got = [n.node_id for n in retriever.retrieve(QueryBundle("", embedding=query.tolist()))]
+        if expected != got:
+            mismatches += 1
+
+    batch = retriever.retrieve_batch([QueryBundle("", embedding=q.tolist()) for q in queries])
+    batch_mismatches = sum(
+        [n.node_id for n in b] != [n.node_id for n in retriever.retrieve(QueryBundle("", embedding=q.tolist()))]
+        for b, q in zip(batch, queries)
+    )
+
+    print(f"Nós no índice: {len(retriever)} | consultas: {len(queries)} | top-k: {top_k}")
+    print(f"Divergências vs. query engine atual: {mismatches}")
+    print(f"Divergências lote vs. consulta única: {batch_mismatches}")
+    return 0 if mismatches == 0 and batch_mismatches == 0 else 1
+
+
+def _time_per_query(fn, n_queries, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / n_queries * 1000
+
+
+def bench(sizes, dim, top_k, n_queries, batch_size, baseline_max, repeat, seed, output):
+    rng = np.random.default_rng(seed)
+    results = []
+    print(f"{'chunks':>8} {'numpy (ms)':>11} {'numpy lote (ms)':>16} {'llama_index (ms)':>17}")
+    for size in sizes:
+        matrix = rng.normal(size=(size, dim)).astype(np.float32)
+        queries = rng.normal(size=(n_queries, dim)).astype(np.float32)
+        retriever = NumpyRetriever(matrix, get_nodes=None, similarity_top_k=top_k)
+
+        single = _time_per_query(lambda: [retriever.top_k(q) for q in queries], n_queries, repeat)
+        batched = _time_per_query(
+            lambda: [retriever.top_k(queries[i:i + batch_size]) for i in range(0, n_queries, batch_size)],
+            n_queries, repeat,
+        )
+
+        baseline = None
+        if size <= baseline_max:
+            embeddings = matrix.tolist()
+            n_base = min(n_queries, 5)
+            baseline = _time_per_query(
+                lambda: [get_top_k_embeddings(q.tolist(), embeddings, similarity_top_k=top_k)
+                         for q in queries[:n_base]],
+                n_base, 1,
+            )
+
+        results.append({
+            "chunks": size, "dim": dim, "top_k": top_k,
+            "numpy_ms_per_query": single,
+            "numpy_batch_ms_per_query": batched,
+            "llama_index_ms_per_query": baseline,
+        })
+        baseline_str = f"{baseline:17.3f}" if baseline is not None else f"{'-':>17}"
+        print(f"{size:>8} {single:11.3f} {batched:16.3f} {baseline_str}")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verificação e benchmark do NumpyRetriever")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_check = sub.add_parser("check", help="Compara top-k com o query engine atual")
+    p_check.add_argument("persist_dir")
+    p_check.add_argument("--top-k", type=int, default=5)
+    p_check.add_argument("--random-queries", type=int, default=200)
+    p_check.add_argument("--seed", type=int, default=0)
+
+    p_bench = sub.add_parser("bench", help="Latência por consulta vs. tamanho do corpus")
+    p_bench.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    p_bench.add_argument("--dim", type=int, default=1024)
+    p_bench.add_argument("--top-k", type=int, default=5)
+    p_bench.add_argument("--queries", type=int, default=64)
+    p_bench.add_argument("--batch-size", type=int, default=32)
+    p_bench.add_argument("--baseline-max", type=int, default=10000,
+                         help="Maior corpus em que a varredura do llama_index é medida")
+    p_bench.add_argument("--repeat", type=int, default=3)
+    p_bench.add_argument("--seed", type=int, default=0)
+    p_bench.add_argument("--output", help="Salva os resultados em JSON")
+
+    args = parser.parse_args(argv)
+    if args.command == "check":
+        return check(args.persist_dir, args.top_k, args.random_queries, args.seed)
+    return bench(args.sizes, args.dim, args.top_k, args.queries, args.batch_size,
+                 args.baseline_max, args.repeat, args.seed, args.output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
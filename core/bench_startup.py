@@ -0,0 +1,123 @@
+"""Benchmark de cold start do servidor Railway: antes x depois.
+
+Antes: a cada boot todos os chunks eram re-embedados pela API do Gemini e o
+query engine era recriado a cada requisição.
+Depois: o boot abre o artefato pré-construído (mmap) e cria o engine uma vez.
+
+As chamadas à API de embedding são simuladas com ``--embed-latency`` segundos
+por lote de ``--embed-batch`` textos (padrão do GeminiEmbedding), para não
+gastar cota; os nós vêm do docstore de ``--persist-dir``.
+
+Uso (a partir de core/):
+    python bench_startup.py --persist-dir ../storage_gemini_llm --embed-latency 0.3
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+from llama_index.core import (
+    MockEmbedding,
+    Settings,
+    StorageContext,
+    VectorStoreIndex,
+    load_index_from_storage,
+)
+from llama_index.core.llms import MockLLM
+from llama_index.core.query_engine import RetrieverQueryEngine
+
+from convert_storage import convert, load_json_storage
+from mmap_store import MmapNodeStore
+from numpy_retriever import NumpyRetriever
+
+EMBED_DIM = 768  # models/embedding-001
+
+
+class SimulatedApiEmbedding(MockEmbedding):
+    """Embedding falso que espera ``latency`` segundos por chamada em lote, como uma API remota."""
+
+    latency: float = 0.3
+    calls: int = 0
+
+    def _get_text_embeddings(self, texts):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._get_vector() for _ in texts]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start do servidor Railway: antes x depois")
+    parser.add_argument("--persist-dir", default="../storage_gemini_llm")
+    parser.add_argument("--embed-latency", type=float, default=0.3,
+                        help="Segundos por chamada à API de embedding (simulada)")
+    parser.add_argument("--embed-batch", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100,
+                        help="Requisições para medir o custo de recriar o engine")
+    parser.add_argument("--output", help="Salva os resultados em JSON")
+    args = parser.parse_args(argv)
+
+    Settings.llm = MockLLM()
+    embed_model = SimulatedApiEmbedding(
+        embed_dim=EMBED_DIM, latency=args.embed_latency, embed_batch_size=args.embed_batch
+    )
+    Settings.embed_model = embed_model
+
+    nodes, _ = load_json_storage(args.persist_dir)
+    nodes = list(nodes.values())
+
+    # --- Antes: re-embedar tudo no boot ---
+    index, rebuild_s = timed(lambda: VectorStoreIndex(nodes=nodes, embed_model=embed_model))
+    engine_per_request_s = timed(
+        lambda: [index.as_query_engine(similarity_top_k=3) for _ in range(args.requests)]
+    )[1] / args.requests
+
+    with tempfile.TemporaryDirectory() as tmp:
+        persist_dir, mmap_dir = f"{tmp}/json", f"{tmp}/mmap"
+        index.storage_context.persist(persist_dir=persist_dir)
+        convert(persist_dir, mmap_dir)
+
+        # --- Intermediário: índice JSON persistido ---
+        def load_json():
+            loaded = load_index_from_storage(StorageContext.from_defaults(persist_dir=persist_dir))
+            return NumpyRetriever.from_index(loaded, similarity_top_k=3)
+        _, json_load_s = timed(load_json)
+
+        # --- Depois: artefato mmap + engine criado uma vez ---
+        def load_mmap():
+            retriever = NumpyRetriever.from_store(MmapNodeStore.open(mmap_dir), similarity_top_k=3)
+            return RetrieverQueryEngine.from_args(retriever)
+        _, mmap_load_s = timed(load_mmap)
+
+    results = {
+        "nodes": len(nodes),
+        "embedding_api_calls_per_boot_before": embed_model.calls,
+        "boot_rebuild_s": round(rebuild_s, 3),
+        "boot_json_load_s": round(json_load_s, 3),
+        "boot_mmap_load_s": round(mmap_load_s, 4),
+        "engine_setup_per_request_ms_before": round(engine_per_request_s * 1000, 3),
+        "engine_setup_per_request_ms_after": 0.0,
+    }
+    print(f"Nós: {results['nodes']} | chamadas à API de embedding por boot (antes): {embed_model.calls}")
+    print(f"Boot antes (re-embeda data/):      {rebuild_s:8.3f} s")
+    print(f"Boot com índice JSON persistido:   {json_load_s:8.3f} s")
+    print(f"Boot depois (artefato mmap):       {mmap_load_s:8.4f} s")
+    print(f"Criação do engine por requisição (antes): {engine_per_request_s * 1000:.3f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Boot dos servidores: tempo e RSS por fase, prontidão (/healthz e /readyz) e pre-fork.
+
+Com o gunicorn em modo ``preload_app`` (ver ``gunicorn.conf.py`` na raiz), o
+módulo do servidor é importado e inicializado uma única vez no processo
+master; os workers nascem por fork e compartilham, por copy-on-write, as
+páginas do modelo de embedding e do índice. ``gunicorn.conf.py`` marca esse
+modo em ``CHATBOT_PREFORK`` e chama ``run_post_fork_hooks`` em cada worker,
+para o que não pode atravessar o fork (pools de threads do runtime).
+"""
+import gc
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+_post_fork_hooks = []
+
+
+def is_prefork():
+    """True quando o servidor está sendo carregado no master do gunicorn, antes do fork."""
+    return os.getenv("CHATBOT_PREFORK") == "1"
+
+
+def after_fork(hook):
+    """Registra ``hook`` para rodar em cada worker logo após o fork (ou já, se não houver fork)."""
+    if is_prefork():
+        _post_fork_hooks.append(hook)
+    else:
+        hook()
+
+
+def run_post_fork_hooks():
+    for hook in _post_fork_hooks:
+        hook()
+
+
+def freeze_for_fork():
+    """Move os objetos já criados para a geração permanente do GC, evitando que
+    as varreduras nos workers toquem (e copiem) as páginas herdadas do master."""
+    gc.collect()
+    gc.freeze()
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class BootTracker:
+    """Estado do boot: fases com duração e RSS, e se o serviço está pronto."""
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.state = "starting"
+        self.error = None
+        self.phases = []
+        self._started = time.perf_counter()
+        self.boot_seconds = None
+
+    @contextmanager
+    def phase(self, name):
+        start, rss_before = time.perf_counter(), rss_mb()
+        try:
+            yield
+        finally:
+            elapsed, rss_after = time.perf_counter() - start, rss_mb()
+            self.phases.append({
+                "phase": name,
+                "seconds": round(elapsed, 3),
+                "rss_mb": round(rss_after, 1),
+                "rss_delta_mb": round(rss_after - rss_before, 1),
+            })
+            self.logger.info(
+                f"Boot: fase '{name}' em {elapsed:.2f} s, RSS {rss_after:.0f} MB "
+                f"({rss_after - rss_before:+.0f} MB)"
+            )
+
+    def mark_ready(self):
+        self.state = "ready"
+        self.boot_seconds = round(time.perf_counter() - self._started, 3)
+        self.logger.info(f"Boot concluído em {self.boot_seconds:.2f} s, RSS {rss_mb():.0f} MB")
+
+    def mark_failed(self, error):
+        self.state = "failed"
+        self.error = str(error)
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def status(self):
+        return {
+            "status": self.state,
+            "pid": os.getpid(),
+            "boot_seconds": self.boot_seconds,
+            "rss_mb": round(rss_mb(), 1),
+            "phases": self.phases,
+            "error": self.error,
+        }
+
+
+def register_health_routes(app, tracker):
+    """/healthz: processo vivo (sempre 200). /readyz: 200 só quando o pipeline está pronto."""
+    from flask import jsonify
+
+    @app.route("/healthz", methods=["GET"])
+    def healthz():
+        return jsonify({"status": "ok", "pid": os.getpid()})
+
+    @app.route("/readyz", methods=["GET"])
+    def readyz():
+        return jsonify(tracker.status()), 200 if tracker.ready else 503
@@ -0,0 +1,395 @@
+"""Servidor único do chatbot, configurado por variáveis de ambiente.
+
+``CHATBOT_PROFILE`` escolhe os padrões de cada implantação (os antigos
+localchatbot.py, geminichatbot.py e geminichatbot_railway.py são só atalhos
+para estes perfis):
+
+    perfil    LLM_BACKENDS     embedding           índice
+    local     ollama           local (e5)          storage / storage_mmap
+    gemini    gemini,ollama    local (e5)          storage_gemini_llm / _mmap
+    railway   gemini           API do Gemini       storage_railway / _mmap
+
+Qualquer padrão pode ser trocado por variável de ambiente (LLM_BACKENDS,
+EMBEDDING_PROVIDER, PERSIST_DIR, MMAP_DIR, SIMILARITY_TOP_K, GEMINI_MODEL_NAME,
+OLLAMA_MODEL_NAME). O LLM é um RouterLLM (llm_router.py): prazo e circuit
+breaker por backend, fallback na ordem de LLM_BACKENDS e hedge opcional.
+
+Uso (a partir de core/):
+    CHATBOT_PROFILE=gemini python chatbot.py
+    CHATBOT_PROFILE=gemini LLM_BACKENDS=gemini,ollama LLM_HEDGE=1 gunicorn -c ../gunicorn.conf.py chatbot:app
+"""
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+from flask import Flask, jsonify, request
+from llama_index.core import Settings
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+
+# Permite importar os módulos de core/ também quando carregado como core.chatbot (Procfile)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from answer_cache import AnswerCache
+from batch_input import BatchInputError, answer_items, parse_batch_items
+from boot import BootTracker, after_fork, is_prefork, register_health_routes
+from index_lifecycle import create_rag_service, load_retriever
+from llm_router import LLM_BACKENDS, create_router
+from metrics import RequestIdFilter, register_metrics_routes
+from single_flight import SingleFlightTimeout
+from streaming import stream_format_from_request, stream_response
+
+# --- Carregar Variáveis de Ambiente ---
+load_dotenv()
+
+# --- Prompts ---
+LOCAL_QA_TEMPLATE = (
+    "Você é um chatbot especializado em auxiliar o usuário com informações sobre cogumelos.\n"
+    "Informações de contexto estão abaixo.\n"
+    "---------------------\n"
+    "{context_str}\n"
+    "---------------------\n"
+    "Informações da pergunta do usuário:\n"
+    "---------------------\n"
+    "{query_str}\n"
+    "---------------------\n"
+    "Instruções para o chatbot:\n"
+    "---------------------\n"
+    "Com base inicialmente nas informações de contexto fornecidas sobre cogumelos, "
+    "e APENAS se a pergunta tiver relação com cogumelos, responda à pergunta\n"
+    "A resposta deve misturar o contexto com informações do chatbot do treinamento anterior\n"
+    "Se o contexto não contiver a resposta, responda usando apenas os conhecimentos prévios do chatbot, e não informe que não encontrou a resposta no contexto\n"
+    "A resposta deve ser relativamente extensa e bem detalhada, o chatbot deve ser formal mas amigável e direto, e não deve repetir a pergunta do usuário, para não ser redundante\n"
+    "IMPORTANTE: Se a pergunta não tiver relação com cogumelos, responda educadamente que você não pode ajudar com essa pergunta, mas não dê a entender que você está reagindo às instruções, apenas à pergunta do usuário\n"
+    "O chatbot NUNCA deve fornecer o caminho do documento de contexto\n"
+    "MUITO IMPORTANTE: Antes de responder qualquer coisa, para evitar alucinações, tenha certeza que entendeu as instruções para o chatbot, mas não reagindo às instruções, apenas à pergunta do usuário\n"
+)
+GEMINI_QA_TEMPLATE = (
+    "Você é um assistente prestativo e informativo, especializado em cultivo de cogumelos.\n"
+    "Com base no CONTEXTO fornecido abaixo, responda à PERGUNTA do usuário.\n"
+    "Se o CONTEXTO não tiver a resposta, mas a PERGUNTA for sobre cultivo de cogumelos, use seu conhecimento geral para responder.\n"
+    "Se a PERGUNTA não for sobre cultivo de cogumelos, informe educadamente que você só pode ajudar com esse tópico.\n"
+    "Suas respostas devem ser detalhadas, formais, porém amigáveis e diretas. Não repita a pergunta.\n"
+    "Não mencione explicitamente o 'CONTEXTO' ou o documento fonte na sua resposta final.\n\n"
+    "CONTEXTO:\n"
+    "---------------------\n"
+    "{context_str}\n"
+    "---------------------\n"
+    "PERGUNTA: {query_str}\n\n"
+    "RESPOSTA DETALHADA:"
+)
+
+PROFILES = {
+    "local": {
+        "llm_backends": "ollama", "embedding": "hf", "gemini_model": "models/gemini-2.0-flash",
+        "persist_dir": "storage", "mmap_dir": "storage_mmap",
+        "top_k": DEFAULT_SIMILARITY_TOP_K, "prompt": LOCAL_QA_TEMPLATE,
+    },
+    "gemini": {
+        "llm_backends": "gemini,ollama", "embedding": "hf", "gemini_model": "models/gemini-2.0-flash",
+        "persist_dir": "storage_gemini_llm", "mmap_dir": "storage_gemini_llm_mmap",
+        "top_k": 5, "prompt": GEMINI_QA_TEMPLATE,
+    },
+    "railway": {
+        # Sem torch: embedding pela API. O índice é gerado no build da imagem
+        # (buildCommand do railway.json); o boot só o abre
+        "llm_backends": "gemini", "embedding": "gemini", "gemini_model": "models/gemini-1.5-flash",
+        "persist_dir": "storage_railway", "mmap_dir": "storage_railway_mmap",
+        "top_k": 3, "prompt": GEMINI_QA_TEMPLATE,
+    },
+}
+
+# --- Configurações ---
+CHATBOT_PROFILE = os.getenv("CHATBOT_PROFILE", "gemini")
+if CHATBOT_PROFILE not in PROFILES:
+    raise ValueError(f"CHATBOT_PROFILE inválido: '{CHATBOT_PROFILE}' (use {', '.join(PROFILES)})")
+PROFILE = PROFILES[CHATBOT_PROFILE]
+
+LLM_BACKEND_NAMES = [
+    name.strip() for name in (LLM_BACKENDS or PROFILE["llm_backends"]).split(",") if name.strip()
+]
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", PROFILE["gemini_model"])
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Endpoint alternativo da API (nos benchmarks, o stub_llm_server.py, via transporte REST)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE")
+# O gRPC não suporta fork: no master do gunicorn (preload) os clientes do Gemini usam REST
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT", "rest" if is_prefork() else "")
+OLLAMA_MODEL_NAME = os.getenv("OLLAMA_MODEL_NAME", "llama3.2:3b")
+# Servidor do Ollama (nos benchmarks, o stub_llm_server.py)
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Chave secreta para autenticação básica da API
+CHATBOT_API_SHARED_SECRET = os.getenv("CHATBOT_API_SHARED_SECRET")
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", PROFILE["embedding"])
+EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large"
+GEMINI_EMBEDDING_MODEL_NAME = "models/embedding-001"
+
+# Caminhos a partir da raiz do repositório, qualquer que seja o diretório de execução
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERSIST_DIR = os.getenv("PERSIST_DIR", os.path.join(BASE_DIR, PROFILE["persist_dir"]))
+# Índice em formato binário (gerado por convert_storage.py / reindex.py); tem prioridade sobre o PERSIST_DIR
+MMAP_DIR = os.getenv("MMAP_DIR", os.path.join(BASE_DIR, PROFILE["mmap_dir"]))
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", str(PROFILE["top_k"])))
+QA_TEMPLATE_STR = PROFILE["prompt"]
+
+# Cache de respostas (nível exato + nível semântico pelo embedding da pergunta)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "86400"))
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("CACHE_SIMILARITY_THRESHOLD", "0.95"))
+
+# Endpoint /ask/batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))  # chamadas simultâneas ao LLM
+
+
+# --- Inicialização do Flask ---
+app = Flask(__name__)
+
+# --- Logging ---
+logging.basicConfig(level=logging.INFO)
+app.logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+handler.setFormatter(formatter)
+# ID da requisição (header X-Request-ID ou gerado) em todas as linhas de log
+handler.addFilter(RequestIdFilter())
+app.logger.addHandler(handler)
+app.logger.info(
+    f"Iniciando configuração da API do Chatbot (perfil '{CHATBOT_PROFILE}', "
+    f"LLM {' -> '.join(LLM_BACKEND_NAMES)}, embedding {EMBEDDING_PROVIDER})..."
+)
+if CHATBOT_API_SHARED_SECRET:
+    app.logger.info("Verificação de chave secreta da API está ATIVADA.")
+else:
+    app.logger.warning("AVISO: Verificação de chave secreta da API está DESATIVADA (CHATBOT_API_SHARED_SECRET não definida).")
+
+# --- Variáveis Globais para LlamaIndex (inicializadas uma vez) ---
+query_engine = None
+rag_service = None
+llm_router = None
+answer_cache = AnswerCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    similarity_threshold=CACHE_SIMILARITY_THRESHOLD,
+)
+# Fases do boot (tempo/RSS) e prontidão para /healthz e /readyz
+boot = BootTracker(app.logger)
+register_health_routes(app, boot)
+# Latência por etapa, tokens e contadores em /metrics (formato Prometheus)
+register_metrics_routes(app)
+
+
+def create_embedding():
+    if EMBEDDING_PROVIDER == "gemini":
+        # Via API; este caminho não usa torch
+        from llama_index.embeddings.gemini import GeminiEmbedding
+
+        gemini_client = {"transport": GEMINI_TRANSPORT} if GEMINI_TRANSPORT else {}
+        if GEMINI_API_BASE:
+            gemini_client = {"api_base": GEMINI_API_BASE, "transport": "rest"}
+        app.logger.info(f"Configurando embedding via Gemini API: {GEMINI_EMBEDDING_MODEL_NAME}")
+        return GeminiEmbedding(model_name=GEMINI_EMBEDDING_MODEL_NAME, api_key=GEMINI_API_KEY, **gemini_client)
+
+    from fast_embedding import create_embed_model, embedding_device
+
+    # torch só é importado se o backend precisar dele
+    device = embedding_device()
+    app.logger.info(f"Configurando embedding model local: {EMBEDDING_MODEL_NAME} ({device})")
+    # Backend conforme EMBEDDING_BACKEND (torch fp32, int8 ou ONNX), já aquecido
+    return create_embed_model(EMBEDDING_MODEL_NAME, device, app.logger)
+
+
+def reconnect_clients():
+    """Recria, no worker, os clientes de rede (Gemini, Ollama) criados no master antes do fork."""
+    llm_router.reconnect()
+    if EMBEDDING_PROVIDER == "gemini":
+        try:
+            Settings.embed_model = rag_service.embed_model = create_embedding()
+        except Exception as e:
+            app.logger.error(f"Falha ao recriar o embedding do Gemini no worker: {e}", exc_info=True)
+    app.logger.info(f"Clientes de LLM/embedding recriados no worker (pid {os.getpid()}).")
+
+
+def initialize_rag_pipeline():
+    global query_engine, rag_service, llm_router
+
+    if rag_service is not None:
+        return True  # já inicializado (ex.: no master do gunicorn, antes do fork)
+
+    app.logger.info("Configurando modelos LlamaIndex...")
+    try:
+        if EMBEDDING_PROVIDER == "gemini" and not GEMINI_API_KEY:
+            raise ValueError("GEMINI_API_KEY não encontrada (necessária para o embedding do Gemini)")
+
+        with boot.phase("embedding"):
+            Settings.embed_model = create_embedding()
+            app.logger.info("Embedding model configurado.")
+
+        with boot.phase("llm"):
+            llm_router = create_router(
+                LLM_BACKEND_NAMES, app.logger,
+                gemini_model=GEMINI_MODEL_NAME, gemini_api_key=GEMINI_API_KEY, gemini_api_base=GEMINI_API_BASE,
+                gemini_transport=GEMINI_TRANSPORT,
+                ollama_model=OLLAMA_MODEL_NAME, ollama_base_url=OLLAMA_BASE_URL,
+            )
+            Settings.llm = llm_router
+
+        # Não cria o índice aqui; ele é gerado por reindex.py (MMAP_DIR) ou já existe em PERSIST_DIR.
+        # Sem índice o boot falha e o /readyz devolve 503 com o motivo
+        with boot.phase("índice"):
+            retriever, index_dir = load_retriever(MMAP_DIR, PERSIST_DIR, SIMILARITY_TOP_K, app.logger)
+
+        with boot.phase("query engine"):
+            rag_service = create_rag_service(
+                retriever, QA_TEMPLATE_STR, index_dir, app.logger, cache=answer_cache
+            )
+        query_engine = rag_service.query_engine
+        if is_prefork():
+            after_fork(reconnect_clients)
+        boot.mark_ready()
+        return True
+
+    except Exception as e:
+        app.logger.error(f"Erro durante inicialização do LlamaIndex: {e}", exc_info=True)
+        boot.mark_failed(e)
+        return False
+
+
+# --- Verificação de Chave Secreta Compartilhada ---
+def check_api_key():
+    """Retorna a resposta 401 se a chave for inválida, ou None se o acesso for permitido."""
+    if CHATBOT_API_SHARED_SECRET:
+        client_api_key = request.headers.get('X-API-Key')
+        if not client_api_key or client_api_key != CHATBOT_API_SHARED_SECRET:
+            app.logger.warning(
+                f"Tentativa de acesso não autorizada ao endpoint {request.path}. Chave fornecida: '{client_api_key}'"
+            )
+            return jsonify({"error": "Acesso não autorizado. Chave de API inválida ou ausente."}), 401
+    return None
+
+
+def get_question():
+    """Valida o serviço e o JSON da requisição. Retorna (pergunta, None) ou (None, resposta de erro)."""
+    if query_engine is None:
+        app.logger.error("Query engine não inicializado.")
+        return None, (jsonify({"error": "Serviço de chatbot não está pronto"}), 503)
+
+    data = request.get_json(silent=True)
+    if not data or "question" not in data:
+        app.logger.warning("Requisição recebida sem JSON ou chave 'question'")
+        return None, (jsonify({"error": "JSON inválido ou chave 'question' ausente"}), 400)
+
+    user_query = data["question"]
+    app.logger.info(f"Pergunta recebida: {user_query}")
+
+    if not isinstance(user_query, str) or not user_query.strip():
+        app.logger.warning("Pergunta recebida está vazia.")
+        return None, (jsonify({"error": "Pergunta não pode ser vazia"}), 400)
+    return user_query, None
+
+
+# --- Endpoints da API ---
+@app.route("/ask", methods=["POST"])
+def ask_chatbot():
+    unauthorized = check_api_key()
+    if unauthorized:
+        return unauthorized
+
+    user_query, error = get_question()
+    if error:
+        return error
+
+    try:
+        answer = rag_service.answer(user_query)
+        app.logger.info(f"Resposta gerada (início): {answer[:100]}...")
+        return jsonify({"answer": answer})
+
+    except SingleFlightTimeout as e:
+        app.logger.warning(f"Tempo esgotado esperando pergunta igual em andamento: {e}")
+        return jsonify({"error": "Tempo esgotado ao processar a pergunta"}), 504
+    except Exception as e:
+        app.logger.error(f"Erro ao processar a query '{user_query}': {e}", exc_info=True)
+        return jsonify({"error": "Erro interno ao processar a pergunta"}), 500
+
+
+@app.route("/ask/stream", methods=["POST"])
+def ask_chatbot_stream():
+    """Mesma entrada do /ask, mas envia os tokens via SSE (ou JSON lines com ?format=ndjson)."""
+    unauthorized = check_api_key()
+    if unauthorized:
+        return unauthorized
+
+    user_query, error = get_question()
+    if error:
+        return error
+
+    return stream_response(
+        rag_service.stream(user_query),
+        stream_format_from_request(request),
+        app.logger,
+        "Erro interno ao processar a pergunta",
+    )
+
+
+@app.route("/ask/batch", methods=["POST"])
+def ask_chatbot_batch():
+    """Várias perguntas numa requisição (JSON ou JSONL); respostas na mesma ordem, com erro por item."""
+    unauthorized = check_api_key()
+    if unauthorized:
+        return unauthorized
+
+    if query_engine is None:
+        app.logger.error("Query engine não inicializado.")
+        return jsonify({"error": "Serviço de chatbot não está pronto"}), 503
+
+    try:
+        items = parse_batch_items(request, BATCH_MAX_ITEMS)
+    except BatchInputError as e:
+        app.logger.warning(f"Lote inválido: {e}")
+        return jsonify({"error": str(e)}), 400
+
+    app.logger.info(f"Lote recebido: {len(items)} perguntas.")
+    try:
+        results = answer_items(rag_service, items, BATCH_MAX_CONCURRENCY)
+    except Exception as e:
+        app.logger.error(f"Erro ao processar o lote: {e}", exc_info=True)
+        return jsonify({"error": "Erro interno ao processar o lote"}), 500
+    return jsonify({"results": results})
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    unauthorized = check_api_key()
+    if unauthorized:
+        return unauthorized
+    return jsonify(answer_cache.stats())
+
+
+@app.route("/llm/stats", methods=["GET"])
+def llm_stats():
+    """Estado dos breakers e latências recentes de cada backend de LLM."""
+    unauthorized = check_api_key()
+    if unauthorized:
+        return unauthorized
+    if llm_router is None:
+        return jsonify({"error": "Serviço de chatbot não está pronto"}), 503
+    return jsonify(llm_router.stats())
+
+
+def main():
+    if initialize_rag_pipeline():
+        port = int(os.getenv("PORT", "5001"))
+        app.logger.info(f"Inicialização do RAG completa. Iniciando servidor Flask na porta {port}...")
+        # debug=False evita inicialização dupla; porta 5001 para não conflitar com o Django (8000)
+        app.run(host="0.0.0.0", port=port, debug=False)
+    else:
+        app.logger.error("Falha ao inicializar o pipeline RAG. Servidor Flask não iniciado.")
+
+
+# --- Inicialização e Execução ---
+if __name__ == "__main__":
+    main()
+else:
+    # Carregado pelo gunicorn: com preload (gunicorn.conf.py) roda uma vez no master, antes do fork
+    if not initialize_rag_pipeline():
+        app.logger.error("Falha ao inicializar o pipeline RAG.")
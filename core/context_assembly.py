@@ -0,0 +1,215 @@
+"""Montagem do contexto entre a recuperação e o ``text_qa_template``.
+
+Opcional (``CONTEXT_ASSEMBLY=1``): roda como node postprocessor dos query
+engines (index_lifecycle.py). Etapas:
+    1. corta a cauda: nós com score < CONTEXT_MIN_SCORE_RATIO x score do primeiro
+       (sempre fica ao menos um nó);
+    2. remove duplicatas: nó cujo texto já está contido no de outro nó mais bem pontuado;
+    3. junta os nós da mesma página num só, sem repetir a sobreposição do splitter
+       nem o cabeçalho de metadados;
+    4. empacota por score até CONTEXT_TOKEN_BUDGET tokens de contexto. O primeiro
+       nó que não cabe inteiro é cortado no fim de uma frase, se sobrarem ao
+       menos CONTEXT_MIN_PARTIAL_TOKENS; os seguintes são descartados.
+
+Metadados listados em CONTEXT_DROP_METADATA (por padrão o ``file_path``, que o
+prompt já proíbe citar) deixam de ir para o LLM.
+
+Tokens contados com o tokenizer do LlamaIndex (tiktoken por padrão): é uma
+aproximação para Gemini e Llama, mas estável para comparar antes x depois.
+Cada pergunta gera uma linha de log com os tokens do prompt antes e depois;
+os mesmos números vão para ``chatbot_context_tokens`` no /metrics.
+"""
+import logging
+import os
+import re
+from typing import List, Optional
+
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+from pydantic import Field, PrivateAttr
+
+import metrics
+
+# Desligada por padrão: muda o contexto que vai ao LLM, e ainda falta uma avaliação de qualidade que a justifique
+CONTEXT_ASSEMBLY = os.getenv("CONTEXT_ASSEMBLY", "0") == "1"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_MIN_SCORE_RATIO = float(os.getenv("CONTEXT_MIN_SCORE_RATIO", "0.85"))
+CONTEXT_MIN_PARTIAL_TOKENS = int(os.getenv("CONTEXT_MIN_PARTIAL_TOKENS", "120"))
+CONTEXT_DROP_METADATA = [
+    key.strip() for key in os.getenv("CONTEXT_DROP_METADATA", "file_path").split(",") if key.strip()
+]
+
+_SPACES = re.compile(r"\s+")
+_SENTENCE_END = re.compile(r"[.!?;:](?=\s)|\n")
+
+
+def _normalize(text):
+    return _SPACES.sub(" ", text).strip().casefold()
+
+
+def _overlap(left, right):
+    """Tamanho do maior sufixo de ``left`` que é prefixo de ``right``."""
+    for size in range(min(len(left), len(right)), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _join(left, right):
+    """Concatena dois trechos da mesma página sem repetir a sobreposição."""
+    a, b = left.node, right.node
+    a_end, b_start = a.end_char_idx, b.start_char_idx
+    if a_end is not None and b_start is not None and b_start <= a_end:
+        size = a_end - b_start
+        if b.text[:size] and a.text.endswith(b.text[:size]):
+            return a.text + b.text[size:]
+    size = _overlap(a.text, b.text)
+    if size >= 20:
+        return a.text + b.text[size:]
+    return a.text + "\n\n" + b.text
+
+
+class ContextAssembler(BaseNodePostprocessor):
+    token_budget: int = Field(default=CONTEXT_TOKEN_BUDGET)
+    min_score_ratio: float = Field(default=CONTEXT_MIN_SCORE_RATIO)
+    min_partial_tokens: int = Field(default=CONTEXT_MIN_PARTIAL_TOKENS)
+    drop_metadata: List[str] = Field(default_factory=lambda: list(CONTEXT_DROP_METADATA))
+    # Tokens fixos do prompt (template + instruções), só para o log
+    prompt_tokens: int = Field(default=0)
+
+    _tokenizer = PrivateAttr()
+    _logger = PrivateAttr()
+
+    def __init__(self, qa_prompt_tmpl_str=None, logger=None, **kwargs):
+        super().__init__(**kwargs)
+        self._tokenizer = get_tokenizer()
+        self._logger = logger or logging.getLogger(__name__)
+        if qa_prompt_tmpl_str:
+            self.prompt_tokens = self.count_tokens(qa_prompt_tmpl_str.format(context_str="", query_str=""))
+
+    @classmethod
+    def class_name(cls):
+        return "ContextAssembler"
+
+    @property
+    def config(self):
+        """Parâmetros que mudam o contexto enviado ao LLM (entram na versão do cache)."""
+        return (self.token_budget, self.min_score_ratio, self.min_partial_tokens, tuple(self.drop_metadata))
+
+    def count_tokens(self, text):
+        return len(self._tokenizer(text))
+
+    def _content(self, node_with_score):
+        return node_with_score.node.get_content(metadata_mode=MetadataMode.LLM)
+
+    def context_tokens(self, nodes):
+        return sum(self.count_tokens(self._content(n)) for n in nodes)
+
+    def _cut_tail(self, nodes):
+        top = nodes[0].score
+        if not self.min_score_ratio or top is None or top <= 0:
+            return nodes
+        threshold = top * self.min_score_ratio
+        return [nodes[0]] + [n for n in nodes[1:] if n.score is None or n.score >= threshold]
+
+    def _dedupe(self, nodes):
+        kept, texts = [], []
+        for n in nodes:
+            text = _normalize(n.node.get_content())
+            if any(text in other for other in texts):
+                continue
+            kept.append(n)
+            texts.append(text)
+        return kept
+
+    def _merge_pages(self, nodes):
+        """Um nó por página, na posição do nó mais bem pontuado da página."""
+        groups = {}
+        for n in nodes:
+            metadata = n.node.metadata
+            page = metadata.get("page_label")
+            key = (n.node.ref_doc_id or metadata.get("file_name"), page) if page is not None else n.node.node_id
+            groups.setdefault(key, []).append(n)
+
+        merged = []
+        for group in groups.values():
+            score = max((n.score for n in group if n.score is not None), default=None)
+            group.sort(key=lambda n: n.node.start_char_idx if n.node.start_char_idx is not None else 0)
+            current = group[0]
+            for n in group[1:]:
+                node = current.node.model_copy(update={"text": _join(current, n), "end_char_idx": n.node.end_char_idx})
+                current = NodeWithScore(node=node, score=score)
+            merged.append(NodeWithScore(node=current.node, score=score))
+        return merged
+
+    def _strip_metadata(self, n):
+        excluded = list(n.node.excluded_llm_metadata_keys)
+        missing = [key for key in self.drop_metadata if key in n.node.metadata and key not in excluded]
+        if not missing:
+            return n
+        node = n.node.model_copy(update={"excluded_llm_metadata_keys": excluded + missing})
+        return NodeWithScore(node=node, score=n.score)
+
+    def _truncate(self, n, budget):
+        """Corta o texto do nó no último fim de frase que cabe em ``budget`` tokens."""
+        header = self.count_tokens(self._content(n)) - self.count_tokens(n.node.get_content())
+        text = n.node.get_content()
+        limit = budget - header
+        while limit > 0 and text:
+            ends = [m.end() for m in _SENTENCE_END.finditer(text)]
+            tokens = self.count_tokens(text)
+            if tokens <= limit:
+                break
+            # Estimativa por caracteres/token, depois recua até um fim de frase
+            cut = int(len(text) * limit / tokens)
+            cut = max((e for e in ends if e <= cut), default=0)
+            text = text[:cut].rstrip()
+        if not text or limit <= 0:
+            return None
+        node = n.node.model_copy(update={"text": text})
+        return NodeWithScore(node=node, score=n.score)
+
+    def _pack(self, nodes):
+        packed, used = [], 0
+        for n in nodes:
+            tokens = self.count_tokens(self._content(n))
+            if used + tokens <= self.token_budget:
+                packed.append(n)
+                used += tokens
+                continue
+            remaining = self.token_budget - used
+            if remaining >= self.min_partial_tokens:
+                partial = self._truncate(n, remaining)
+                if partial is not None:
+                    packed.append(partial)
+            break
+        if not packed and nodes:
+            # Orçamento menor que o primeiro nó: manda o melhor nó cortado
+            partial = self._truncate(nodes[0], self.token_budget)
+            packed = [partial or nodes[0]]
+        return packed
+
+    def assemble(self, nodes):
+        if not nodes:
+            return nodes
+        nodes = sorted(nodes, key=lambda n: n.score if n.score is not None else float("-inf"), reverse=True)
+        nodes = self._cut_tail(nodes)
+        nodes = self._dedupe(nodes)
+        nodes = self._merge_pages(nodes)
+        nodes = [self._strip_metadata(n) for n in nodes]
+        return self._pack(nodes)
+
+    def _postprocess_nodes(self, nodes, query_bundle: Optional[QueryBundle] = None):
+        with metrics.stage("context"):
+            before = self.context_tokens(nodes)
+            assembled = self.assemble(nodes)
+            after = self.context_tokens(assembled)
+        metrics.observe_context(before, after)
+        query_tokens = self.count_tokens(query_bundle.query_str) if query_bundle is not None else 0
+        fixed = self.prompt_tokens + query_tokens
+        self._logger.info(
+            f"Contexto: {len(nodes)} -> {len(assembled)} nós, "
+            f"tokens do prompt {fixed + before} -> {fixed + after} (orçamento de contexto {self.token_budget})."
+        )
+        return assembled
@@ -0,0 +1,135 @@
+"""Converte um diretório persistido pelo LlamaIndex (JSON) para o formato mmap.
+
+Uso (a partir de core/):
+    python convert_storage.py ../storage ../storage_mmap
+    python convert_storage.py ../storage_gemini_llm ../storage_gemini_llm_mmap --dtype float16
+    python convert_storage.py ../storage_railway ../storage_railway_mmap --quantization int8
+
+Se o diretório de origem não tiver o ``default__vector_store.json`` (os
+embeddings), use ``--embed-missing`` para recalcular os vetores com o mesmo
+modelo de embedding usado pelos servidores.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from llama_index.core.schema import MetadataMode
+from llama_index.core.storage.docstore.utils import json_to_doc
+
+from embedding_cache import EMBEDDING_CACHE_PATH, CachedEmbedding, EmbeddingCache
+from mmap_store import SUPPORTED_DTYPES, write_store
+from quantization import QUANTIZATION_KINDS
+
+EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large"
+DOCSTORE_FILE = "docstore.json"
+VECTOR_STORE_FILE = "default__vector_store.json"
+
+logger = logging.getLogger("convert_storage")
+
+
+def load_json_storage(persist_dir):
+    """Lê nós e embeddings diretamente dos JSONs, sem montar o índice."""
+    with open(os.path.join(persist_dir, DOCSTORE_FILE), encoding="utf-8") as f:
+        docstore = json.load(f)
+    nodes = {
+        node_id: json_to_doc(node_json)
+        for node_id, node_json in docstore["docstore/data"].items()
+    }
+
+    embedding_dict = {}
+    vector_store_path = os.path.join(persist_dir, VECTOR_STORE_FILE)
+    if os.path.exists(vector_store_path):
+        with open(vector_store_path, encoding="utf-8") as f:
+            embedding_dict = json.load(f).get("embedding_dict", {})
+    return nodes, embedding_dict
+
+
+def load_hf_embedding(model_name, batch_size):
+    """Mesmo modelo de embedding local dos servidores (torch só é importado aqui)."""
+    import torch
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    logger.info(f"Carregando {model_name} ({device})...")
+    return HuggingFaceEmbedding(
+        model_name=model_name, device=device, embed_batch_size=batch_size
+    )
+
+
+def embed_nodes(nodes, model_name, batch_size, cache=None):
+    embed_model = load_hf_embedding(model_name, batch_size)
+    if cache is not None:
+        embed_model = CachedEmbedding(embed_model, cache, model_name=model_name)
+    logger.info(f"Calculando embeddings com {model_name} para {len(nodes)} nós...")
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    return embed_model.get_text_embedding_batch(texts, show_progress=True)
+
+
+def convert(persist_dir, out_dir, dtype="float32", embed_missing=False,
+            model_name=EMBEDDING_MODEL_NAME, batch_size=32, cache=None, quantization=None):
+    logger.info(f"Lendo índice JSON de '{persist_dir}'...")
+    nodes, embedding_dict = load_json_storage(persist_dir)
+
+    if embedding_dict:
+        # Mantém a ordem do vector store; nós sem vetor não são recuperáveis mesmo.
+        node_ids = [node_id for node_id in embedding_dict if node_id in nodes]
+        ordered_nodes = [nodes[node_id] for node_id in node_ids]
+        embeddings = [embedding_dict[node_id] for node_id in node_ids]
+    elif embed_missing:
+        ordered_nodes = list(nodes.values())
+        embeddings = embed_nodes(ordered_nodes, model_name, batch_size, cache)
+    else:
+        raise FileNotFoundError(
+            f"'{VECTOR_STORE_FILE}' ausente ou vazio em '{persist_dir}'. "
+            "Use --embed-missing para recalcular os embeddings."
+        )
+
+    manifest = write_store(
+        out_dir,
+        ordered_nodes,
+        embeddings,
+        dtype=dtype,
+        extra_manifest={"source": os.path.abspath(persist_dir)},
+        quantization=quantization,
+    )
+    logger.info(
+        f"Índice convertido: {manifest['count']} nós, dim {manifest['dim']}, "
+        f"{manifest['dtype']} -> '{out_dir}'."
+    )
+    if quantization:
+        logger.info(f"Códigos {quantization}: {manifest['quantization']['bytes_per_vector']} bytes/vetor.")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("persist_dir", help="Diretório JSON (ex.: ../storage_gemini_llm)")
+    parser.add_argument("out_dir", help="Diretório de saída (ex.: ../storage_gemini_llm_mmap)")
+    parser.add_argument("--dtype", choices=SUPPORTED_DTYPES, default="float32")
+    parser.add_argument("--quantization", choices=("none",) + QUANTIZATION_KINDS, default="none",
+                        help="Grava também códigos int8/binários para a busca quantizada")
+    parser.add_argument("--embed-missing", action="store_true",
+                        help="Recalcula embeddings se o vector store não existir")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--cache-path", default=EMBEDDING_CACHE_PATH,
+                        help="Cache persistente de embeddings usado com --embed-missing")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    cache = None if args.no_cache or not args.embed_missing else EmbeddingCache(args.cache_path)
+    try:
+        convert(args.persist_dir, args.out_dir, args.dtype, args.embed_missing,
+                args.model, args.batch_size, cache,
+                None if args.quantization == "none" else args.quantization)
+    except Exception as e:
+        logger.error(f"Falha na conversão: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""Top-k da busca quantizada (quantization.py) x busca exata, e memória por vetor.
+
+Para cada tipo de código (int8, binary) grava um índice mmap temporário com os
+vetores do índice, abre o QuantizedRetriever e confere, para cada consulta, se
+os ``--top-k`` nós (ids e ordem) são os mesmos da busca exata do
+NumpyRetriever. Sai com código 1 se algum top-k divergir.
+
+Com poucos nós e ``--candidates`` alto, a paridade é quase garantida (100
+candidatos de 288 nós é um terço do índice). Por isso há também a varredura
+de recall: um corpus de ``--recall-rows`` vetores, formado pelos vetores do
+índice repetidos com ruído (muitos vizinhos próximos por consulta, como
+chunks sobrepostos e manuais parecidos), e para cada tipo de código o
+recall@k e a latência com ``--sweep-candidates`` candidatos (10, 20, 30),
+ao lado da busca exata.
+
+Consultas: as perguntas de retrieval_eval.jsonl e cada vetor do índice com
+ruído (como em bench_retriever.py). Vetores (``--vectors``):
+    index  -> embeddings gravados no índice (mmap ou default__vector_store.json);
+    model  -> recalcula com o modelo de embedding (fast_embedding.py);
+    hashed -> sem modelo: termos de cada nó (lexical_index.analyze) com peso
+              TF-IDF, projetados em ``--dim`` dimensões por uma matriz
+              gaussiana fixa. Serve só para a verificação offline;
+    auto   -> index se houver embeddings, senão hashed.
+
+Memória: bytes por vetor de cada formato (inclusive a lista de floats do
+SimpleVectorStore) e, com ``--memory-rows``, o RSS que a busca deixa
+residente num índice sintético desse tamanho.
+
+Uso (a partir de core/):
+    python eval_quantization.py --persist-dir ../storage_gemini_llm --top-k 5
+    python eval_quantization.py --mmap-dir ../storage_gemini_llm_mmap --vectors index --memory-rows 200000
+"""
+import argparse
+import gc
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+from llama_index.core.schema import MetadataMode, TextNode
+
+from boot import rss_mb
+from convert_storage import VECTOR_STORE_FILE
+from eval_retrieval import EMBEDDING_MODEL_NAME, load_labels, load_nodes
+from lexical_index import analyze
+from mmap_store import MmapNodeStore, normalize_rows, write_store
+from numpy_retriever import NumpyRetriever
+from quantization import QUANT_RESCORE_CANDIDATES, QUANTIZATION_KINDS, QuantizedRetriever
+
+VECTOR_SOURCES = ("auto", "index", "model", "hashed")
+
+
+def index_vectors(mmap_dir, persist_dir, node_ids):
+    """Embeddings gravados, na ordem de ``load_nodes``, ou None."""
+    if MmapNodeStore.exists(mmap_dir):
+        return np.asarray(MmapNodeStore.open(mmap_dir).embeddings, dtype=np.float32)
+    path = os.path.join(persist_dir, VECTOR_STORE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        embedding_dict = json.load(f).get("embedding_dict", {})
+    if not embedding_dict or any(node_id not in embedding_dict for node_id in node_ids):
+        return None
+    return np.asarray([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32)
+
+
+def model_vectors(nodes, questions, backend, logger):
+    from fast_embedding import create_embed_model
+
+    embed_model = create_embed_model(EMBEDDING_MODEL_NAME, "cpu", logger, backend=backend, warmup_runs=0)
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    matrix = np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32)
+    queries = np.asarray([embed_model.get_query_embedding(q) for q in questions], dtype=np.float32)
+    return matrix, queries
+
+
+def hashed_vectors(nodes, questions, dim, seed):
+    """Vetores determinísticos a partir dos termos: TF-IDF projetado por uma gaussiana fixa."""
+    texts = [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes]
+    counts = [Counter(analyze(text)) for text in texts]
+    df = Counter(term for c in counts for term in c)
+    idf = {term: math.log((1 + len(counts)) / (1 + n)) + 1 for term, n in df.items()}
+    projection = {}
+
+    def embed(terms):
+        vector = np.zeros(dim, dtype=np.float32)
+        for term, tf in terms.items():
+            if term not in idf:
+                continue
+            if term not in projection:
+                rng = np.random.default_rng([seed, zlib.crc32(term.encode("utf-8"))])
+                projection[term] = rng.standard_normal(dim).astype(np.float32)
+            vector += (1 + math.log(tf)) * idf[term] * projection[term]
+        return vector
+
+    matrix = np.stack([embed(c) for c in counts])
+    queries = np.stack([embed(Counter(analyze(q))) for q in questions])
+    return matrix, queries
+
+
+def python_list_bytes(dim):
+    """Bytes de um vetor como lista de floats do Python (SimpleVectorStore carregado do JSON)."""
+    vector = [float(i) + 0.5 for i in range(dim)]
+    return sys.getsizeof(vector) + sum(sys.getsizeof(x) for x in vector)
+
+
+def check_parity(matrix, nodes, queries, top_k, candidates, kinds, out_dir):
+    """Top-k de cada tipo de código x busca exata, sobre índices mmap gravados em ``out_dir``."""
+    exact_dir = os.path.join(out_dir, "exact")
+    write_store(exact_dir, nodes, matrix, lexical=False)
+    exact = NumpyRetriever.from_store(MmapNodeStore.open(exact_dir), similarity_top_k=top_k)
+    expected, _ = exact.top_k(queries, top_k)
+
+    report = {}
+    for kind in kinds:
+        store_dir = os.path.join(out_dir, kind)
+        write_store(store_dir, nodes, matrix, lexical=False, quantization=kind)
+        retriever = QuantizedRetriever.from_store(MmapNodeStore.open(store_dir), similarity_top_k=top_k,
+                                                  candidates=candidates)
+        start = time.perf_counter()
+        got, _ = retriever.top_k(queries, top_k)
+        seconds = time.perf_counter() - start
+        # Só a varredura grosseira, sem o re-ranqueamento exato
+        coarse = retriever.codes.score(normalize_rows(queries))
+        coarse_top = np.argsort(-coarse, axis=1, kind="stable")[:, :top_k]
+        report[kind] = {
+            **retriever.memory_stats(),
+            "queries": len(queries),
+            "same_top_k": int(np.sum(np.all(got == expected, axis=1))),
+            "same_top_k_set": int(sum(set(g) == set(e) for g, e in zip(got, expected))),
+            "same_top_k_coarse_only": int(np.sum(np.all(coarse_top == expected, axis=1))),
+            "search_ms_per_query": round(seconds / len(queries) * 1000, 3),
+        }
+    return report
+
+
+def recall_sweep(matrix, queries, top_k, candidate_counts, kinds, rows, noise, out_dir, seed):
+    """Recall@k e latência por nº de candidatos, num corpus de ``rows`` vetores derivado de ``matrix``."""
+    rng = np.random.default_rng(seed)
+    base = normalize_rows(matrix)
+    dim = base.shape[1]
+    # Ruído com norma ~``noise`` em vetores unitários: cada nó vira um grupo de vizinhos próximos
+    corpus = base[rng.integers(0, len(base), size=rows)]
+    corpus += rng.normal(scale=noise / math.sqrt(dim), size=corpus.shape).astype(np.float32)
+    nodes = [TextNode(text="", id_=str(i)) for i in range(rows)]
+    for kind in ("exact",) + tuple(kinds):
+        write_store(os.path.join(out_dir, f"recall-{kind}"), nodes, corpus, lexical=False,
+                    quantization=None if kind == "exact" else kind)
+    del corpus, nodes
+
+    exact = NumpyRetriever.from_store(MmapNodeStore.open(os.path.join(out_dir, "recall-exact")),
+                                      similarity_top_k=top_k)
+    start = time.perf_counter()
+    expected, _ = exact.top_k(queries, top_k)
+    report = {"exact": {"search_ms_per_query": round((time.perf_counter() - start) / len(queries) * 1000, 3)}}
+    for kind in kinds:
+        store = MmapNodeStore.open(os.path.join(out_dir, f"recall-{kind}"))
+        report[kind] = {}
+        for candidates in candidate_counts:
+            retriever = QuantizedRetriever.from_store(store, similarity_top_k=top_k, candidates=candidates)
+            start = time.perf_counter()
+            got, _ = retriever.top_k(queries, top_k)
+            seconds = time.perf_counter() - start
+            hits = sum(len(set(g) & set(e)) for g, e in zip(got, expected))
+            report[kind][candidates] = {
+                "recall": round(hits / expected.size, 4),
+                "same_top_k": int(np.sum(np.all(got == expected, axis=1))),
+                "search_ms_per_query": round(seconds / len(queries) * 1000, 3),
+            }
+    return report
+
+
+def measure_memory(rows, dim, top_k, candidates, kinds, out_dir, seed, n_queries=50):
+    """RSS que abrir o índice e buscar deixa residente, num índice sintético de ``rows`` vetores."""
+    rng = np.random.default_rng(seed)
+    nodes = [TextNode(text="", id_=str(i)) for i in range(rows)]
+    matrix = rng.standard_normal((rows, dim), dtype=np.float32)
+    queries = rng.standard_normal((n_queries, dim), dtype=np.float32)
+    for kind in ("exact",) + tuple(kinds):
+        write_store(os.path.join(out_dir, f"memory-{kind}"), nodes, matrix, lexical=False,
+                    quantization=None if kind == "exact" else kind)
+    del matrix, nodes
+    gc.collect()
+
+    report = {}
+    for kind in ("exact",) + tuple(kinds):
+        before = rss_mb()
+        store = MmapNodeStore.open(os.path.join(out_dir, f"memory-{kind}"))
+        if kind == "exact":
+            retriever = NumpyRetriever.from_store(store, similarity_top_k=top_k)
+        else:
+            retriever = QuantizedRetriever.from_store(store, similarity_top_k=top_k, candidates=candidates)
+        start = time.perf_counter()
+        retriever.top_k(queries, top_k)
+        seconds = time.perf_counter() - start
+        report[kind] = {
+            "rss_delta_mb": round(rss_mb() - before, 1),
+            "search_ms_per_query": round(seconds / n_queries * 1000, 3),
+        }
+        del retriever, store
+        gc.collect()
+    return report
+
+
+def run(args, logger):
+    labels = load_labels(args.questions)
+    questions = [item["question"] for item in labels]
+    index_dir, node_ids, nodes = load_nodes(args.mmap_dir, args.persist_dir)
+
+    source = args.vectors
+    matrix = queries = None
+    if source in ("auto", "index"):
+        matrix = index_vectors(args.mmap_dir, args.persist_dir, node_ids)
+        if matrix is None and source == "index":
+            raise FileNotFoundError(f"Sem embeddings gravados em '{index_dir}'.")
+        source = "index" if matrix is not None else "hashed"
+        if source == "hashed":
+            logger.warning(f"Sem embeddings gravados em '{index_dir}'; usando vetores de termos (--vectors hashed).")
+    if source == "model":
+        matrix, queries = model_vectors(nodes, questions, args.backend, logger)
+    elif source == "hashed":
+        matrix, queries = hashed_vectors(nodes, questions, args.dim, args.seed)
+
+    # Perguntas (se houver vetor para elas) + cada nó com ruído
+    rng = np.random.default_rng(args.seed)
+    scale = args.noise * float(np.abs(matrix).mean())
+    noisy = matrix + rng.normal(scale=scale, size=matrix.shape).astype(np.float32)
+    queries = noisy if queries is None else np.concatenate([queries, noisy])
+    dim = matrix.shape[1]
+
+    kinds = args.kinds
+    with tempfile.TemporaryDirectory(prefix="eval-quantization-") as out_dir:
+        parity = check_parity(matrix, nodes, queries, args.top_k, args.candidates, kinds, out_dir)
+        recall = (recall_sweep(matrix, queries, args.top_k, args.sweep_candidates, kinds, args.recall_rows,
+                               args.recall_noise, out_dir, args.seed)
+                  if args.recall_rows else {})
+        memory = (measure_memory(args.memory_rows, dim, args.top_k, args.candidates, kinds, out_dir, args.seed)
+                  if args.memory_rows else {})
+
+    report = {
+        "index": index_dir,
+        "vectors": source,
+        "nodes": len(nodes),
+        "dim": dim,
+        "top_k": args.top_k,
+        "bytes_per_vector": {
+            "python_list": python_list_bytes(dim),
+            "float32": dim * 4,
+            "float16": dim * 2,
+            **{kind: parity[kind]["code_bytes_per_vector"] for kind in kinds},
+        },
+        "parity": parity,
+        "recall_rows": args.recall_rows,
+        "recall": recall,
+        "memory_rows": args.memory_rows,
+        "memory": memory,
+    }
+    print(f"Índice: {index_dir} | {len(nodes)} nós, dim {dim}, vetores: {source} | "
+          f"consultas: {len(queries)} | top-{args.top_k}, {args.candidates} candidatos re-pontuados")
+    print("Bytes por vetor: " + ", ".join(f"{name} {value}" for name, value in report["bytes_per_vector"].items()))
+    for kind, row in parity.items():
+        print(f"{kind:<7} top-{args.top_k} igual à busca exata: {row['same_top_k']}/{row['queries']} "
+              f"(mesmo conjunto {row['same_top_k_set']}, sem re-ranqueamento {row['same_top_k_coarse_only']}), "
+              f"{row['search_ms_per_query']} ms/consulta")
+    if recall:
+        print(f"Recall@{args.top_k} em {args.recall_rows} vetores (ruído {args.recall_noise}); "
+              f"busca exata: {recall['exact']['search_ms_per_query']} ms/consulta")
+        for kind in kinds:
+            for candidates, row in recall[kind].items():
+                print(f"{kind:<7} {candidates:>4} candidatos: recall {row['recall']:.3f}, "
+                      f"top-{args.top_k} igual {row['same_top_k']}/{len(queries)}, "
+                      f"{row['search_ms_per_query']} ms/consulta")
+    for kind, row in memory.items():
+        print(f"{kind:<7} {args.memory_rows} vetores: RSS +{row['rss_delta_mb']} MB, "
+              f"{row['search_ms_per_query']} ms/consulta")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Top-k da busca quantizada x busca exata, e memória por vetor")
+    parser.add_argument("--questions", default="retrieval_eval.jsonl")
+    parser.add_argument("--mmap-dir", default="../storage_gemini_llm_mmap")
+    parser.add_argument("--persist-dir", default="../storage_gemini_llm")
+    parser.add_argument("--vectors", choices=VECTOR_SOURCES, default="auto")
+    parser.add_argument("--kinds", nargs="+", choices=QUANTIZATION_KINDS, default=list(QUANTIZATION_KINDS))
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=QUANT_RESCORE_CANDIDATES)
+    parser.add_argument("--dim", type=int, default=1024, help="Dimensão dos vetores hashed")
+    parser.add_argument("--noise", type=float, default=0.1, help="Ruído das consultas derivadas dos nós")
+    parser.add_argument("--sweep-candidates", type=int, nargs="+", default=[10, 20, 30],
+                        help="Nºs de candidatos re-pontuados na varredura de recall")
+    parser.add_argument("--recall-rows", type=int, default=20000,
+                        help="Vetores do corpus da varredura de recall (0 desativa)")
+    parser.add_argument("--recall-noise", type=float, default=0.3,
+                        help="Norma do ruído que gera o corpus da varredura a partir dos nós")
+    parser.add_argument("--memory-rows", type=int, default=0,
+                        help="Mede o RSS da busca num índice sintético com esse nº de vetores")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", default="torch", help="Backend de embedding (fast_embedding.py)")
+    parser.add_argument("--output", help="Salva os resultados em JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    report = run(args, logging.getLogger("eval_quantization"))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    total = sum(row["queries"] for row in report["parity"].values())
+    same = sum(row["same_top_k"] for row in report["parity"].values())
+    return 0 if same == total else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Recall@k da recuperação densa, lexical (BM25) e híbrida (RRF) num conjunto rotulado.
+
+Cada linha do arquivo de perguntas (JSONL) traz a pergunta e as páginas do
+PDF onde está a resposta:
+    {"question": "...", "file_name": "embrapa-cogumelos-2017.pdf", "relevant_pages": ["102"]}
+
+Um nó recuperado é relevante quando o ``file_name`` e o ``page_label`` dele
+batem com o rótulo. Por pergunta:
+    hit@k    -> 1 se alguma página relevante aparece nos k primeiros nós
+    recall@k -> páginas relevantes encontradas / min(k, nº de páginas relevantes)
+
+Também mede a latência da busca BM25 por pergunta.
+
+Uso (a partir de core/):
+    python eval_retrieval.py --mmap-dir ../storage_gemini_llm_mmap --k 5 10
+    python eval_retrieval.py --modes lexical --persist-dir ../storage_gemini_llm   # sem modelo de embedding
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+import numpy as np
+
+from hybrid_retriever import HYBRID_CANDIDATES, RRF_K, reciprocal_rank_fusion
+from index_lifecycle import load_lexical, load_retriever
+from lexical_index import load_docstore_nodes
+from mmap_store import MmapNodeStore
+
+EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large"
+MODES = ("dense", "lexical", "hybrid")
+
+
+def load_labels(path):
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                items.append(json.loads(line))
+    return items
+
+
+def load_nodes(mmap_dir, persist_dir):
+    """(diretório, ids ou None, nós) na ordem das linhas do índice vetorial."""
+    if MmapNodeStore.exists(mmap_dir):
+        store = MmapNodeStore.open(mmap_dir)
+        return mmap_dir, None, store.get_nodes(range(len(store)))
+    node_ids, nodes = load_docstore_nodes(persist_dir)
+    return persist_dir, node_ids, nodes
+
+
+def score_ranking(ranking, item, nodes, k):
+    relevant = set(item["relevant_pages"])
+    file_name = item.get("file_name")
+    found = set()
+    for i in ranking[:k]:
+        metadata = nodes[int(i)].metadata
+        if file_name and metadata.get("file_name") != file_name:
+            continue
+        if metadata.get("page_label") in relevant:
+            found.add(metadata.get("page_label"))
+    return float(bool(found)), len(found) / min(k, len(relevant))
+
+
+def evaluate(args, logger):
+    labels = load_labels(args.questions)
+    questions = [item["question"] for item in labels]
+    max_k = max(args.k)
+    candidates = max(max_k, args.candidates)
+
+    index_dir, node_ids, nodes = load_nodes(args.mmap_dir, args.persist_dir)
+    lexical = load_lexical(index_dir, len(nodes), node_ids, lambda: nodes, logger)
+
+    lexical_rankings, latencies = [], []
+    for question in questions:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            indices, _ = lexical.search(question, candidates)
+            latencies.append(time.perf_counter() - start)
+        lexical_rankings.append(indices)
+
+    rankings = {"lexical": lexical_rankings}
+    if "dense" in args.modes or "hybrid" in args.modes:
+        from fast_embedding import create_embed_model
+
+        dense, _ = load_retriever(args.mmap_dir, args.persist_dir, max_k, logger, mode="dense")
+        embed_model = create_embed_model(EMBEDDING_MODEL_NAME, "cpu", logger, backend=args.backend,
+                                         warmup_runs=0)
+        embeddings = np.asarray([embed_model.get_query_embedding(q) for q in questions], dtype=np.float32)
+        dense_top, _ = dense.top_k(embeddings, candidates)
+        rankings["dense"] = list(dense_top)
+        rankings["hybrid"] = [
+            reciprocal_rank_fusion([d, l], max_k, args.rrf_k)[0]
+            for d, l in zip(dense_top, lexical_rankings)
+        ]
+
+    result = {
+        "index": index_dir,
+        "questions": len(labels),
+        "lexical_terms": lexical.manifest["terms"],
+        "lexical_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "lexical_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "modes": {},
+    }
+    for mode in args.modes:
+        per_k = {}
+        for k in args.k:
+            scores = [score_ranking(r, item, nodes, k) for r, item in zip(rankings[mode], labels)]
+            per_k[f"hit@{k}"] = round(float(np.mean([s[0] for s in scores])), 4)
+            per_k[f"recall@{k}"] = round(float(np.mean([s[1] for s in scores])), 4)
+        result["modes"][mode] = per_k
+        print(f"{mode:<8} " + "  ".join(f"{name} {value:.3f}" for name, value in per_k.items()))
+    print(f"BM25: {result['lexical_terms']} termos, p50 {result['lexical_p50_ms']} ms, "
+          f"p95 {result['lexical_p95_ms']} ms por pergunta")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall@k: denso x BM25 x híbrido")
+    parser.add_argument("--questions", default="retrieval_eval.jsonl")
+    parser.add_argument("--mmap-dir", default="../storage_gemini_llm_mmap")
+    parser.add_argument("--persist-dir", default="../storage_gemini_llm")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10])
+    parser.add_argument("--candidates", type=int, default=HYBRID_CANDIDATES)
+    parser.add_argument("--rrf-k", type=int, default=RRF_K)
+    parser.add_argument("--backend", default="torch", help="Backend de embedding (fast_embedding.py)")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetições para medir a latência do BM25")
+    parser.add_argument("--output", help="Salva os resultados em JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    result = evaluate(args, logging.getLogger("eval_retrieval"))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
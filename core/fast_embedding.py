@@ -0,0 +1,273 @@
+"""Backends de embedding rápidos para CPU (mesmo modelo multilingual-e5-large).
+
+``EMBEDDING_BACKEND``:
+    torch      -> HuggingFaceEmbedding fp32 (comportamento original)
+    int8       -> mesmo modelo com quantização dinâmica int8 das camadas Linear (torch)
+    onnx       -> export ONNX executado pelo ONNX Runtime
+    onnx-int8  -> export ONNX com pesos quantizados em int8 (ONNX Runtime)
+
+O export ONNX é gerado na primeira execução em ``EMBEDDING_ONNX_DIR`` e
+reaproveitado nas seguintes.
+
+Pooling e normalização reproduzem o SentenceTransformer do e5 (média dos
+tokens pela attention mask + norma L2), então os vetores são comparáveis aos
+do índice já construído. Os prefixos também são os do HuggingFaceEmbedding
+para o e5 ("query: " nas perguntas, "passage: " nos textos). Perguntas curtas (até ``EMBEDDING_QUERY_FIXED_TOKENS``
+tokens) são preenchidas até esse tamanho fixo: a attention mask anula o
+padding e o runtime reaproveita sempre o mesmo shape, que já foi aquecido no
+boot.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from boot import after_fork, is_prefork
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", "0"))  # 0 = padrão do runtime
+EMBEDDING_WARMUP_RUNS = int(os.getenv("EMBEDDING_WARMUP_RUNS", "3"))
+EMBEDDING_QUERY_FIXED_TOKENS = int(os.getenv("EMBEDDING_QUERY_FIXED_TOKENS", "64"))
+# Relativo ao repositório, não ao diretório de onde o servidor foi iniciado
+EMBEDDING_ONNX_DIR = os.getenv(
+    "EMBEDDING_ONNX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models", "multilingual-e5-large-onnx"),
+)
+EMBEDDING_MAX_TOKENS = 512
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model.int8.onnx"
+WARMUP_QUERY = "Qual a temperatura ideal para o cultivo de shiitake?"
+# Prompts que o HuggingFaceEmbedding aplica aos modelos e5 (llama_index.embeddings.huggingface.utils)
+E5_QUERY_INSTRUCTION = "query: "
+E5_TEXT_INSTRUCTION = "passage: "
+
+logger = logging.getLogger("fast_embedding")
+
+
+def mean_pool(hidden, attention_mask):
+    """Média dos estados dos tokens válidos, normalizada (igual ao Pooling + Normalize do e5)."""
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / np.clip(norms, 1e-12, None)
+
+
+def export_onnx(model_name, onnx_dir):
+    """Exporta o modelo para ONNX (e a versão int8) em ``onnx_dir``, se ainda não existir."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    path = os.path.join(onnx_dir, ONNX_MODEL_FILE)
+    int8_path = os.path.join(onnx_dir, ONNX_INT8_MODEL_FILE)
+    if os.path.exists(path) and os.path.exists(int8_path):
+        return
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    logger.info(f"Exportando {model_name} para ONNX em '{onnx_dir}'...")
+    os.makedirs(onnx_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = LastHiddenState(AutoModel.from_pretrained(model_name).eval())
+    sample = tokenizer([WARMUP_QUERY], return_tensors="pt")
+    with torch.inference_mode():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17,
+        )
+    tokenizer.save_pretrained(onnx_dir)
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logger.info("Quantizando o modelo ONNX (int8)...")
+    quantize_dynamic(path, int8_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+
+
+def load_torch_runner(model_name, quantize, num_threads):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def run(input_ids, attention_mask):
+        with torch.inference_mode():
+            output = model(
+                input_ids=torch.from_numpy(input_ids),
+                attention_mask=torch.from_numpy(attention_mask),
+            )
+        return output.last_hidden_state.numpy()
+
+    return tokenizer, run
+
+
+def load_onnx_runner(model_name, quantize, num_threads, onnx_dir):
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+
+    export_onnx(model_name, onnx_dir)
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    session = ort.InferenceSession(
+        os.path.join(onnx_dir, ONNX_INT8_MODEL_FILE if quantize else ONNX_MODEL_FILE),
+        sess_options=options,
+        providers=["CPUExecutionProvider"],
+    )
+    tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+
+    def run(input_ids, attention_mask):
+        return session.run(
+            ["last_hidden_state"], {"input_ids": input_ids, "attention_mask": attention_mask}
+        )[0]
+
+    return tokenizer, run
+
+
+class FastEmbedding(BaseEmbedding):
+    """Embedding do e5 com tokenizer + runner (torch int8 ou ONNX Runtime) e pooling próprio."""
+
+    backend: str = "int8"
+    fixed_query_tokens: int = EMBEDDING_QUERY_FIXED_TOKENS
+    max_tokens: int = EMBEDDING_MAX_TOKENS
+    query_instruction: str = E5_QUERY_INSTRUCTION
+    text_instruction: str = E5_TEXT_INSTRUCTION
+
+    _tokenizer: object = PrivateAttr()
+    _run: object = PrivateAttr()
+    _num_threads: int = PrivateAttr()
+    _onnx_dir: str = PrivateAttr()
+
+    def __init__(self, model_name, backend="int8", num_threads=EMBEDDING_NUM_THREADS,
+                 onnx_dir=EMBEDDING_ONNX_DIR, **kwargs):
+        if backend not in ("int8", "onnx", "onnx-int8"):
+            raise ValueError(f"Backend de embedding não suportado: {backend} (use {BACKENDS})")
+        super().__init__(model_name=model_name, backend=backend, **kwargs)
+        self._num_threads = num_threads
+        self._onnx_dir = onnx_dir
+        if backend == "int8":
+            self._tokenizer, self._run = load_torch_runner(model_name, True, num_threads)
+        else:
+            self.load_onnx_session()
+
+    def load_onnx_session(self):
+        """(Re)cria a sessão do ONNX Runtime; o pool de threads dela não sobrevive a um fork."""
+        self._tokenizer, self._run = load_onnx_runner(
+            self.model_name, self.backend == "onnx-int8", self._num_threads, self._onnx_dir
+        )
+
+    @classmethod
+    def class_name(cls):
+        return "FastEmbedding"
+
+    def _tokenize(self, texts):
+        """Tokeniza e preenche até o tamanho fixo (perguntas curtas) ou até o maior texto do lote."""
+        encoded = self._tokenizer(list(texts), truncation=True, max_length=self.max_tokens)["input_ids"]
+        longest = max(len(ids) for ids in encoded)
+        length = self.fixed_query_tokens if longest <= self.fixed_query_tokens else longest
+        input_ids = np.full((len(encoded), length), self._tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(encoded), length), dtype=np.int64)
+        for i, ids in enumerate(encoded):
+            input_ids[i, :len(ids)] = ids
+            attention_mask[i, :len(ids)] = 1
+        return input_ids, attention_mask
+
+    def _embed(self, texts, prompt_name=None):
+        # Mesmo prefixo que o SentenceTransformer do HuggingFaceEmbedding aplica por prompt_name
+        prefix = {"query": self.query_instruction, "text": self.text_instruction}.get(prompt_name, "")
+        input_ids, attention_mask = self._tokenize([prefix + text for text in texts])
+        return mean_pool(self._run(input_ids, attention_mask), attention_mask).tolist()
+
+    def warmup(self, runs=EMBEDDING_WARMUP_RUNS):
+        """Executa o shape fixo algumas vezes para alocar buffers/kernels antes da primeira requisição."""
+        start = time.perf_counter()
+        for _ in range(runs):
+            self._embed([WARMUP_QUERY], prompt_name="query")
+        return time.perf_counter() - start
+
+    def get_query_embedding_batch(self, queries):
+        """Embeddings de várias perguntas num único forward (usado pelo /ask/batch)."""
+        return self._embed(list(queries), prompt_name="query")
+
+    def _get_query_embedding(self, query):
+        return self._embed([query], prompt_name="query")[0]
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._embed([text], prompt_name="text")[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._embed(texts, prompt_name="text")
+
+
+def embedding_device(backend=EMBEDDING_BACKEND):
+    """Dispositivo do embedding; os backends ONNX rodam só em CPU e não precisam importar o torch."""
+    if backend.startswith("onnx"):
+        return "cpu"
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def create_embed_model(model_name, device, app_logger, backend=EMBEDDING_BACKEND,
+                       num_threads=EMBEDDING_NUM_THREADS, warmup_runs=EMBEDDING_WARMUP_RUNS):
+    """Modelo de embedding dos servidores conforme ``EMBEDDING_BACKEND``, já aquecido.
+
+    No modo pre-fork o aquecimento fica para cada worker (depois do fork),
+    porque os pools de threads criados na inferência não atravessam o fork.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND inválido: {backend} (use {BACKENDS})")
+    if backend == "torch" or device != "cpu":
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+        if num_threads and device == "cpu":
+            import torch
+
+            torch.set_num_threads(num_threads)
+        app_logger.info(f"Backend de embedding: torch fp32 ({device})")
+        embed_model = HuggingFaceEmbedding(model_name=model_name, device=device)
+
+        def warmup():
+            start = time.perf_counter()
+            for _ in range(warmup_runs):
+                embed_model.get_query_embedding(WARMUP_QUERY)
+            return time.perf_counter() - start
+    else:
+        app_logger.info(f"Backend de embedding: {backend} (CPU, threads={num_threads or 'padrão'})")
+        embed_model = FastEmbedding(model_name, backend=backend, num_threads=num_threads)
+        if backend.startswith("onnx") and is_prefork():
+            after_fork(embed_model.load_onnx_session)
+
+        def warmup():
+            return embed_model.warmup(warmup_runs)
+
+    if warmup_runs:
+        after_fork(lambda: app_logger.info(f"Aquecimento do embedding: {warmup():.2f} s (pid {os.getpid()})"))
+    return embed_model
@@ -1,90 +1,26 @@
-import os
-import logging
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
-from llama_index.core import Settings, VectorStoreIndex, SimpleDirectoryReader, PromptTemplate
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.gemini import GeminiEmbedding
-
-# Configurações básicas
-load_dotenv()
-app = Flask(__name__)
-
-# Configuração de logging
-logging.basicConfig(level=logging.INFO)
-app.logger.addHandler(logging.StreamHandler())
-app.logger.setLevel(logging.INFO)
-
-# Inicialização dos modelos
-def initialize_services():
-    try:
-        # Configuração do Gemini
-        GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-        if not GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY não encontrada nas variáveis de ambiente")
-
-        # Configurar embedding e LLM do Gemini
-        Settings.embed_model = GeminiEmbedding(
-            model_name="models/embedding-001",
-            api_key=GEMINI_API_KEY
-        )
-        
-        Settings.llm = Gemini(
-            model_name="models/gemini-1.5-flash",
-            api_key=GEMINI_API_KEY
-        )
-
-        # Carregar documentos (ajuste o path conforme necessário)
-        documents = SimpleDirectoryReader("data").load_data()
-        app.logger.info(f"Documentos carregados: {len(documents)}")
-
-        # Criar índice na memória
-        global index
-        index = VectorStoreIndex.from_documents(documents)
-        app.logger.info("Índice vetorial criado com sucesso")
+"""Atalho para ``chatbot.py`` com ``CHATBOT_PROFILE=railway`` (Gemini + embedding pela API, para o Railway).
 
-        return True
-
-    except Exception as e:
-        app.logger.error(f"Erro na inicialização: {str(e)}")
-        return False
-
-# Template de prompt
-qa_template = PromptTemplate(
-
-            "Você é um assistente prestativo e informativo, especializado em cultivo de cogumelos.\n"
-            "Com base no CONTEXTO fornecido abaixo, responda à PERGUNTA do usuário.\n"
-            "Se o CONTEXTO não tiver a resposta, mas a PERGUNTA for sobre cultivo de cogumelos, use seu conhecimento geral para responder.\n"
-            "Se a PERGUNTA não for sobre cultivo de cogumelos, informe educadamente que você só pode ajudar com esse tópico.\n"
-            "Suas respostas devem ser detalhadas, formais, porém amigáveis e diretas. Não repita a pergunta.\n"
-            "Não mencione explicitamente o 'CONTEXTO' ou o documento fonte na sua resposta final.\n\n"
-            "CONTEXTO:\n"
-            "---------------------\n"
-            "{context_str}\n"
-            "---------------------\n"
-            "PERGUNTA: {query_str}\n\n"
-            "RESPOSTA DETALHADA:"
-)
-
-@app.route('/ask', methods=['POST'])
-def ask_endpoint():
-    if request.json and 'question' in request.json:
-        try:
-            query = request.json['question']
-            query_engine = index.as_query_engine(
-                text_qa_template=qa_template,
-                similarity_top_k=3
-            )
-            response = query_engine.query(query)
-            return jsonify({"answer": str(response)})
-        except Exception as e:
-            return jsonify({"error": str(e)}), 500
-    return jsonify({"error": "Requisição inválida"}), 400
-
-if __name__ == '__main__':
-    if initialize_services():
-        port = int(os.environ.get("PORT", 5001))
-        app.logger.info(f"Iniciando servidor na porta {port}")
-        app.run(host='0.0.0.0', port=port)
-    else:
-        app.logger.error("Falha na inicialização do serviço")
+Mantido para os comandos já usados (``python geminichatbot_railway.py``, gunicorn com
+``geminichatbot_railway:app``, ``CHATBOT_MODULE=geminichatbot_railway`` no asgi_app.py).
+"""
+import os
+import sys
+
+PROFILE = "railway"
+# O perfil é lido no import do chatbot, uma vez por processo: um segundo atalho
+# com outro perfil receberia o módulo já configurado pelo primeiro
+loaded = sys.modules.get("chatbot")
+if loaded is not None and loaded.CHATBOT_PROFILE != PROFILE:
+    raise RuntimeError(
+        f"chatbot já foi importado com o perfil '{loaded.CHATBOT_PROFILE}' neste processo; "
+        f"'{__name__}' precisa do perfil '{PROFILE}' (use um processo por perfil)."
+    )
+os.environ["CHATBOT_PROFILE"] = PROFILE
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import chatbot  # noqa: E402
+
+if __name__ == "__main__":
+    chatbot.main()
+else:
+    # O mesmo módulo para quem importa este nome (app, rag_service, boot...)
+    sys.modules[__name__] = chatbot
@@ -0,0 +1,83 @@
+"""Recuperação híbrida: busca vetorial (NumpyRetriever) + BM25 (lexical_index.py).
+
+Cada lado traz ``HYBRID_CANDIDATES`` candidatos e as duas listas são
+combinadas por reciprocal rank fusion: score = soma de 1 / (RRF_K + posição).
+Só as posições entram na fusão, então não é preciso calibrar cosseno x BM25.
+"""
+import os
+
+import numpy as np
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import QueryBundle
+
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """Funde listas de posições de nós; devolve (posições, scores) dos k melhores.
+
+    Empates ficam na ordem em que o nó apareceu primeiro (a lista densa vem antes).
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            i = int(i)
+            scores[i] = scores.get(i, 0.0) + 1.0 / (rrf_k + rank + 1)
+    top = sorted(scores, key=scores.get, reverse=True)[:k]
+    return np.asarray(top, dtype=np.int64), np.asarray([scores[i] for i in top], dtype=np.float32)
+
+
+class HybridRetriever(BaseRetriever):
+    """Mesma interface do NumpyRetriever para o query engine, com fusão BM25 + vetorial."""
+
+    mode = "hybrid"
+
+    def __init__(self, dense, lexical, similarity_top_k=None, candidates=HYBRID_CANDIDATES,
+                 rrf_k=RRF_K):
+        super().__init__()
+        if len(lexical) != len(dense):
+            raise ValueError(
+                f"Índice lexical com {len(lexical)} nós não bate com o vetorial ({len(dense)})."
+            )
+        self._dense = dense
+        self._lexical = lexical
+        self._similarity_top_k = similarity_top_k or dense.similarity_top_k or DEFAULT_SIMILARITY_TOP_K
+        self._candidates = max(candidates, self._similarity_top_k)
+        self._rrf_k = rrf_k
+
+    @property
+    def similarity_top_k(self):
+        return self._similarity_top_k
+
+    @property
+    def lexical(self):
+        return self._lexical
+
+    @property
+    def quantization(self):
+        return self._dense.quantization
+
+    def __len__(self):
+        return len(self._dense)
+
+    def _fuse(self, query_str, dense_indices):
+        lexical_indices, _ = self._lexical.search(query_str, self._candidates)
+        indices, scores = reciprocal_rank_fusion(
+            [dense_indices, lexical_indices], self._similarity_top_k, self._rrf_k
+        )
+        return self._dense._to_nodes_with_score(indices, scores)
+
+    def _retrieve(self, query_bundle):
+        dense_indices, _ = self._dense.top_k(self._dense._embed_query(query_bundle), self._candidates)
+        return self._fuse(query_bundle.query_str, dense_indices[0])
+
+    def retrieve_batch(self, queries):
+        """Parte vetorial numa única multiplicação de matrizes, BM25 por consulta."""
+        bundles = [QueryBundle(q) if isinstance(q, str) else q for q in queries]
+        if not bundles:
+            return []
+        embeddings = [self._dense._embed_query(bundle) for bundle in bundles]
+        dense_indices, _ = self._dense.top_k(embeddings, self._candidates)
+        return [self._fuse(bundle.query_str, row) for bundle, row in zip(bundles, dense_indices)]
@@ -0,0 +1,173 @@
+"""Ciclo de vida do índice, compartilhado pelos servidores.
+
+Ordem de carga:
+    1. diretório binário (mmap), se existir -> abre sem parse de JSON;
+    2. índice JSON persistido pelo LlamaIndex.
+
+Com ``RETRIEVER_MODE=hybrid`` o retriever vetorial é combinado com o índice
+BM25 gravado em ``lexical/`` (ver hybrid_retriever.py). Com códigos
+quantizados no índice mmap (ou ``EMBEDDING_QUANTIZATION=int8|binary``), a
+busca vetorial varre os códigos e re-pontua os candidatos com os vetores
+float (ver quantization.py).
+
+Os servidores nunca indexam no boot: o índice mmap é gerado (e atualizado de
+forma incremental) por ``reindex.py`` — no Railway, durante o build da imagem
+(``railway.json``). Sem índice, ``load_retriever`` falha e o /readyz do
+servidor responde 503 com o motivo.
+
+Os query engines (normal e streaming) são criados uma única vez por processo
+em ``create_rag_service``; os endpoints só usam o RagService resultante. Com
+``CONTEXT_ASSEMBLY=1`` (desligado por padrão) os nós recuperados passam por
+context_assembly.py antes do prompt, e com ``SINGLE_FLIGHT=1`` (padrão)
+perguntas iguais simultâneas compartilham uma só chamada ao LLM
+(single_flight.py).
+"""
+import os
+
+from llama_index.core import PromptTemplate, Settings, StorageContext, load_index_from_storage
+from llama_index.core.query_engine import RetrieverQueryEngine
+
+from answer_cache import cache_version, index_fingerprint
+from context_assembly import CONTEXT_ASSEMBLY, ContextAssembler
+from hybrid_retriever import HybridRetriever
+from lexical_index import LEXICAL_DIR, LexicalIndex
+from metrics import install_llm_instrumentation
+from mmap_store import MmapNodeStore
+from numpy_retriever import NumpyRetriever
+from quantization import EMBEDDING_QUANTIZATION, QuantizedRetriever, resolve_quantization
+from rag_service import RagService
+from single_flight import SINGLE_FLIGHT, SingleFlight, single_flight_timeout
+
+RETRIEVER_MODE = os.getenv("RETRIEVER_MODE", "dense")
+RETRIEVER_MODES = ("dense", "hybrid")
+
+
+def load_lexical(index_dir, node_count, node_ids, get_nodes, logger):
+    """Abre o índice BM25 de ``index_dir``; se faltar ou não bater com o índice, constrói em memória."""
+    path = os.path.join(index_dir, LEXICAL_DIR)
+    if LexicalIndex.exists(path):
+        lexical = LexicalIndex.open(path)
+        if len(lexical) == node_count and (node_ids is None or lexical.node_ids == node_ids):
+            return lexical
+    logger.warning(
+        f"Índice lexical ausente ou desatualizado em '{path}'; construindo em memória "
+        f"(regenere o índice com reindex.py ou lexical_index.py)."
+    )
+    return LexicalIndex.from_nodes(get_nodes(), node_ids=node_ids)
+
+
+def load_retriever(mmap_dir, persist_dir, similarity_top_k, logger, mode=RETRIEVER_MODE,
+                   quantization=EMBEDDING_QUANTIZATION):
+    """Abre o índice e devolve (retriever, diretório de onde ele veio)."""
+    if mode not in RETRIEVER_MODES:
+        raise ValueError(f"RETRIEVER_MODE inválido: {mode} (use {RETRIEVER_MODES})")
+    resolve_quantization(quantization)
+    if not MmapNodeStore.exists(mmap_dir) and not os.path.exists(persist_dir):
+        raise FileNotFoundError(
+            f"Índice não encontrado em '{mmap_dir}' nem em '{persist_dir}'. "
+            f"Execute 'python reindex.py <dir. de dados> {mmap_dir}' primeiro para criar o índice."
+        )
+
+    if MmapNodeStore.exists(mmap_dir):
+        logger.info(f"Abrindo índice binário (mmap) de {mmap_dir}...")
+        store = MmapNodeStore.open(mmap_dir)
+        logger.info(f"Índice binário aberto: {len(store)} nós.")
+        kind = resolve_quantization(quantization, store.manifest)
+        if kind:
+            retriever = _quantized(QuantizedRetriever.from_store, store, kind, store.manifest,
+                                   similarity_top_k, logger)
+        else:
+            retriever = NumpyRetriever.from_store(store, similarity_top_k=similarity_top_k)
+        if mode == "hybrid":
+            lexical = load_lexical(mmap_dir, len(store), None,
+                                   lambda: store.get_nodes(range(len(store))), logger)
+            retriever = _hybrid(retriever, lexical, logger)
+        return retriever, mmap_dir
+
+    logger.info(f"Carregando índice de {persist_dir}...")
+    storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+    index = load_index_from_storage(storage_context)
+    logger.info("Índice carregado.")
+    # Retriever vetorizado (NumPy) no lugar da varredura nó a nó do SimpleVectorStore
+    kind = resolve_quantization(quantization)
+    if kind:
+        retriever = _quantized(QuantizedRetriever.from_index, index, kind, {}, similarity_top_k, logger)
+    else:
+        retriever = NumpyRetriever.from_index(index, similarity_top_k=similarity_top_k)
+    if mode == "hybrid":
+        node_ids = list(index.vector_store.data.embedding_dict)
+        lexical = load_lexical(persist_dir, len(node_ids), node_ids,
+                               lambda: index.docstore.get_nodes(node_ids), logger)
+        retriever = _hybrid(retriever, lexical, logger)
+    return retriever, persist_dir
+
+
+def _quantized(factory, source, kind, manifest, similarity_top_k, logger):
+    if (manifest.get("quantization") or {}).get("kind") != kind:
+        logger.warning(
+            f"Índice sem códigos {kind}; quantizando no boot (grave-os com "
+            f"'reindex.py --quantization {kind}' ou 'convert_storage.py --quantization {kind}')."
+        )
+    retriever = factory(source, kind=kind, similarity_top_k=similarity_top_k)
+    stats = retriever.memory_stats()
+    logger.info(
+        f"Busca quantizada ({kind}): {stats['code_bytes_per_vector']} bytes/vetor residentes "
+        f"({stats['codes_mb']} MB) x {stats['float_bytes_per_vector']} bytes/vetor float "
+        f"({stats['float_mb']} MB), re-ranqueamento exato de {stats['rescore_candidates']} candidatos."
+    )
+    return retriever
+
+
+def _hybrid(dense, lexical, logger):
+    logger.info(
+        f"Recuperação híbrida (BM25 + vetorial, RRF): {lexical.manifest['terms']} termos, "
+        f"{lexical.manifest['postings']} postings."
+    )
+    return HybridRetriever(dense, lexical, similarity_top_k=dense.similarity_top_k)
+
+
+def create_rag_service(retriever, qa_prompt_tmpl_str, index_dir, logger, cache=None,
+                       context_assembly=CONTEXT_ASSEMBLY, single_flight=SINGLE_FLIGHT):
+    """Cria os query engines uma única vez e o RagService que os endpoints usam."""
+    logger.info("Criando query engine...")
+    qa_prompt_tmpl = PromptTemplate(qa_prompt_tmpl_str)
+    mode = getattr(retriever, "mode", "dense")
+    node_postprocessors = []
+    assembly_config = None
+    if context_assembly:
+        assembler = ContextAssembler(qa_prompt_tmpl_str, logger)
+        if mode == "hybrid":
+            # Scores de RRF só refletem posições: o corte relativo descartaria
+            # nós que aparecem em apenas uma das listas
+            assembler.min_score_ratio = 0.0
+        node_postprocessors.append(assembler)
+        assembly_config = assembler.config
+        logger.info(f"Montagem de contexto ativa: {assembly_config}")
+    query_engine = RetrieverQueryEngine.from_args(
+        retriever,
+        streaming=False,
+        text_qa_template=qa_prompt_tmpl,
+        node_postprocessors=node_postprocessors,
+    )
+    stream_engine = RetrieverQueryEngine.from_args(
+        retriever,
+        streaming=True,
+        text_qa_template=qa_prompt_tmpl,
+        node_postprocessors=node_postprocessors,
+    )
+    logger.info("Query engine criado com sucesso.")
+    # Tempo e tokens de cada chamada ao LLM no /metrics
+    install_llm_instrumentation()
+
+    # Qualquer mudança no índice, no prompt ou no contexto montado invalida o
+    # cache de respostas e separa as chaves do single flight
+    version = cache_version(index_fingerprint(index_dir), qa_prompt_tmpl_str, retriever.similarity_top_k,
+                            mode, assembly_config, getattr(retriever, "quantization", None))
+    if cache is not None:
+        cache.set_version(version)
+    coalescer = None
+    if single_flight:
+        coalescer = SingleFlight(timeout=single_flight_timeout(Settings.llm), logger=logger)
+        logger.info(f"Single flight ativo: espera máxima de {coalescer.timeout:.0f}s por pergunta em andamento.")
+    return RagService(query_engine, cache=cache, logger=logger, stream_engine=stream_engine,
+                      single_flight=coalescer, version=version)
@@ -0,0 +1,232 @@
+"""Pipeline de ingestão em estágios sobrepostos: parse -> chunking -> embedding.
+
+    - parse + chunking: as páginas dos PDFs são extraídas (pypdf) e divididas
+      num pool de processos, em blocos de ``pages_per_task`` páginas, com o
+      mesmo parser de ``VectorStoreIndex.from_documents`` (o chunking é por
+      página, então dividir no worker dá os mesmos nós); os blocos chegam ao
+      processo principal em ordem, assim que ficam prontos;
+    - embedding: os chunks a embedar vão em lotes para uma thread que chama o
+      modelo, através de uma fila limitada (``max_queued_batches``), então o
+      parse continua enquanto o modelo trabalha e não se acumulam chunks
+      esperando embedding. Os vetores prontos (float32) ficam com o chamador,
+      e crescem com o acervo.
+
+Os nós gerados são idênticos aos do ``SimpleDirectoryReader`` (mesmos
+metadados, ids e exclusões), então os hashes de chunk do ``reindex.py``
+continuam valendo. Outros formatos caem no ``SimpleDirectoryReader``.
+"""
+import collections
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from llama_index.core import Document, Settings, SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.readers.file.base import default_file_metadata_func
+
+PDF_PAGES_PER_TASK = 16
+EMBED_BATCH_SIZE = 64
+MAX_QUEUED_BATCHES = 4
+
+# Mesmas exclusões que o SimpleDirectoryReader aplica aos metadados de arquivo
+EXCLUDED_METADATA_KEYS = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+
+def parse_pdf_pages(path, start, end, file_metadata, chunk_size, chunk_overlap):
+    """Executado no pool: lê as páginas [start, end) de um PDF e devolve (nós, t. parse, t. chunking).
+
+    Documentos com os mesmos metadados, ids e exclusões do SimpleDirectoryReader.
+    """
+    import pypdf
+
+    started = time.perf_counter()
+    pdf = pypdf.PdfReader(path)
+    documents = []
+    for page in range(start, end):
+        document = Document(
+            text=pdf.pages[page].extract_text(),
+            metadata={
+                "page_label": pdf.page_labels[page],
+                "file_name": os.path.basename(path),
+                **file_metadata,
+            },
+            excluded_embed_metadata_keys=list(EXCLUDED_METADATA_KEYS),
+            excluded_llm_metadata_keys=list(EXCLUDED_METADATA_KEYS),
+        )
+        document.id_ = f"{path}_part_{page}"
+        documents.append(document)
+    parsed = time.perf_counter()
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    nodes = splitter.get_nodes_from_documents(documents)
+    return nodes, parsed - started, time.perf_counter() - parsed
+
+
+def count_pdf_pages(path):
+    import pypdf
+
+    return len(pypdf.PdfReader(path).pages)
+
+
+def chunk_file(path):
+    """Lê um arquivo e divide em nós com o mesmo parser usado por VectorStoreIndex.from_documents."""
+    documents = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+    return Settings.node_parser.get_nodes_from_documents(documents)
+
+
+class StageStats:
+    """Itens processados e tempo gasto num estágio (somado entre os workers do pool)."""
+
+    def __init__(self, unit):
+        self.unit = unit
+        self.items = 0
+        self.seconds = 0.0
+
+    def add(self, items, seconds):
+        self.items += items
+        self.seconds += seconds
+
+    def to_dict(self):
+        rate = self.items / self.seconds if self.seconds else 0.0
+        return {"items": self.items, "seconds": round(self.seconds, 3),
+                f"{self.unit}_per_s": round(rate, 1)}
+
+
+class IngestPipeline:
+    """Uso:
+
+        with IngestPipeline(load_embed_model) as pipeline:
+            for node in pipeline.iter_nodes(path):
+                pipeline.embed(key, text)   # só para chunks sem vetor reaproveitável
+            vectors = pipeline.finish()     # {key: vetor}
+    """
+
+    def __init__(self, load_embed_model, parse_workers=None, embed_batch_size=EMBED_BATCH_SIZE,
+                 max_queued_batches=MAX_QUEUED_BATCHES, pages_per_task=PDF_PAGES_PER_TASK):
+        self._load_embed_model = load_embed_model
+        self._parse_workers = parse_workers or os.cpu_count() or 1
+        self._embed_batch_size = embed_batch_size
+        self._pages_per_task = pages_per_task
+        self._queue = queue.Queue(maxsize=max_queued_batches)
+        self._batch = []
+        self._vectors = {}
+        self._error = None
+        self._executor = None
+        self._thread = None
+        self.parse = StageStats("pages")
+        self.chunk = StageStats("chunks")
+        self.embedding = StageStats("embeddings")
+
+    def __enter__(self):
+        self._executor = ProcessPoolExecutor(max_workers=self._parse_workers)
+        self._thread = threading.Thread(target=self._embed_worker, name="embed", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._executor.shutdown(cancel_futures=True)
+        return False
+
+    def iter_nodes(self, path):
+        """Gera os nós de um arquivo conforme as páginas ficam prontas."""
+        if not path.lower().endswith(".pdf"):
+            start = time.perf_counter()
+            documents = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+            self.parse.add(len(documents), time.perf_counter() - start)
+            yield from self._chunk(documents)
+            return
+
+        splitter = Settings.node_parser
+        if not isinstance(splitter, SentenceSplitter):
+            # Parser customizado: não dá para recriar no worker, então lê tudo aqui
+            yield from chunk_file(path)
+            return
+
+        file_metadata = default_file_metadata_func(path)
+        num_pages = count_pdf_pages(path)
+        starts = iter(range(0, num_pages, self._pages_per_task))
+        in_flight = collections.deque()
+
+        def submit_next():
+            start = next(starts, None)
+            if start is not None:
+                end = min(start + self._pages_per_task, num_pages)
+                in_flight.append((end - start, self._executor.submit(
+                    parse_pdf_pages, path, start, end,
+                    file_metadata, splitter.chunk_size, splitter.chunk_overlap,
+                )))
+
+        # Janela de 2 blocos por worker: o pool não fica ocioso e, se o
+        # embedding atrasar, os blocos prontos não se acumulam na memória.
+        for _ in range(2 * self._parse_workers):
+            submit_next()
+        while in_flight:
+            pages, future = in_flight.popleft()
+            nodes, parse_s, chunk_s = future.result()
+            submit_next()
+            self.parse.add(pages, parse_s)
+            self.chunk.add(len(nodes), chunk_s)
+            yield from nodes
+
+    def _chunk(self, documents):
+        start = time.perf_counter()
+        nodes = Settings.node_parser.get_nodes_from_documents(documents)
+        self.chunk.add(len(nodes), time.perf_counter() - start)
+        return nodes
+
+    def embed(self, key, text):
+        """Enfileira um texto; bloqueia se a thread de embedding estiver ``max_queued_batches`` lotes atrás."""
+        self._batch.append((key, text))
+        if len(self._batch) >= self._embed_batch_size:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def finish(self):
+        """Espera os lotes pendentes e devolve {chave: vetor}."""
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._vectors
+
+    def _embed_worker(self):
+        embed_model = None
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue  # só esvazia a fila para não travar o produtor
+            try:
+                if embed_model is None:
+                    embed_model = self._load_embed_model()
+                start = time.perf_counter()
+                vectors = embed_model.get_text_embedding_batch([text for _, text in batch])
+                self.embedding.add(len(batch), time.perf_counter() - start)
+                for (key, _), vector in zip(batch, vectors):
+                    # float32 em vez de lista do Python: ~4 KB por vetor de 1024 dimensões, não ~33 KB
+                    self._vectors[key] = np.asarray(vector, dtype=np.float32)
+            except Exception as e:
+                self._error = e
+
+    def stats(self):
+        return {
+            "parse": self.parse.to_dict(),
+            "chunk": self.chunk.to_dict(),
+            "embed": self.embedding.to_dict(),
+        }
@@ -0,0 +1,254 @@
+"""Índice lexical (BM25) sobre os textos dos nós, gravado junto com o índice vetorial.
+
+Complementa a busca densa em perguntas com termos exatos (espécies,
+ingredientes do substrato, proporções). Os textos passam por ``analyze``:
+minúsculas, remoção de stopwords, stemming Snowball para português (nltk) e
+remoção de acentos, então "inoculação", "inoculacao" e "inocular" caem no
+mesmo termo. Números ficam como estão ("1,5" e "1.5" viram o mesmo termo).
+
+Layout (subdiretório ``lexical/`` do índice):
+    lexical.json       -> parâmetros (k1, b), nº de nós e de termos, ids dos nós (opcional)
+    terms.txt          -> vocabulário, um termo por linha, em ordem
+    term_offsets.bin   -> uint64 (n_termos + 1), início da lista de cada termo
+    postings_docs.bin  -> uint32, posição do nó (linha da matriz de embeddings)
+    postings_w.bin     -> float16, peso BM25 do termo no nó (idf * tf saturado)
+
+Os pesos já saem calculados na construção, então uma consulta é só somar as
+listas dos seus termos num vetor de scores.
+
+Uso (índice JSON do LlamaIndex; o índice mmap do reindex.py já sai com ele):
+    python lexical_index.py ../storage_gemini_llm
+"""
+import argparse
+import functools
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import time
+import unicodedata
+from collections import Counter
+
+import numpy as np
+from llama_index.core.schema import MetadataMode
+
+from numpy_retriever import top_k_indices
+
+FORMAT_VERSION = 1
+LEXICAL_DIR = "lexical"
+MANIFEST_FILE = "lexical.json"
+TERMS_FILE = "terms.txt"
+OFFSETS_FILE = "term_offsets.bin"
+DOCS_FILE = "postings_docs.bin"
+WEIGHTS_FILE = "postings_w.bin"
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)*|[^\W\d_]+")
+
+# Já sem acentos (comparadas depois de fold_accents)
+STOPWORDS = frozenset("""
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles
+depois do dos e ela elas ele eles em entre era eram essa essas esse esses esta estao estas este
+estes eu foi foram ha isso isto ja lhe lhes mais mas me mesmo meu minha muito na nao nas nem no
+nos nossa nosso num numa o os ou para pela pelas pelo pelos por qual quais quando que quem se
+seja sem ser seu seus sua suas sao so tambem te tem tinha um uma umas uns voce
+""".split())
+
+
+def fold_accents(text):
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+@functools.lru_cache(maxsize=1)
+def _stemmer():
+    from nltk.stem.snowball import SnowballStemmer
+
+    return SnowballStemmer("portuguese")
+
+
+@functools.lru_cache(maxsize=200000)
+def _term(word):
+    # O Snowball de português espera o texto acentuado; os acentos saem depois
+    folded = fold_accents(word)
+    if len(folded) < 2 or folded in STOPWORDS:
+        return None
+    return fold_accents(_stemmer().stem(word))
+
+
+def analyze(text):
+    """Termos de um texto (ou pergunta), na ordem em que aparecem."""
+    terms = []
+    for token in TOKEN_RE.findall(text.casefold()):
+        if token[0].isdigit():
+            terms.append(token.replace(",", "."))
+            continue
+        term = _term(token)
+        if term:
+            terms.append(term)
+    return terms
+
+
+def node_texts(nodes):
+    return [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes]
+
+
+def _load_array(path, dtype):
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class LexicalIndex:
+    """Listas invertidas com pesos BM25; ``search`` devolve posições de nós e scores."""
+
+    def __init__(self, manifest, terms, offsets, docs, weights):
+        self.manifest = manifest
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+        self._offsets = offsets
+        self._docs = docs
+        self._weights = weights
+
+    @classmethod
+    def build(cls, texts, node_ids=None, k1=BM25_K1, b=BM25_B):
+        counts = [Counter(analyze(text)) for text in texts]
+        doc_lens = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        avg_len = float(doc_lens.mean()) if len(counts) and doc_lens.mean() > 0 else 1.0
+
+        postings = {}
+        for doc, doc_counts in enumerate(counts):
+            for term, tf in doc_counts.items():
+                postings.setdefault(term, []).append((doc, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+        docs, weights = [], []
+        n = len(counts)
+        for j, term in enumerate(terms):
+            plist = postings[term]
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc, tf in plist:
+                norm = k1 * (1 - b + b * doc_lens[doc] / avg_len)
+                docs.append(doc)
+                weights.append(idf * tf * (k1 + 1) / (tf + norm))
+            offsets[j + 1] = len(docs)
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "count": n,
+            "terms": len(terms),
+            "postings": len(docs),
+            "k1": k1,
+            "b": b,
+            "avg_doc_len": round(avg_len, 2),
+        }
+        if node_ids is not None:
+            manifest["node_ids"] = list(node_ids)
+        return cls(
+            manifest, terms, offsets,
+            np.asarray(docs, dtype=np.uint32), np.asarray(weights, dtype=np.float16),
+        )
+
+    @classmethod
+    def from_nodes(cls, nodes, node_ids=None):
+        return cls.build(node_texts(nodes), node_ids=node_ids)
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Versão de formato {manifest.get('format_version')} não suportada em '{path}'."
+            )
+        with open(os.path.join(path, TERMS_FILE), encoding="utf-8") as f:
+            terms = f.read().split("\n") if manifest["terms"] else []
+        return cls(
+            manifest,
+            terms,
+            _load_array(os.path.join(path, OFFSETS_FILE), np.uint64),
+            _load_array(os.path.join(path, DOCS_FILE), np.uint32),
+            _load_array(os.path.join(path, WEIGHTS_FILE), np.float16),
+        )
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    def write(self, path):
+        os.makedirs(path, exist_ok=True)
+        terms = sorted(self._term_ids, key=self._term_ids.get)
+        with open(os.path.join(path, TERMS_FILE), "w", encoding="utf-8") as f:
+            f.write("\n".join(terms))
+        np.asarray(self._offsets, dtype=np.uint64).tofile(os.path.join(path, OFFSETS_FILE))
+        np.asarray(self._docs, dtype=np.uint32).tofile(os.path.join(path, DOCS_FILE))
+        np.asarray(self._weights, dtype=np.float16).tofile(os.path.join(path, WEIGHTS_FILE))
+        with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        return {key: self.manifest[key] for key in ("terms", "postings", "k1", "b")}
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    @property
+    def node_ids(self):
+        return self.manifest.get("node_ids")
+
+    def search(self, query, k):
+        """Top-k por BM25: (posições dos nós, scores), só nós com algum termo da consulta."""
+        term_ids = {self._term_ids[t] for t in analyze(query) if t in self._term_ids}
+        if not term_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = np.zeros(len(self), dtype=np.float32)
+        for j in term_ids:
+            start, end = int(self._offsets[j]), int(self._offsets[j + 1])
+            scores[self._docs[start:end]] += self._weights[start:end]
+        candidates = np.flatnonzero(scores)
+        top = candidates[top_k_indices(scores[candidates][None, :], k)[0]]
+        return top, scores[top]
+
+
+def load_docstore_nodes(persist_dir):
+    """(ids, nós) de um índice JSON, na ordem do vector store (a mesma do NumpyRetriever.from_index)."""
+    from llama_index.core.storage.docstore import SimpleDocumentStore
+    from llama_index.core.vector_stores import SimpleVectorStore
+
+    docstore = SimpleDocumentStore.from_persist_dir(persist_dir)
+    node_ids = []
+    if os.path.exists(os.path.join(persist_dir, "default__vector_store.json")):
+        node_ids = list(SimpleVectorStore.from_persist_dir(persist_dir).data.embedding_dict)
+    if not node_ids:
+        node_ids = list(docstore.docs)
+    return node_ids, docstore.get_nodes(node_ids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera o índice lexical (BM25) de um índice JSON")
+    parser.add_argument("persist_dir", help="Diretório com docstore.json")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    node_ids, nodes = load_docstore_nodes(args.persist_dir)
+    lexical = LexicalIndex.from_nodes(nodes, node_ids=node_ids)
+    out_dir = os.path.join(args.persist_dir, LEXICAL_DIR)
+    tmp_dir = out_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    lexical.write(tmp_dir)
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.rename(tmp_dir, out_dir)
+    size = sum(os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir))
+    print(
+        f"Índice lexical em '{out_dir}': {len(lexical)} nós, {lexical.manifest['terms']} termos, "
+        f"{lexical.manifest['postings']} postings, {size / 1024:.1f} KiB "
+        f"({time.perf_counter() - start:.2f} s)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,512 @@
+"""Roteamento entre backends de LLM (Gemini, Ollama) com prazo, circuit breaker e fallback.
+
+``RouterLLM`` é um LLM do LlamaIndex: entra no lugar de ``Settings.llm`` e
+repassa cada chamada ao primeiro backend disponível, na ordem de
+``LLM_BACKENDS`` (ex.: ``gemini,ollama``):
+
+    prazo           cada backend tem ``LLM_TIMEOUT_<NOME>`` segundos (padrão
+                    ``LLM_TIMEOUT``); no streaming, o prazo vale até o primeiro trecho
+    circuit breaker depois de ``LLM_BREAKER_FAILURES`` falhas seguidas o backend
+                    fica ``LLM_BREAKER_COOLDOWN`` segundos fora; depois uma única
+                    chamada de teste decide se ele volta
+    fallback        erro, prazo estourado ou breaker aberto -> próximo backend
+    hedge           com ``LLM_HEDGE=1``, se o backend não respondeu até o p95 das
+                    suas latências recentes, o próximo backend também é chamado e
+                    vale a primeira resposta (não se aplica ao streaming)
+
+No caminho síncrono a chamada roda num pool de threads para poder ser
+abandonada no prazo (a thread termina sozinha, o resultado é descartado).
+
+Cada decisão vai para ``chatbot_llm_route_total{backend,outcome}`` e a latência
+de cada backend para ``chatbot_llm_backend_seconds{backend}``; o estado dos
+breakers e os percentis ficam em ``RouterLLM.stats()``.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Sequence
+
+import numpy as np
+from llama_index.core.base.llms.types import ChatMessage, LLMMetadata
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from pydantic import PrivateAttr
+
+import metrics
+
+LLM_BACKENDS = os.getenv("LLM_BACKENDS")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "95"))
+# Atraso do hedge enquanto o backend ainda não tem latências suficientes
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_ROUTER_THREADS = int(os.getenv("LLM_ROUTER_THREADS", "32"))
+
+
+def backend_timeout(name):
+    return float(os.getenv(f"LLM_TIMEOUT_{name.upper()}", str(LLM_TIMEOUT)))
+
+
+class LLMUnavailable(RuntimeError):
+    """Nenhum backend respondeu (erro, prazo ou breaker aberto em todos)."""
+
+
+class CircuitBreaker:
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = "half_open"
+                self._probing = False
+            # half_open: só uma chamada de teste por vez
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        """Chamada liberada por ``allow`` que não chegou a um resultado (cancelada)."""
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.max_failures:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class LLMBackend:
+    def __init__(self, name, llm, timeout=None, breaker=None, window=200, factory=None):
+        self.name = name
+        self.llm = llm
+        # Recria o cliente (ver reconnect); None para LLMs sem conexão própria
+        self.factory = factory
+        self.timeout = timeout if timeout is not None else backend_timeout(name)
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies = deque(maxlen=window)
+
+    def reconnect(self):
+        """Troca o LLM por uma instância nova, com conexões criadas neste processo."""
+        if self.factory is not None:
+            self.llm = self.factory()
+
+    def record(self, outcome, seconds=None):
+        if outcome == "ok":
+            self.breaker.success()
+            self._latencies.append(seconds)
+        elif outcome in ("error", "timeout"):
+            self.breaker.failure()
+        metrics.observe_llm_route(self.name, outcome, seconds if outcome == "ok" else None)
+
+    def quantile(self, q):
+        if len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return float(np.percentile(list(self._latencies), q))
+
+    def hedge_delay(self, q=LLM_HEDGE_QUANTILE):
+        delay = self.quantile(q)
+        return min(delay if delay is not None else LLM_HEDGE_DELAY, self.timeout)
+
+    def stats(self):
+        latencies = list(self._latencies)
+        return {
+            "timeout": self.timeout,
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "samples": len(latencies),
+            "p50": round(float(np.percentile(latencies, 50)), 3) if latencies else None,
+            "p95": round(float(np.percentile(latencies, 95)), 3) if latencies else None,
+        }
+
+
+class RouterLLM(CustomLLM):
+    _backends: list = PrivateAttr()
+    _hedge: bool = PrivateAttr()
+    _executor: Any = PrivateAttr()
+    _logger: Any = PrivateAttr()
+
+    def __init__(self, backends, hedge=LLM_HEDGE, logger=None, max_threads=LLM_ROUTER_THREADS, **kwargs):
+        if not backends:
+            raise ValueError("RouterLLM precisa de ao menos um backend.")
+        super().__init__(**kwargs)
+        self._backends = list(backends)
+        self._hedge = hedge
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="llm-router")
+        self._logger = logger or logging.getLogger(__name__)
+
+    @classmethod
+    def class_name(cls):
+        return "RouterLLM"
+
+    @property
+    def backends(self):
+        return self._backends
+
+    @property
+    def metadata(self):
+        # Janela e num_output do mesmo backend, o de menor janela: o prompt cabe em qualquer
+        # um do fallback. Misturar (janela do Ollama, num_output do Gemini) deixava o
+        # PromptHelper sem espaço para o contexto.
+        smallest = min((b.llm.metadata for b in self._backends), key=lambda m: m.context_window)
+        return LLMMetadata(
+            context_window=smallest.context_window,
+            num_output=smallest.num_output,
+            is_chat_model=False,
+            model_name="router:" + ",".join(b.name for b in self._backends),
+        )
+
+    @property
+    def worst_case_seconds(self):
+        """Maior duração possível de uma chamada: todos os backends estouram o prazo, em sequência.
+
+        O hedge não aumenta o total: o backend parceiro começa antes e, se
+        falhar, sai da fila.
+        """
+        return sum(backend.timeout for backend in self._backends)
+
+    def reconnect(self):
+        """Recria os clientes dos backends; chamado em cada worker depois do fork."""
+        for backend in self._backends:
+            try:
+                backend.reconnect()
+            except Exception as e:
+                # Fica com a instância herdada (REST) em vez de derrubar o worker
+                self._logger.error(f"Falha ao recriar o backend de LLM '{backend.name}': {e}")
+
+    def stats(self):
+        return {"hedge": self._hedge, "backends": {b.name: b.stats() for b in self._backends}}
+
+    def _next_allowed(self, candidates):
+        """Tira de ``candidates`` o próximo backend liberado pelo breaker."""
+        while candidates:
+            backend = candidates.pop(0)
+            if backend.breaker.allow():
+                return backend
+            backend.record("breaker_open")
+        return None
+
+    def _fail(self, backend, outcome, error, started):
+        backend.record(outcome)
+        self._logger.warning(
+            f"LLM '{backend.name}' falhou ({outcome}) em {time.perf_counter() - started:.2f}s: {error}"
+        )
+
+    def _unavailable(self, errors):
+        detail = "; ".join(f"{name}: {error}" for name, error in errors) or "todos os breakers abertos"
+        return LLMUnavailable(f"Nenhum backend de LLM respondeu ({detail})")
+
+    # --- síncrono ---
+    def _submit(self, backend, fn):
+        # Copia o contexto: ID da requisição e deduplicação das métricas do LLM valem na thread
+        return self._executor.submit(contextvars.copy_context().run, fn, backend.llm)
+
+    def _route(self, fn):
+        errors = []
+        candidates = list(self._backends)
+        while True:
+            backend = self._next_allowed(candidates)
+            if backend is None:
+                raise self._unavailable(errors)
+            partner = candidates[0] if self._hedge and candidates else None
+            try:
+                result, winner = self._attempt(backend, partner, fn, errors)
+            except _AttemptFailed as e:
+                if e.partner_used:
+                    candidates.pop(0)
+                continue
+            metrics.set_llm_backend(winner.name)
+            if errors or winner is not backend:
+                self._logger.info(f"LLM respondido por '{winner.name}' ({'hedge' if winner is not backend else 'fallback'}).")
+            return result
+
+    def _attempt(self, backend, partner, fn, errors):
+        """Chama ``backend``; com ``partner``, dispara o hedge no atraso do p95."""
+        started = time.perf_counter()
+        running = {self._submit(backend, fn): (backend, started, started + backend.timeout)}
+        hedge_at = started + backend.hedge_delay() if partner is not None else None
+        hedged = False
+        while running:
+            now = time.perf_counter()
+            timeout = min(d for _, _, d in running.values()) - now
+            if hedge_at is not None:
+                timeout = min(timeout, hedge_at - now)
+            done, _ = wait(running, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                owner, owner_started, _ = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self._fail(owner, "error", e, owner_started)
+                    errors.append((owner.name, e))
+                    continue
+                owner.record("ok", time.perf_counter() - owner_started)
+                if hedged:
+                    owner.record("hedge_won")
+                for other, (loser, loser_started, _) in running.items():
+                    self._finish_late(other, loser, loser_started, settle=True)
+                return result, owner
+
+            now = time.perf_counter()
+            for future, (owner, owner_started, owner_deadline) in list(running.items()):
+                if now >= owner_deadline:
+                    running.pop(future)
+                    self._fail(owner, "timeout", f"prazo de {owner.timeout:g}s", owner_started)
+                    errors.append((owner.name, TimeoutError(f"prazo de {owner.timeout:g}s")))
+                    self._finish_late(future, owner, owner_started, settle=False)
+
+            if hedge_at is not None and now >= hedge_at and running:
+                hedge_at = None
+                if partner.breaker.allow():
+                    hedged = True
+                    backend.record("hedge_fired")
+                    self._logger.info(
+                        f"LLM '{backend.name}' sem resposta em {now - started:.2f}s; hedge para '{partner.name}'."
+                    )
+                    running[self._submit(partner, fn)] = (partner, now, now + partner.timeout)
+        raise _AttemptFailed(hedged)
+
+    def _finish_late(self, future, backend, started, settle):
+        """Chamada que terminou depois da decisão: entra na latência e, se ``settle``, no breaker.
+
+        ``settle`` é falso para chamadas que já contaram como prazo estourado.
+        """
+        def done(f):
+            if f.exception() is None:
+                backend._latencies.append(time.perf_counter() - started)
+                if settle:
+                    backend.breaker.success()
+            elif settle:
+                backend.breaker.failure()
+        future.add_done_callback(done)
+
+    def _route_stream(self, open_stream):
+        """Fallback só até o primeiro trecho; depois o stream segue no backend escolhido."""
+        errors = []
+        candidates = list(self._backends)
+        while (backend := self._next_allowed(candidates)) is not None:
+            started = time.perf_counter()
+            future = self._submit(backend, lambda llm: _first_chunk(open_stream(llm)))
+            try:
+                first, rest = future.result(timeout=backend.timeout)
+            except Exception as e:
+                outcome = "timeout" if isinstance(e, (TimeoutError, FutureTimeout)) else "error"
+                self._fail(backend, outcome, e, started)
+                errors.append((backend.name, e))
+                continue
+            backend.record("ok", time.perf_counter() - started)
+            metrics.set_llm_backend(backend.name)
+            return _chain(first, rest)
+        raise self._unavailable(errors)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self._route(lambda llm: llm.complete(prompt, formatted=formatted, **kwargs))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self._route_stream(lambda llm: llm.stream_complete(prompt, formatted=formatted, **kwargs))
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self._route(lambda llm: llm.chat(messages, **kwargs))
+
+    # --- assíncrono ---
+    async def _aroute(self, make_coro):
+        errors = []
+        candidates = list(self._backends)
+        while True:
+            backend = self._next_allowed(candidates)
+            if backend is None:
+                raise self._unavailable(errors)
+            partner = candidates[0] if self._hedge and candidates else None
+            try:
+                result, winner = await self._aattempt(backend, partner, make_coro, errors)
+            except _AttemptFailed as e:
+                if e.partner_used:
+                    candidates.pop(0)
+                continue
+            metrics.set_llm_backend(winner.name)
+            if errors or winner is not backend:
+                self._logger.info(f"LLM respondido por '{winner.name}' ({'hedge' if winner is not backend else 'fallback'}).")
+            return result
+
+    async def _aattempt(self, backend, partner, make_coro, errors):
+        started = time.perf_counter()
+        running = {asyncio.ensure_future(make_coro(backend.llm)): (backend, started, started + backend.timeout)}
+        hedge_at = started + backend.hedge_delay() if partner is not None else None
+        hedged = False
+        try:
+            while running:
+                now = time.perf_counter()
+                timeout = min(d for _, _, d in running.values()) - now
+                if hedge_at is not None:
+                    timeout = min(timeout, hedge_at - now)
+                done, _ = await asyncio.wait(running, timeout=max(0.0, timeout),
+                                             return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    owner, owner_started, _ = running.pop(task)
+                    if task.exception() is not None:
+                        self._fail(owner, "error", task.exception(), owner_started)
+                        errors.append((owner.name, task.exception()))
+                        continue
+                    owner.record("ok", time.perf_counter() - owner_started)
+                    if hedged:
+                        owner.record("hedge_won")
+                    return task.result(), owner
+
+                now = time.perf_counter()
+                for task, (owner, owner_started, owner_deadline) in list(running.items()):
+                    if now >= owner_deadline:
+                        running.pop(task)
+                        task.cancel()
+                        self._fail(owner, "timeout", f"prazo de {owner.timeout:g}s", owner_started)
+                        errors.append((owner.name, TimeoutError(f"prazo de {owner.timeout:g}s")))
+
+                if hedge_at is not None and now >= hedge_at and running:
+                    hedge_at = None
+                    if partner.breaker.allow():
+                        hedged = True
+                        backend.record("hedge_fired")
+                        self._logger.info(
+                            f"LLM '{backend.name}' sem resposta em {now - started:.2f}s; hedge para '{partner.name}'."
+                        )
+                        running[asyncio.ensure_future(make_coro(partner.llm))] = (partner, now, now + partner.timeout)
+            raise _AttemptFailed(hedged)
+        finally:
+            # Perdedor do hedge (ou requisição cancelada): no async a chamada é cancelada de fato
+            for task, (owner, _, _) in running.items():
+                task.cancel()
+                owner.breaker.release()
+
+    async def _aroute_stream(self, open_stream):
+        errors = []
+        candidates = list(self._backends)
+        while (backend := self._next_allowed(candidates)) is not None:
+            started = time.perf_counter()
+            try:
+                stream = await asyncio.wait_for(open_stream(backend.llm), backend.timeout)
+                first = await asyncio.wait_for(
+                    stream.__anext__(), max(0.0, backend.timeout - (time.perf_counter() - started))
+                )
+            except Exception as e:
+                outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                self._fail(backend, outcome, e, started)
+                errors.append((backend.name, e))
+                continue
+            backend.record("ok", time.perf_counter() - started)
+            metrics.set_llm_backend(backend.name)
+            return _achain(first, stream)
+        raise self._unavailable(errors)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return await self._aroute(lambda llm: llm.acomplete(prompt, formatted=formatted, **kwargs))
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return await self._aroute_stream(lambda llm: llm.astream_complete(prompt, formatted=formatted, **kwargs))
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return await self._aroute(lambda llm: llm.achat(messages, **kwargs))
+
+
+class _AttemptFailed(Exception):
+    def __init__(self, partner_used):
+        super().__init__()
+        self.partner_used = partner_used
+
+
+def _first_chunk(stream):
+    stream = iter(stream)
+    return next(stream), stream
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+async def _achain(first, rest):
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+
+def create_backend(name, logger, gemini_model=None, gemini_api_key=None, gemini_api_base=None,
+                   gemini_transport=None, ollama_model=None, ollama_base_url=None):
+    """Instancia o LLM de um backend; as integrações só são importadas se usadas.
+
+    ``gemini_transport="rest"`` evita o gRPC (que não suporta fork); com
+    ``gemini_api_base`` o transporte é sempre REST.
+    """
+    if name == "gemini":
+        from llama_index.llms.gemini import Gemini
+
+        if not gemini_api_key:
+            raise ValueError("GEMINI_API_KEY não encontrada")
+        client = {"transport": gemini_transport} if gemini_transport else {}
+        if gemini_api_base:
+            client = {"api_base": gemini_api_base, "transport": "rest"}
+
+        def factory():
+            return Gemini(model_name=gemini_model, api_key=gemini_api_key, **client)
+    elif name == "ollama":
+        from llama_index.llms.ollama import Ollama
+
+        def factory():
+            # O prazo do roteador vale antes; o do cliente só evita conexões penduradas
+            return Ollama(model=ollama_model, base_url=ollama_base_url,
+                          request_timeout=max(180.0, backend_timeout(name)))
+    else:
+        raise ValueError(f"Backend de LLM desconhecido: {name}")
+    backend = LLMBackend(name, factory(), factory=factory)
+    logger.info(f"Backend de LLM '{name}' configurado (prazo {backend_timeout(name):.0f}s).")
+    return backend
+
+
+def create_router(names, logger, hedge=LLM_HEDGE, **config):
+    """RouterLLM com os backends de ``names`` que puderam ser criados, na mesma ordem."""
+    backends = []
+    for name in names:
+        try:
+            backends.append(create_backend(name, logger, **config))
+        except Exception as e:
+            logger.warning(f"Backend de LLM '{name}' ignorado: {e}")
+    if not backends:
+        raise LLMUnavailable(f"Nenhum backend de LLM pôde ser configurado ({', '.join(names)}).")
+    router = RouterLLM(backends, hedge=hedge, logger=logger)
+    logger.info(f"Roteador de LLM: {' -> '.join(b.name for b in backends)}, hedge {'ativo' if hedge else 'inativo'}.")
+    return router
@@ -0,0 +1,398 @@
+"""Métricas do pipeline (formato de texto do Prometheus) e ID de requisição nos logs.
+
+    chatbot_requests_total{endpoint,status}   requisições HTTP
+    chatbot_request_seconds{endpoint}         latência total da requisição
+    chatbot_stage_seconds{stage}              cache, embedding, retrieval, synthesis,
+                                              llm, prompt_assembly (= synthesis - llm), first_token,
+                                              context (montagem do contexto, dentro de retrieval),
+                                              coalesce_wait (espera por pergunta igual em andamento)
+    chatbot_errors_total{stage}               exceções por etapa
+    chatbot_cache_lookups_total{result}       hit_exact, hit_semantic, miss
+    chatbot_retrieved_chunks                  nós recuperados por pergunta
+    chatbot_llm_tokens{kind}                  tokens de prompt/completion por chamada ao LLM
+    chatbot_coalesced_requests_total{scope}   perguntas que esperaram outra igual em andamento
+                                              (single_flight.py): local ou worker
+    chatbot_llm_route_total{backend,outcome}  decisões do roteador de LLM (llm_router.py): ok, error,
+                                              timeout, breaker_open, hedge_fired, hedge_won
+    chatbot_llm_backend_seconds{backend}      latência das chamadas bem-sucedidas por backend
+    chatbot_context_tokens{phase}             tokens de contexto antes/depois da montagem
+                                              (context_assembly.py)
+
+O tempo e os tokens do LLM vêm dos eventos de instrumentação do LlamaIndex
+(início/fim de chat ou completion), então valem para Gemini e Ollama sem
+mexer nas classes de LLM. Os tokens são os informados pela API na resposta.
+
+Cada etapa custa duas leituras de relógio e uma busca binária nos buckets,
+sob um lock por métrica. As métricas são por processo: com vários workers do
+gunicorn cada um expõe as suas em /metrics.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import (
+    LLMChatEndEvent,
+    LLMChatStartEvent,
+    LLMCompletionEndEvent,
+    LLMCompletionStartEvent,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+CHUNK_BUCKETS = (0, 1, 2, 3, 5, 8, 10, 15, 20, 30)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_request_id = contextvars.ContextVar("request_id", default="-")
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+# Tempo de LLM acumulado dentro da etapa de síntese atual (ver synthesis_stage)
+_llm_seconds = contextvars.ContextVar("llm_seconds", default=None)
+# Chamada ao LLM em andamento neste contexto (ver LLMMetricsHandler)
+_llm_call = contextvars.ContextVar("llm_call", default=None)
+# O acumulador da requisição é compartilhado pelas threads do /ask/batch (contexto copiado)
+_stats_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=""):
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [contagens por bucket (+Inf no fim), soma]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(n, "") for n in self.labelnames))
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+REQUESTS = Counter("chatbot_requests_total", "Requisições HTTP por endpoint e status.", ("endpoint", "status"))
+REQUEST_SECONDS = Histogram("chatbot_request_seconds", "Latência das requisições HTTP.", ("endpoint",))
+STAGE_SECONDS = Histogram("chatbot_stage_seconds", "Duração de cada etapa do pipeline RAG.", ("stage",))
+ERRORS = Counter("chatbot_errors_total", "Exceções por etapa do pipeline.", ("stage",))
+CACHE_LOOKUPS = Counter("chatbot_cache_lookups_total", "Consultas ao cache de respostas.", ("result",))
+RETRIEVED_CHUNKS = Histogram("chatbot_retrieved_chunks", "Nós recuperados por pergunta.", buckets=CHUNK_BUCKETS)
+LLM_TOKENS = Histogram("chatbot_llm_tokens", "Tokens por chamada ao LLM.", ("kind",), buckets=TOKEN_BUCKETS)
+COALESCED = Counter("chatbot_coalesced_requests_total", "Perguntas atendidas por outra igual em andamento.",
+                    ("scope",))
+LLM_ROUTE = Counter("chatbot_llm_route_total", "Decisões do roteador de LLM por backend.",
+                    ("backend", "outcome"))
+LLM_BACKEND_SECONDS = Histogram("chatbot_llm_backend_seconds", "Latência das chamadas por backend de LLM.",
+                                ("backend",))
+CONTEXT_TOKENS = Histogram("chatbot_context_tokens", "Tokens de contexto antes/depois da montagem.", ("phase",),
+                           buckets=TOKEN_BUCKETS)
+METRICS = [REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, ERRORS, CACHE_LOOKUPS, RETRIEVED_CHUNKS, LLM_TOKENS,
+           COALESCED, LLM_ROUTE, LLM_BACKEND_SECONDS, CONTEXT_TOKENS]
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# --- Contexto da requisição ---
+def new_request(request_id=None):
+    """Inicia o contexto de uma requisição (ID + acumulador das etapas) e devolve o ID."""
+    request_id = request_id or uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    _request_stats.set({"stages": {}})
+    _llm_call.set(None)
+    return request_id
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def request_stats():
+    return _request_stats.get()
+
+
+def _record(key, value):
+    stats = _request_stats.get()
+    if stats is not None:
+        with _stats_lock:
+            stats[key] = stats.get(key, 0) + value
+
+
+def observe_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    stats = _request_stats.get()
+    if stats is not None:
+        with _stats_lock:
+            stats["stages"][name] = stats["stages"].get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage=name)
+        raise
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+@contextmanager
+def synthesis_stage():
+    """Etapa de síntese; o que não é chamada ao LLM entra como ``prompt_assembly``."""
+    llm_seconds = [0.0]
+    token = _llm_seconds.set(llm_seconds)
+    _llm_call.set(None)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage="synthesis")
+        raise
+    finally:
+        _llm_seconds.reset(token)
+        elapsed = time.perf_counter() - start
+        observe_stage("synthesis", elapsed)
+        observe_stage("prompt_assembly", max(0.0, elapsed - llm_seconds[0]))
+
+
+def count_cache(result):
+    CACHE_LOOKUPS.inc(result=result)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats["cache"] = result
+
+
+def count_coalesced(scope):
+    COALESCED.inc(scope=scope)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats["coalesced"] = scope
+
+
+def observe_llm_route(backend, outcome, seconds=None):
+    LLM_ROUTE.inc(backend=backend, outcome=outcome)
+    if seconds is not None:
+        LLM_BACKEND_SECONDS.observe(seconds, backend=backend)
+
+
+def set_llm_backend(name):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats["llm_backend"] = name
+
+
+def observe_chunks(n):
+    RETRIEVED_CHUNKS.observe(n)
+    _record("chunks", n)
+
+
+def observe_context(before, after):
+    CONTEXT_TOKENS.observe(before, phase="before")
+    CONTEXT_TOKENS.observe(after, phase="after")
+    _record("context_tokens", after)
+
+
+def observe_tokens(prompt_tokens, completion_tokens):
+    if prompt_tokens is not None:
+        LLM_TOKENS.observe(prompt_tokens, kind="prompt")
+        _record("prompt_tokens", prompt_tokens)
+    if completion_tokens is not None:
+        LLM_TOKENS.observe(completion_tokens, kind="completion")
+        _record("completion_tokens", completion_tokens)
+
+
+class RequestIdFilter(logging.Filter):
+    """Inclui ``request_id`` em todo registro de log (use ``%(request_id)s`` no formato)."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+def request_summary(endpoint, status, seconds):
+    """Linha de log estruturada (JSON) com as etapas, tokens e cache da requisição."""
+    stats = _request_stats.get() or {"stages": {}}
+    summary = {
+        "event": "request",
+        "request_id": _request_id.get(),
+        "endpoint": endpoint,
+        "status": status,
+        "duration_ms": round(seconds * 1000, 1),
+        "stages_ms": {name: round(s * 1000, 1) for name, s in stats["stages"].items()},
+    }
+    for key in ("cache", "coalesced", "chunks", "context_tokens", "llm_backend", "prompt_tokens",
+                "completion_tokens"):
+        if key in stats:
+            summary[key] = stats[key]
+    return json.dumps(summary, ensure_ascii=False)
+
+
+# --- Instrumentação do LLM (eventos do LlamaIndex) ---
+def _as_dict(obj):
+    if isinstance(obj, dict):
+        return obj
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    return {}
+
+
+def token_usage(response):
+    """(tokens do prompt, tokens gerados) informados pela API, ou (None, None)."""
+    for source in (getattr(response, "raw", None), getattr(response, "additional_kwargs", None)):
+        source = _as_dict(source) if source is not None else {}
+        usage = source.get("usage_metadata")  # Gemini
+        if usage:
+            usage = _as_dict(usage)
+            return usage.get("prompt_token_count"), usage.get("candidates_token_count")
+        if "prompt_eval_count" in source or "eval_count" in source:  # Ollama
+            return source.get("prompt_eval_count"), source.get("eval_count")
+        usage = source.get("usage")  # APIs no formato OpenAI
+        if usage:
+            usage = _as_dict(usage)
+            return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return None, None
+
+
+class LLMMetricsHandler(BaseEventHandler):
+    """Mede cada chamada ao LLM (evento de início -> fim do mesmo span) e os tokens."""
+
+    @classmethod
+    def class_name(cls):
+        return "LLMMetricsHandler"
+
+    def handle(self, event, **kwargs):
+        if isinstance(event, (LLMChatStartEvent, LLMCompletionStartEvent)):
+            # O chat() de alguns LLMs chama o complete() por dentro: só a chamada externa conta
+            if _llm_call.get() is None:
+                _llm_call.set({"span_id": event.span_id, "start": time.perf_counter(), "tokens": False})
+        elif isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)):
+            call = _llm_call.get()
+            if call is None:
+                return
+            if not call["tokens"] and event.response is not None:
+                prompt_tokens, completion_tokens = token_usage(event.response)
+                if prompt_tokens is not None or completion_tokens is not None:
+                    observe_tokens(prompt_tokens, completion_tokens)
+                    call["tokens"] = True
+            if event.span_id == call["span_id"]:
+                _llm_call.set(None)
+                elapsed = time.perf_counter() - call["start"]
+                observe_stage("llm", elapsed)
+                llm_seconds = _llm_seconds.get()
+                if llm_seconds is not None:
+                    llm_seconds[0] += elapsed
+
+
+_llm_handler = None
+
+
+def install_llm_instrumentation():
+    """Registra o handler de eventos do LLM no dispatcher raiz (uma vez por processo)."""
+    global _llm_handler
+    if _llm_handler is None:
+        _llm_handler = LLMMetricsHandler()
+        get_dispatcher().add_event_handler(_llm_handler)
+
+
+# --- Flask ---
+def register_metrics_routes(app):
+    """ID de requisição (header X-Request-ID), latência por endpoint e GET /metrics."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_request():
+        g.metrics_start = time.perf_counter()
+        new_request(request.headers.get("X-Request-ID"))
+
+    @app.after_request
+    def finish_request(response):
+        endpoint = request.url_rule.rule if request.url_rule is not None else "other"
+        start = g.get("metrics_start", time.perf_counter())
+        response.headers["X-Request-ID"] = current_request_id()
+
+        def record():
+            seconds = time.perf_counter() - start
+            REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+            REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+            if endpoint.startswith("/ask"):
+                app.logger.info(request_summary(endpoint, response.status_code, seconds))
+
+        if response.is_streamed:
+            # O corpo (/ask/stream) ainda não foi gerado: latência e etapas fecham no fim do stream
+            response.call_on_close(record)
+        else:
+            record()
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,151 @@
+"""Persistência binária do índice vetorial, lida via mmap.
+
+Layout do diretório:
+    manifest.json   -> metadados pequenos (versão, nº de nós, dimensão, dtype)
+    embeddings.bin  -> matriz contígua (n_nós x dim) em float32/float16, linhas normalizadas
+    nodes.idx       -> offsets uint64 (n_nós + 1) dentro de nodes.bin
+    nodes.bin       -> registros JSON (texto + metadados de cada nó) concatenados
+    lexical/        -> índice BM25 dos textos dos nós (ver lexical_index.py)
+    codes.bin       -> opcional: códigos int8/binários dos embeddings (ver quantization.py)
+
+Todos os arquivos são abertos somente-leitura com np.memmap, então vários
+workers do gunicorn compartilham as mesmas páginas do cache do sistema.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.bin"
+OFFSETS_FILE = "nodes.idx"
+NODES_FILE = "nodes.bin"
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def normalize_rows(matrix):
+    """Normaliza cada linha (norma L2) para que similaridade de cosseno vire produto escalar."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def write_store(out_dir, nodes, embeddings, dtype="float32", extra_manifest=None, lexical=True,
+                quantization=None):
+    """Grava nós e embeddings no formato binário.
+
+    A escrita acontece num diretório temporário que só substitui ``out_dir``
+    no final, para que um worker nunca abra um índice pela metade. Com
+    ``lexical`` o índice BM25 é gravado junto, na mesma troca; com
+    ``quantization`` (int8 ou binary), os códigos compactos dos embeddings.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype não suportado: {dtype} (use {SUPPORTED_DTYPES})")
+    matrix = normalize_rows(embeddings)
+    if matrix.ndim != 2 or matrix.shape[0] != len(nodes):
+        raise ValueError(
+            f"Embeddings com formato {matrix.shape} não batem com {len(nodes)} nós."
+        )
+
+    out_dir = os.path.abspath(out_dir)
+    tmp_dir = out_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    matrix.astype(dtype).tofile(os.path.join(tmp_dir, EMBEDDINGS_FILE))
+
+    offsets = np.zeros(len(nodes) + 1, dtype=np.uint64)
+    with open(os.path.join(tmp_dir, NODES_FILE), "wb") as f:
+        for i, node in enumerate(nodes):
+            node_json = doc_to_json(node)
+            # O embedding já está na matriz; não duplicar no blob.
+            node_json["__data__"]["embedding"] = None
+            record = json.dumps(node_json, ensure_ascii=False).encode("utf-8")
+            f.write(record)
+            offsets[i + 1] = offsets[i] + len(record)
+    offsets.tofile(os.path.join(tmp_dir, OFFSETS_FILE))
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "dtype": dtype,
+        "normalized": True,
+    }
+    if lexical:
+        from lexical_index import LEXICAL_DIR, LexicalIndex
+
+        manifest["lexical"] = LexicalIndex.from_nodes(nodes).write(os.path.join(tmp_dir, LEXICAL_DIR))
+    if quantization:
+        from quantization import QuantizedCodes
+
+        manifest["quantization"] = QuantizedCodes.from_matrix(matrix, quantization).write(tmp_dir)
+    manifest.update(extra_manifest or {})
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    old_dir = out_dir + ".old"
+    if os.path.exists(out_dir):
+        if os.path.exists(old_dir):
+            shutil.rmtree(old_dir)
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    return manifest
+
+
+class MmapNodeStore:
+    """Acesso somente-leitura a um diretório gravado por ``write_store``."""
+
+    def __init__(self, path, manifest, embeddings, offsets, blob):
+        self.path = path
+        self.manifest = manifest
+        self.embeddings = embeddings
+        self._offsets = offsets
+        self._blob = blob
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Versão de formato {manifest.get('format_version')} não suportada em '{path}'."
+            )
+        count, dim = manifest["count"], manifest["dim"]
+        embeddings = np.memmap(
+            os.path.join(path, EMBEDDINGS_FILE),
+            dtype=manifest["dtype"],
+            mode="r",
+            shape=(count, dim),
+        )
+        offsets = np.memmap(
+            os.path.join(path, OFFSETS_FILE), dtype=np.uint64, mode="r", shape=(count + 1,)
+        )
+        blob = np.memmap(os.path.join(path, NODES_FILE), dtype=np.uint8, mode="r")
+        return cls(path, manifest, embeddings, offsets, blob)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    @property
+    def dim(self):
+        return self.manifest["dim"]
+
+    def get_node(self, i):
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return json_to_doc(json.loads(self._blob[start:end].tobytes().decode("utf-8")))
+
+    def get_nodes(self, indices):
+        return [self.get_node(int(i)) for i in indices]
+
@@ -0,0 +1,123 @@
+"""Retriever top-k vetorizado com NumPy.
+
+Substitui a varredura nó a nó do SimpleVectorStore (``get_top_k_embeddings``)
+por um único produto matriz-vetor sobre a matriz de embeddings normalizada e
+seleção com ``argpartition``. Aceita também um lote de consultas de uma vez.
+"""
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from mmap_store import normalize_rows
+
+# Matrizes float16 são convertidas para float32 em blocos, para não alocar
+# uma cópia da matriz inteira a cada consulta.
+SCORE_BLOCK_ROWS = 65536
+
+
+def top_k_indices(scores, k):
+    """Índices dos k maiores valores de cada linha de ``scores``, em ordem decrescente."""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(n), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class NumpyRetriever(BaseRetriever):
+    """Retriever por similaridade de cosseno sobre uma matriz de embeddings.
+
+    ``embeddings`` pode ser um np.memmap (formato de mmap_store) ou um array
+    em memória; ``get_nodes`` recebe uma lista de posições e devolve os nós.
+    """
+
+    # Busca exata sobre a matriz float (ver quantization.py para a quantizada)
+    quantization = None
+
+    def __init__(self, embeddings, get_nodes, similarity_top_k=DEFAULT_SIMILARITY_TOP_K,
+                 embed_model=None, normalized=False):
+        super().__init__()
+        self._embeddings = embeddings if normalized else normalize_rows(embeddings)
+        self._get_nodes = get_nodes
+        self._similarity_top_k = similarity_top_k
+        self._embed_model = embed_model
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        """A partir de um MmapNodeStore (embeddings já normalizados no disco)."""
+        return cls(store.embeddings, store.get_nodes,
+                   normalized=store.manifest.get("normalized", False), **kwargs)
+
+    @classmethod
+    def from_index(cls, index, **kwargs):
+        """A partir de um VectorStoreIndex carregado do diretório JSON (SimpleVectorStore)."""
+        embedding_dict = index.vector_store.data.embedding_dict
+        node_ids = list(embedding_dict)
+        matrix = np.array([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32)
+        docstore = index.docstore
+
+        def get_nodes(indices):
+            return docstore.get_nodes([node_ids[int(i)] for i in indices])
+
+        return cls(matrix, get_nodes, **kwargs)
+
+    @property
+    def similarity_top_k(self):
+        return self._similarity_top_k
+
+    def __len__(self):
+        return self._embeddings.shape[0]
+
+    def score(self, query_embeddings):
+        """Similaridade de cosseno (lote_consultas x n_nós)."""
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+        matrix = self._embeddings
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        scores = np.empty((queries.shape[0], matrix.shape[0]), dtype=np.float32)
+        for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + block.shape[0]] = queries @ block.T
+        return scores
+
+    def top_k(self, query_embeddings, k=None):
+        """Devolve (índices, scores), ambos com formato (lote_consultas, k)."""
+        scores = self.score(query_embeddings)
+        indices = top_k_indices(scores, k or self._similarity_top_k)
+        return indices, np.take_along_axis(scores, indices, axis=1)
+
+    def _embed_query(self, query_bundle):
+        if query_bundle.embedding is None:
+            embed_model = self._embed_model or Settings.embed_model
+            query_bundle.embedding = embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        return query_bundle.embedding
+
+    def _to_nodes_with_score(self, indices, scores):
+        nodes = self._get_nodes(indices)
+        return [NodeWithScore(node=node, score=float(s)) for node, s in zip(nodes, scores)]
+
+    def _retrieve(self, query_bundle):
+        indices, scores = self.top_k(self._embed_query(query_bundle))
+        return self._to_nodes_with_score(indices[0], scores[0])
+
+    def retrieve_batch(self, queries):
+        """Recupera para várias consultas numa única multiplicação de matrizes.
+
+        ``queries`` pode conter strings ou QueryBundles (com ou sem embedding).
+        """
+        bundles = [QueryBundle(q) if isinstance(q, str) else q for q in queries]
+        if not bundles:
+            return []
+        embeddings = [self._embed_query(bundle) for bundle in bundles]
+        indices, scores = self.top_k(embeddings)
+        return [self._to_nodes_with_score(i, s) for i, s in zip(indices, scores)]
@@ -0,0 +1,240 @@
+"""Embeddings quantizados (int8 ou binários) com re-ranqueamento exato.
+
+Com o índice mmap, a busca passa a ter duas etapas:
+    1. varredura grosseira sobre os códigos compactos (``codes.bin``), que
+       ficam residentes: 1 byte por dimensão no int8, 1 bit no binário;
+    2. os ``QUANT_RESCORE_CANDIDATES`` melhores da etapa 1 são re-pontuados
+       com os vetores float de ``embeddings.bin``. Só as linhas desses
+       candidatos são lidas, com ``os.pread`` em vez do memmap: ler pelo
+       memmap mapearia no processo também as páginas vizinhas (fault-around
+       e readahead do kernel) e o RSS cresceria até a matriz inteira. Lidas
+       assim, as linhas ficam só no cache de páginas, que o kernel pode
+       liberar.
+
+Códigos:
+    int8   -> cada linha (já normalizada) dividida pelo seu maior |valor| e
+              escalada para [-127, 127]; a escala por linha vai em
+              ``code_scales.bin`` (float32). Score grosseiro = escala x (consulta . código).
+    binary -> bit de sinal de cada dimensão (np.packbits). Score grosseiro =
+              consulta float . sinais (+1/-1), somado byte a byte por uma
+              tabela de 256 valores por byte montada para cada consulta; a
+              consulta não é binarizada, o que ordena bem melhor que a
+              distância de Hamming.
+
+``EMBEDDING_QUANTIZATION`` escolhe o modo no boot:
+    auto (padrão) -> usa os códigos gravados no índice, se houver;
+    none          -> busca exata sobre a matriz float (NumpyRetriever);
+    int8/binary   -> usa os códigos do índice ou, se faltarem, quantiza no boot.
+Os códigos são gravados por ``convert_storage.py``/``reindex.py --quantization``.
+
+O binary só é servido com ``QUANT_ALLOW_BINARY=1``: no eval_quantization.py
+(vetores substitutos, não embeddings e5 reais) a varredura levou ~6,5 ms por
+consulta contra ~0,65 ms da busca exata, com recall@5 de 0,33 com 10
+candidatos. Ele só compensa quando a memória é o limite.
+"""
+import os
+
+import numpy as np
+
+from mmap_store import EMBEDDINGS_FILE, normalize_rows
+from numpy_retriever import NumpyRetriever, top_k_indices
+
+QUANTIZATION_KINDS = ("int8", "binary")
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "auto")
+QUANT_RESCORE_CANDIDATES = int(os.getenv("QUANT_RESCORE_CANDIDATES", "100"))
+# Busca binária: ~10x mais lenta que a exata (ver docstring); precisa ser pedida explicitamente
+QUANT_ALLOW_BINARY = os.getenv("QUANT_ALLOW_BINARY", "0") == "1"
+# Blocos menores que os da matriz float: a conversão de cada bloco para
+# float32 é a maior alocação temporária da busca
+QUANT_BLOCK_ROWS = 4096
+CODES_FILE = "codes.bin"
+SCALES_FILE = "code_scales.bin"
+
+# Sinais (+1/-1) dos 8 bits de cada valor de byte, na ordem do np.packbits
+_BYTE_SIGNS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(np.float32) * 2 - 1
+
+
+def resolve_quantization(setting, manifest=None, allow_binary=QUANT_ALLOW_BINARY):
+    """Tipo de código a usar (ou None) para ``EMBEDDING_QUANTIZATION`` e o manifest do índice."""
+    if setting == "auto":
+        kind = ((manifest or {}).get("quantization") or {}).get("kind")
+    elif setting == "none":
+        return None
+    elif setting not in QUANTIZATION_KINDS:
+        raise ValueError(
+            f"EMBEDDING_QUANTIZATION inválido: {setting} (use auto, none, {', '.join(QUANTIZATION_KINDS)})"
+        )
+    else:
+        kind = setting
+    if kind == "binary" and not allow_binary:
+        raise ValueError(
+            "Busca binária desativada: ~10x mais lenta que a busca exata (~6,5 ms x ~0,65 ms por consulta) "
+            "e recall@5 de 0,33 com 10 candidatos no eval_quantization.py. Use int8, "
+            "EMBEDDING_QUANTIZATION=none, ou QUANT_ALLOW_BINARY=1 se a memória for o limite."
+        )
+    return kind
+
+
+def _quantize_block(block, kind):
+    if kind == "binary":
+        return np.packbits(block > 0, axis=1), None
+    peak = np.abs(block).max(axis=1, keepdims=True)
+    peak[peak == 0] = 1.0
+    codes = np.rint(block / peak * 127).astype(np.int8)
+    return codes, (peak[:, 0] / 127).astype(np.float32)
+
+
+class QuantizedCodes:
+    """Códigos compactos das linhas de uma matriz de embeddings normalizada."""
+
+    def __init__(self, kind, codes, scales, dim):
+        self.kind = kind
+        self.codes = codes
+        self.scales = scales
+        self.dim = dim
+
+    @classmethod
+    def from_matrix(cls, matrix, kind):
+        """Quantiza em blocos, sem converter a matriz inteira para float32 de uma vez."""
+        if kind not in QUANTIZATION_KINDS:
+            raise ValueError(f"Quantização não suportada: {kind} (use {QUANTIZATION_KINDS})")
+        count, dim = matrix.shape
+        width = (dim + 7) // 8 if kind == "binary" else dim
+        codes = np.empty((count, width), dtype=np.uint8 if kind == "binary" else np.int8)
+        scales = None if kind == "binary" else np.empty(count, dtype=np.float32)
+        for start in range(0, count, QUANT_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + QUANT_BLOCK_ROWS], dtype=np.float32)
+            block_codes, block_scales = _quantize_block(block, kind)
+            codes[start:start + block.shape[0]] = block_codes
+            if scales is not None:
+                scales[start:start + block.shape[0]] = block_scales
+        return cls(kind, codes, scales, dim)
+
+    @classmethod
+    def open(cls, path, manifest):
+        """Códigos gravados por ``write`` no diretório do índice mmap."""
+        kind = manifest["quantization"]["kind"]
+        count, dim = manifest["count"], manifest["dim"]
+        width = (dim + 7) // 8 if kind == "binary" else dim
+        codes = np.memmap(
+            os.path.join(path, CODES_FILE),
+            dtype=np.uint8 if kind == "binary" else np.int8,
+            mode="r",
+            shape=(count, width),
+        )
+        scales = None
+        if kind == "int8":
+            scales = np.memmap(os.path.join(path, SCALES_FILE), dtype=np.float32, mode="r", shape=(count,))
+        return cls(kind, codes, scales, dim)
+
+    def write(self, out_dir):
+        """Grava os códigos em ``out_dir``; devolve a entrada ``quantization`` do manifest."""
+        np.ascontiguousarray(self.codes).tofile(os.path.join(out_dir, CODES_FILE))
+        if self.scales is not None:
+            np.asarray(self.scales, dtype=np.float32).tofile(os.path.join(out_dir, SCALES_FILE))
+        return {"kind": self.kind, "bytes_per_vector": self.bytes_per_vector}
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @property
+    def bytes_per_vector(self):
+        return self.codes.shape[1] + (4 if self.scales is not None else 0)
+
+    @property
+    def nbytes(self):
+        return len(self) * self.bytes_per_vector
+
+    def score(self, queries):
+        """Scores aproximados (lote_consultas x n_nós) para consultas já normalizadas."""
+        count = len(self)
+        scores = np.empty((queries.shape[0], count), dtype=np.float32)
+        if self.kind == "binary":
+            # tables[q, 256 x byte + valor]: contribuição do byte com esse valor para a consulta q
+            width = self.codes.shape[1]
+            padded = np.zeros((queries.shape[0], width * 8), dtype=np.float32)
+            padded[:, :queries.shape[1]] = queries
+            tables = (padded.reshape(queries.shape[0], width, 8) @ _BYTE_SIGNS.T).reshape(queries.shape[0], -1)
+            offsets = np.arange(width, dtype=np.intp) * 256
+        for start in range(0, count, QUANT_BLOCK_ROWS):
+            block = np.asarray(self.codes[start:start + QUANT_BLOCK_ROWS])
+            end = start + block.shape[0]
+            if self.kind == "binary":
+                positions = block + offsets
+                for row, table in enumerate(tables):
+                    scores[row, start:end] = table[positions].sum(axis=1)
+            else:
+                scores[:, start:end] = (queries @ block.astype(np.float32).T) * self.scales[start:end]
+        return scores
+
+
+class QuantizedRetriever(NumpyRetriever):
+    """NumpyRetriever com varredura sobre códigos quantizados e re-ranqueamento exato.
+
+    ``embeddings`` (float) só é lido nas linhas dos candidatos; com
+    ``embeddings_path`` (o ``embeddings.bin`` do índice), por ``os.pread``.
+    Sem ``codes``, quantiza ``embeddings`` no boot.
+    """
+
+    def __init__(self, embeddings, get_nodes, kind="int8", codes=None,
+                 candidates=QUANT_RESCORE_CANDIDATES, embeddings_path=None, **kwargs):
+        super().__init__(embeddings, get_nodes, **kwargs)
+        self._codes = codes if codes is not None else QuantizedCodes.from_matrix(self._embeddings, kind)
+        self._candidates = candidates
+        self._fd = os.open(embeddings_path, os.O_RDONLY) if embeddings_path else None
+
+    @classmethod
+    def from_store(cls, store, kind=None, **kwargs):
+        """A partir de um MmapNodeStore; usa os códigos do disco se forem do tipo pedido."""
+        stored = (store.manifest.get("quantization") or {}).get("kind")
+        kind = kind or stored or "int8"
+        codes = QuantizedCodes.open(store.path, store.manifest) if kind == stored else None
+        return cls(store.embeddings, store.get_nodes, kind=kind, codes=codes,
+                   embeddings_path=os.path.join(store.path, EMBEDDINGS_FILE),
+                   normalized=store.manifest.get("normalized", False), **kwargs)
+
+    @property
+    def quantization(self):
+        return self._codes.kind
+
+    @property
+    def codes(self):
+        return self._codes
+
+    def memory_stats(self):
+        """Bytes por vetor dos códigos (residentes) x da matriz float (lida só no re-ranqueamento)."""
+        float_bytes = self._embeddings.shape[1] * self._embeddings.dtype.itemsize
+        return {
+            "quantization": self._codes.kind,
+            "vectors": len(self),
+            "code_bytes_per_vector": self._codes.bytes_per_vector,
+            "float_bytes_per_vector": float_bytes,
+            "codes_mb": round(self._codes.nbytes / 2**20, 2),
+            "float_mb": round(len(self) * float_bytes / 2**20, 2),
+            "rescore_candidates": self._candidates,
+        }
+
+    def _rows(self, indices):
+        """Vetores float das linhas ``indices`` (em ordem crescente), como float32."""
+        if self._fd is None:
+            return np.asarray(self._embeddings[indices], dtype=np.float32)
+        dtype = self._embeddings.dtype
+        row_bytes = self._embeddings.shape[1] * dtype.itemsize
+        buffer = b"".join(os.pread(self._fd, row_bytes, int(i) * row_bytes) for i in indices)
+        return np.frombuffer(buffer, dtype=dtype).reshape(len(indices), -1).astype(np.float32)
+
+    def top_k(self, query_embeddings, k=None):
+        """Devolve (índices, scores exatos), ambos com formato (lote_consultas, k)."""
+        k = min(k or self._similarity_top_k, len(self))
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+        shortlist = top_k_indices(self._codes.score(queries), max(self._candidates, k))
+        indices = np.empty((queries.shape[0], k), dtype=np.int64)
+        scores = np.empty((queries.shape[0], k), dtype=np.float32)
+        for row, (query, candidates) in enumerate(zip(queries, shortlist)):
+            # Linhas em ordem crescente: leituras no sentido do arquivo
+            candidates = np.sort(candidates)
+            exact = self._rows(candidates) @ query
+            best = top_k_indices(exact[None, :], k)[0]
+            indices[row] = candidates[best]
+            scores[row] = exact[best]
+        return indices, scores
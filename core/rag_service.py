@@ -0,0 +1,295 @@
+"""Caminho de pergunta -> resposta compartilhado pelos servidores Flask.
+
+Ordem: cache exato -> embedding da pergunta -> cache semântico -> query
+engine (recuperação + LLM). O embedding calculado aqui é passado pronto no
+QueryBundle, então o retriever não recalcula. Cada etapa é medida em
+metrics.py (histogramas do /metrics e resumo por requisição no log).
+
+Com ``single_flight`` (single_flight.py), perguntas iguais que chegam enquanto
+outra está em andamento esperam por ela em vez de chamar o LLM de novo; a
+chave inclui ``version`` (índice + prompt + retriever).
+"""
+import asyncio
+import contextvars
+import inspect
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llama_index.core import Settings
+from llama_index.core.schema import QueryBundle
+
+import metrics
+
+
+def embed_queries(embed_model, questions):
+    """Embeddings de várias perguntas num único forward, com o prompt de consulta ("query: " no e5).
+
+    FastEmbedding expõe ``get_query_embedding_batch``; o HuggingFaceEmbedding
+    (backend torch, o padrão) calcula o lote em ``_embed(..., prompt_name="query")``.
+    Os demais modelos (ex.: Gemini) fazem uma pergunta por vez pela API pública.
+    """
+    questions = list(questions)
+    batch = getattr(embed_model, "get_query_embedding_batch", None)
+    if batch is not None:
+        return batch(questions)
+    embed = getattr(embed_model, "_embed", None)
+    if embed is not None and "prompt_name" in inspect.signature(embed).parameters:
+        return embed(questions, prompt_name="query")
+    return [embed_model.get_query_embedding(q) for q in questions]
+
+
+class RagService:
+    def __init__(self, query_engine, cache=None, embed_model=None, logger=None,
+                 stream_engine=None, single_flight=None, version=None):
+        self.query_engine = query_engine
+        # Mesmo retriever/prompt do query_engine, criado com streaming=True
+        self.stream_engine = stream_engine
+        self.cache = cache
+        self.embed_model = embed_model or Settings.embed_model
+        self.logger = logger or logging.getLogger(__name__)
+        self.single_flight = single_flight
+        self.version = version
+
+    @property
+    def retriever(self):
+        return self.query_engine.retriever
+
+    def embed_question(self, question):
+        with metrics.stage("embedding"):
+            return self.embed_model.get_query_embedding(question)
+
+    def _lookup_exact(self, question):
+        if self.cache is None:
+            return None
+        with metrics.stage("cache"):
+            cached = self.cache.get_exact(question)
+        if cached is not None:
+            self.logger.info("Cache HIT (exato).")
+            metrics.count_cache("hit_exact")
+        return cached
+
+    def _lookup_cache(self, question, exact=True):
+        """Retorna (resposta_em_cache ou None, embedding da pergunta ou None)."""
+        if exact:
+            cached = self._lookup_exact(question)
+            if cached is not None:
+                return cached, None
+
+        query_embedding = self.embed_question(question)
+
+        if self.cache is not None:
+            with metrics.stage("cache"):
+                cached = self.cache.get_semantic(query_embedding)
+            if cached is not None:
+                self.logger.info("Cache HIT (semântico).")
+                metrics.count_cache("hit_semantic")
+                return cached, query_embedding
+            self.logger.info("Cache MISS.")
+            metrics.count_cache("miss")
+        return None, query_embedding
+
+    def _retrieve(self, engine, bundle):
+        with metrics.stage("retrieval"):
+            nodes = engine.retrieve(bundle)
+        metrics.observe_chunks(len(nodes))
+        return nodes
+
+    def answer(self, question):
+        if self.single_flight is None:
+            return self._answer(question)
+        # Hit exato sai direto; o resto (embedding, cache semântico, LLM) é coalescido
+        cached = self._lookup_exact(question)
+        if cached is not None:
+            return cached
+        key = self.single_flight.key(question, self.version)
+        return self.single_flight.do(key, lambda: self._answer(question, exact=False))
+
+    def _answer(self, question, exact=True):
+        cached, query_embedding = self._lookup_cache(question, exact)
+        if cached is not None:
+            return cached
+
+        # Mesmo caminho do query_engine.query, com recuperação e síntese medidas em separado
+        bundle = QueryBundle(question, embedding=query_embedding)
+        nodes = self._retrieve(self.query_engine, bundle)
+        with metrics.synthesis_stage():
+            response = self.query_engine.synthesize(bundle, nodes)
+        answer = str(response)
+        if self.cache is not None:
+            self.cache.put(question, answer, query_embedding)
+        return answer
+
+    async def aanswer(self, question):
+        """Versão assíncrona de ``answer``: o event loop fica livre durante a chamada ao LLM.
+
+        O embedding local (CPU) e o cache rodam numa thread para não travar o
+        loop; a recuperação + geração usam o ``aquery`` do LlamaIndex.
+        """
+        if self.single_flight is None:
+            return await self._aanswer(question)
+        cached = self._lookup_exact(question)
+        if cached is not None:
+            return cached
+        key = self.single_flight.key(question, self.version)
+        return await self.single_flight.ado(key, lambda: self._aanswer(question, exact=False))
+
+    async def _aanswer(self, question, exact=True):
+        cached, query_embedding = await asyncio.to_thread(self._lookup_cache, question, exact)
+        if cached is not None:
+            return cached
+
+        bundle = QueryBundle(question, embedding=query_embedding)
+        with metrics.stage("retrieval"):
+            nodes = await self.query_engine.aretrieve(bundle)
+        metrics.observe_chunks(len(nodes))
+        with metrics.synthesis_stage():
+            response = await self.query_engine.asynthesize(bundle, nodes)
+        answer = str(response)
+        if self.cache is not None:
+            self.cache.put(question, answer, query_embedding)
+        return answer
+
+    def stream(self, question):
+        """Gera a resposta em trechos, conforme o LLM produz.
+
+        Num hit de cache a resposta inteira sai como um único trecho. A
+        resposta completa só entra no cache se o streaming terminar.
+        """
+        cached, query_embedding = self._lookup_cache(question)
+        if cached is not None:
+            yield cached
+            return
+
+        bundle = QueryBundle(question, embedding=query_embedding)
+        nodes = self._retrieve(self.stream_engine, bundle)
+        start = time.perf_counter()
+        response = self.stream_engine.synthesize(bundle, nodes)
+        response_gen = getattr(response, "response_gen", None)
+        if response_gen is None:
+            # Sem nós recuperados o synthesizer devolve uma resposta pronta
+            response_gen = iter([str(response)])
+
+        parts = []
+        for token in response_gen:
+            if not parts:
+                metrics.observe_stage("first_token", time.perf_counter() - start)
+            parts.append(token)
+            yield token
+        if self.cache is not None:
+            self.cache.put(question, "".join(parts), query_embedding)
+
+    def answer_batch(self, questions, max_concurrency=4):
+        """Responde várias perguntas, devolvendo um item por pergunta, na mesma ordem.
+
+        Embedding em lote -> recuperação vetorizada -> geração pelo LLM com no
+        máximo ``max_concurrency`` chamadas simultâneas. Cada item é
+        ``{"answer": ...}`` ou ``{"error": ...}``; uma falha não derruba o lote.
+        """
+        results = [None] * len(questions)
+        pending = []
+        for i, question in enumerate(questions):
+            cached = self.cache.get_exact(question) if self.cache is not None else None
+            if cached is not None:
+                metrics.count_cache("hit_exact")
+                results[i] = {"answer": cached, "cached": True}
+            else:
+                pending.append(i)
+        if not pending:
+            return results
+
+        embeddings = self._embed_batch([questions[i] for i in pending])
+
+        to_generate = []
+        for i, embedding in zip(pending, embeddings):
+            if embedding is None:
+                results[i] = {"error": "Erro interno ao processar a pergunta"}
+                continue
+            cached = self.cache.get_semantic(embedding) if self.cache is not None else None
+            if cached is not None:
+                metrics.count_cache("hit_semantic")
+                results[i] = {"answer": cached, "cached": True}
+            else:
+                if self.cache is not None:
+                    metrics.count_cache("miss")
+                to_generate.append((i, QueryBundle(questions[i], embedding=embedding)))
+        self.logger.info(
+            f"Lote: {len(questions)} perguntas, {len(questions) - len(to_generate)} do cache ou com erro, "
+            f"{len(to_generate)} para o LLM."
+        )
+        if not to_generate:
+            return results
+
+        nodes_per_question = self._retrieve_batch([bundle for _, bundle in to_generate])
+        retrieved = []
+        for (i, bundle), nodes in zip(to_generate, nodes_per_question):
+            if nodes is None:
+                results[i] = {"error": "Erro interno ao processar a pergunta"}
+                continue
+            metrics.observe_chunks(len(nodes))
+            retrieved.append((i, bundle, nodes))
+
+        def generate(bundle, nodes):
+            with metrics.synthesis_stage():
+                return str(self.query_engine.synthesize(bundle, nodes))
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            # Contexto copiado: as etapas de síntese/LLM de cada pergunta entram no resumo da requisição
+            futures = [
+                executor.submit(contextvars.copy_context().run, generate, bundle, nodes)
+                for _, bundle, nodes in retrieved
+            ]
+            for (i, bundle, _), future in zip(retrieved, futures):
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    self.logger.error(
+                        f"Erro ao gerar resposta do lote para '{bundle.query_str}': {e}", exc_info=True
+                    )
+                    results[i] = {"error": "Erro interno ao processar a pergunta"}
+                    continue
+                results[i] = {"answer": answer, "cached": False}
+                if self.cache is not None:
+                    self.cache.put(bundle.query_str, answer, bundle.embedding)
+        return results
+
+    def _embed_batch(self, questions):
+        """Embeddings das perguntas do lote; None nas que falharem.
+
+        Se a passada em lote falhar, repete pergunta a pergunta para isolar as
+        que causam o erro.
+        """
+        try:
+            with metrics.stage("embedding"):
+                return embed_queries(self.embed_model, questions)
+        except Exception as e:
+            self.logger.error(f"Erro no embedding do lote, repetindo por pergunta: {e}", exc_info=True)
+        embeddings = []
+        for question in questions:
+            try:
+                embeddings.append(self.embed_question(question))
+            except Exception as e:
+                self.logger.error(f"Erro no embedding da pergunta do lote '{question}': {e}", exc_info=True)
+                embeddings.append(None)
+        return embeddings
+
+    def _retrieve_batch(self, bundles):
+        """Nós recuperados por pergunta (recuperação vetorizada, se houver); None nas que falharem."""
+        retrieve_batch = getattr(self.retriever, "retrieve_batch", None)
+        if retrieve_batch is not None:
+            try:
+                with metrics.stage("retrieval"):
+                    return retrieve_batch(bundles)
+            except Exception as e:
+                self.logger.error(f"Erro na recuperação do lote, repetindo por pergunta: {e}", exc_info=True)
+        nodes_per_question = []
+        for bundle in bundles:
+            try:
+                with metrics.stage("retrieval"):
+                    nodes_per_question.append(self.retriever.retrieve(bundle))
+            except Exception as e:
+                self.logger.error(
+                    f"Erro na recuperação da pergunta do lote '{bundle.query_str}': {e}", exc_info=True
+                )
+                nodes_per_question.append(None)
+        return nodes_per_question
@@ -0,0 +1,277 @@
+"""Reindexação incremental do diretório de dados para o formato mmap.
+
+Cada arquivo de ``data_dir`` tem seu conteúdo (sha256) registrado no
+manifest do índice, junto com o hash de cada chunk gerado a partir dele.
+Numa nova execução:
+    - arquivos com o mesmo hash são reaproveitados sem parse nem embedding;
+    - arquivos novos/alterados são re-divididos em chunks, e só os chunks
+      cujo texto mudou são embedados (os demais reusam o vetor anterior);
+    - nós de arquivos que sumiram de ``data_dir`` são removidos.
+
+Uma mudança de ``--dtype`` ou ``--quantization`` regrava o índice mesmo sem
+arquivos alterados (e de float16 para float32 re-embeda tudo, já que os
+vetores gravados perderam precisão).
+
+Memória: a fila parse -> embedding é limitada, mas os nós e os vetores novos
+(float32, 4 KB por vetor de 1024 dimensões; os reaproveitados são linhas do
+mmap anterior) ficam na memória até ``write_store``, então o pico cresce
+linearmente com o acervo.
+
+Roda fora dos servidores (os workers só abrem o índice pronto no boot).
+
+Uso (a partir de core/):
+    python reindex.py ../data ../storage_mmap
+    python reindex.py ../data ../storage_gemini_llm_mmap
+    python reindex.py ../data ../storage_railway_mmap --embed-backend gemini --quantization int8
+"""
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+from llama_index.core.schema import MetadataMode
+
+from convert_storage import EMBEDDING_MODEL_NAME, load_hf_embedding
+from embedding_cache import EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_PATH, CachedEmbedding, EmbeddingCache
+from ingest_pipeline import EMBED_BATCH_SIZE, IngestPipeline
+from mmap_store import SUPPORTED_DTYPES, MmapNodeStore, write_store
+from quantization import QUANTIZATION_KINDS
+
+GEMINI_EMBEDDING_MODEL_NAME = "models/embedding-001"
+HASH_BLOCK_SIZE = 1 << 20
+
+logger = logging.getLogger("reindex")
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_text(node):
+    """Texto que vai para o modelo de embedding (inclui os metadados não excluídos)."""
+    return node.get_content(metadata_mode=MetadataMode.EMBED)
+
+
+def hash_chunk(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def list_source_files(data_dir):
+    """Arquivos de ``data_dir`` (recursivo, sem ocultos), com caminho relativo como chave."""
+    files = {}
+    for root, dirs, names in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, data_dir).replace(os.sep, "/")] = path
+    return files
+
+
+def default_model_name(backend):
+    return GEMINI_EMBEDDING_MODEL_NAME if backend == "gemini" else EMBEDDING_MODEL_NAME
+
+
+def create_embed_model(backend, model_name, batch_size=32, cache=None):
+    """Modelo de embedding do backend; com ``cache``, consulta o cache persistente antes de calcular."""
+    if backend == "gemini":
+        from llama_index.embeddings.gemini import GeminiEmbedding
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY não encontrada nas variáveis de ambiente")
+        embed_model = GeminiEmbedding(model_name=model_name, api_key=api_key)
+    else:
+        embed_model = load_hf_embedding(model_name, batch_size)
+    if cache is not None:
+        embed_model = CachedEmbedding(embed_model, cache, model_name=model_name)
+    return embed_model
+
+
+def load_previous(out_dir, model_name, dtype="float32"):
+    """Devolve (store anterior, fontes do manifest, {hash do chunk: linha}) para reaproveitamento."""
+    if not MmapNodeStore.exists(out_dir):
+        return None, {}, {}
+    store = MmapNodeStore.open(out_dir)
+    sources = store.manifest.get("sources")
+    if sources is None:
+        logger.info(f"Índice em '{out_dir}' não foi gerado por este script; reconstruindo tudo.")
+        return None, {}, {}
+    if store.manifest.get("embed_model") != model_name:
+        logger.info(
+            f"Modelo de embedding mudou ({store.manifest.get('embed_model')} -> {model_name}); "
+            "reconstruindo tudo."
+        )
+        return None, {}, {}
+    if store.manifest.get("dtype") == "float16" and dtype == "float32":
+        logger.info("Índice anterior em float16 e pedido float32; re-embedando tudo para não perder precisão.")
+        return None, {}, {}
+
+    rows_by_chunk = {}
+    for source in sources.values():
+        start = source["rows"][0]
+        for offset, chunk_hash in enumerate(source["chunks"]):
+            rows_by_chunk.setdefault(chunk_hash, start + offset)
+    return store, sources, rows_by_chunk
+
+
+def reindex(data_dir, out_dir, model_name, load_embed_model, dtype="float32", full=False,
+            parse_workers=None, embed_batch_size=EMBED_BATCH_SIZE, quantization=None):
+    """Atualiza ``out_dir`` a partir de ``data_dir`` embedando só o que mudou. Devolve as estatísticas.
+
+    Parse, chunking e embedding rodam sobrepostos (``IngestPipeline``).
+    ``load_embed_model`` só é chamado se houver chunks a embedar, então uma
+    execução sem mudanças não carrega o modelo.
+    """
+    if not os.path.isdir(data_dir):
+        raise FileNotFoundError(f"Diretório de dados '{data_dir}' não encontrado.")
+    files = list_source_files(data_dir)
+    if not files:
+        raise FileNotFoundError(f"Nenhum arquivo encontrado em '{data_dir}'.")
+
+    store, previous, rows_by_chunk = (None, {}, {}) if full else load_previous(out_dir, model_name, dtype)
+    stats = {"files_unchanged": 0, "files_changed": 0, "files_added": 0,
+             "files_removed": len(set(previous) - set(files)),
+             "chunks_reused": 0, "chunks_embedded": 0, "chunks_removed": 0}
+
+    nodes, embeddings, sources = [], [], {}
+    pipeline = IngestPipeline(load_embed_model, parse_workers, embed_batch_size)
+    with pipeline:
+        for rel_path, path in files.items():
+            file_hash = hash_file(path)
+            old = previous.get(rel_path)
+            start = len(nodes)
+
+            if old is not None and old["sha256"] == file_hash:
+                stats["files_unchanged"] += 1
+                rows = range(*old["rows"])
+                nodes.extend(store.get_nodes(rows))
+                embeddings.extend(store.embeddings[row] for row in rows)
+                chunk_hashes = old["chunks"]
+                stats["chunks_reused"] += len(chunk_hashes)
+            else:
+                stats["files_changed" if old is not None else "files_added"] += 1
+                logger.info(f"Processando '{rel_path}'...")
+                chunk_hashes = []
+                for node in pipeline.iter_nodes(path):
+                    text = chunk_text(node)
+                    chunk_hash = hash_chunk(text)
+                    row = rows_by_chunk.get(chunk_hash)
+                    if row is None:
+                        # Vetor preenchido depois, pela posição, quando o lote for embedado
+                        pipeline.embed(len(nodes), text)
+                        embeddings.append(None)
+                        stats["chunks_embedded"] += 1
+                    else:
+                        embeddings.append(store.embeddings[row])
+                        stats["chunks_reused"] += 1
+                    nodes.append(node)
+                    chunk_hashes.append(chunk_hash)
+
+            sources[rel_path] = {
+                "sha256": file_hash,
+                "rows": [start, len(nodes)],
+                "chunks": chunk_hashes,
+            }
+
+        for position, vector in pipeline.finish().items():
+            embeddings[position] = vector
+    stats["stages"] = pipeline.stats()
+
+    if previous:
+        previous_chunks = {h for source in previous.values() for h in source["chunks"]}
+        current_chunks = {h for source in sources.values() for h in source["chunks"]}
+        stats["chunks_removed"] = len(previous_chunks - current_chunks)
+
+    unchanged = (
+        store is not None
+        and not stats["chunks_embedded"]
+        and stats["files_changed"] == stats["files_added"] == stats["files_removed"] == 0
+        and store.manifest.get("dtype") == dtype
+        and (store.manifest.get("quantization") or {}).get("kind") == quantization
+    )
+    if unchanged:
+        logger.info(f"Índice em '{out_dir}' já está atualizado.")
+        return stats
+    if not nodes:
+        raise ValueError(f"Nenhum chunk gerado a partir de '{data_dir}'.")
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    write_store(
+        out_dir,
+        nodes,
+        matrix,
+        dtype=dtype,
+        extra_manifest={
+            "source": os.path.abspath(data_dir),
+            "embed_model": model_name,
+            "sources": sources,
+        },
+        quantization=quantization,
+    )
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data_dir", help="Diretório com os documentos (ex.: ../data)")
+    parser.add_argument("out_dir", help="Diretório do índice mmap (ex.: ../storage_gemini_llm_mmap)")
+    parser.add_argument("--embed-backend", choices=("hf", "gemini"), default="hf",
+                        help="hf: modelo local (localchatbot/geminichatbot); gemini: API (Railway)")
+    parser.add_argument("--model", help="Nome do modelo de embedding (padrão conforme o backend)")
+    parser.add_argument("--dtype", choices=SUPPORTED_DTYPES, default="float32")
+    parser.add_argument("--quantization", choices=("none",) + QUANTIZATION_KINDS, default="none",
+                        help="Grava também códigos int8/binários para a busca quantizada")
+    parser.add_argument("--batch-size", type=int, default=32, help="Lote por forward do modelo local")
+    parser.add_argument("--embed-queue-batch", type=int, default=EMBED_BATCH_SIZE,
+                        help="Chunks por lote enviado à thread de embedding")
+    parser.add_argument("--parse-workers", type=int, help="Processos para o parse de PDFs (padrão: nº de CPUs)")
+    parser.add_argument("--full", action="store_true", help="Ignora o índice anterior e re-embeda tudo")
+    parser.add_argument("--cache-path", default=EMBEDDING_CACHE_PATH,
+                        help="Cache persistente de embeddings (SQLite)")
+    parser.add_argument("--cache-max-entries", type=int, default=EMBEDDING_CACHE_MAX_ENTRIES)
+    parser.add_argument("--no-cache", action="store_true", help="Não usa o cache de embeddings")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    cache = None if args.no_cache else EmbeddingCache(args.cache_path, args.cache_max_entries)
+    start = time.perf_counter()
+    try:
+        model_name = args.model or default_model_name(args.embed_backend)
+        stats = reindex(
+            args.data_dir,
+            args.out_dir,
+            model_name,
+            lambda: create_embed_model(args.embed_backend, model_name, args.batch_size, cache),
+            args.dtype,
+            args.full,
+            args.parse_workers,
+            args.embed_queue_batch,
+            None if args.quantization == "none" else args.quantization,
+        )
+    except Exception as e:
+        logger.error(f"Falha na reindexação: {e}")
+        return 1
+    logger.info(
+        f"Arquivos: {stats['files_added']} novos, {stats['files_changed']} alterados, "
+        f"{stats['files_unchanged']} sem mudança, {stats['files_removed']} removidos. "
+        f"Chunks: {stats['chunks_embedded']} embedados, {stats['chunks_reused']} reaproveitados, "
+        f"{stats['chunks_removed']} removidos. Tempo: {time.perf_counter() - start:.1f} s."
+    )
+    for stage, stage_stats in stats.get("stages", {}).items():
+        logger.info(f"Estágio {stage}: {stage_stats}")
+    if cache is not None:
+        logger.info(f"Cache de embeddings: {cache.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
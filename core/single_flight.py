@@ -0,0 +1,302 @@
+"""Coalescência de perguntas idênticas em andamento ("single flight").
+
+Quando várias requisições chegam com a mesma pergunta (normalizada como no
+cache de respostas) e a mesma versão de índice/prompt, só a primeira (líder)
+consulta o LLM; as outras esperam e recebem a mesma resposta, ou a mesma
+exceção. Quem espera mais que ``timeout`` segundos recebe SingleFlightTimeout;
+o padrão cobre o pior caso do roteador de LLM (ver ``single_flight_timeout``),
+para que ninguém desista de uma pergunta que o líder ainda vai responder.
+
+Dois níveis:
+    1. no processo: threads (Flask) e corrotinas (asgi_app.py) esperam o líder
+       por um Event / Future;
+    2. entre workers do gunicorn: o líder segura um ``flock`` em
+       ``SINGLE_FLIGHT_DIR/<chave>.lock`` e grava o resultado em ``<chave>.json``
+       antes de soltar. Quem encontra o lock ocupado espera ele ser solto e lê
+       o resultado; se o líder morreu sem gravar (o SO solta o flock), quem
+       conseguiu o lock vira o novo líder. Erros chegam aos outros workers como
+       SingleFlightError, só com o tipo e a mensagem.
+
+Sem ``fcntl`` (Windows) ou com ``SINGLE_FLIGHT_DIR`` vazio, só o nível 1.
+O streaming (``/ask/stream``) não é coalescido.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import metrics
+from answer_cache import cache_version, normalize_question
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
+# Sem valor: derivado dos prazos do roteador de LLM (single_flight_timeout)
+SINGLE_FLIGHT_TIMEOUT = os.getenv("SINGLE_FLIGHT_TIMEOUT")
+# Folga sobre o pior caso do LLM, para embedding, recuperação e montagem do prompt
+SINGLE_FLIGHT_MARGIN = float(os.getenv("SINGLE_FLIGHT_MARGIN", "30"))
+# Pior caso assumido para um LLM que não informa o seu (fora do RouterLLM)
+DEFAULT_LLM_SECONDS = 60.0
+SINGLE_FLIGHT_DIR = os.getenv(
+    "SINGLE_FLIGHT_DIR", os.path.join(tempfile.gettempdir(), "chatbot-single-flight")
+)
+# Intervalo entre tentativas de pegar o lock de outro worker
+SINGLE_FLIGHT_POLL = float(os.getenv("SINGLE_FLIGHT_POLL", "0.05"))
+# Resultados e locks mais velhos que isso são apagados
+SINGLE_FLIGHT_RETENTION = 300
+
+
+class SingleFlightTimeout(TimeoutError):
+    pass
+
+
+class SingleFlightError(RuntimeError):
+    """Exceção do líder em outro worker (só tipo e mensagem atravessam o arquivo)."""
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _FileFlight:
+    """Líder por ``flock`` num arquivo por chave, resultado num JSON ao lado."""
+
+    def __init__(self, directory, poll_interval=SINGLE_FLIGHT_POLL):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._last_prune = 0.0
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def try_lock(self, key):
+        """Descritor com o lock exclusivo, ou None se outro processo o tem."""
+        fd = os.open(self._path(key, "lock"), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def unlock(self, fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def read_result(self, key, since):
+        """Resultado gravado depois de ``since`` (epoch), ou None."""
+        try:
+            with open(self._path(key, "json"), encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return result if result.get("finished_at", 0) >= since else None
+
+    def write_result(self, key, answer=None, error=None):
+        result = {"finished_at": time.time(), "answer": answer, "error": error}
+        path = self._path(key, "json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._prune()
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < SINGLE_FLIGHT_RETENTION:
+            return
+        self._last_prune = now
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.stat(path).st_mtime < SINGLE_FLIGHT_RETENTION:
+                    continue
+                if name.endswith(".lock"):
+                    # Só apaga lock que ninguém segura
+                    fd = self.try_lock(name[:-len(".lock")])
+                    if fd is None:
+                        continue
+                    os.unlink(path)
+                    self.unlock(fd)
+                else:
+                    os.unlink(path)
+            except OSError:
+                continue
+
+
+def single_flight_timeout(llm=None, setting=SINGLE_FLIGHT_TIMEOUT, margin=SINGLE_FLIGHT_MARGIN):
+    """Espera máxima de quem segue o líder: ``SINGLE_FLIGHT_TIMEOUT``, se definido, ou o
+    pior caso do LLM (``RouterLLM.worst_case_seconds``: todos os backends estourando o prazo)
+    mais ``margin``."""
+    if setting:
+        return float(setting)
+    worst = getattr(llm, "worst_case_seconds", None)
+    return (worst if worst is not None else DEFAULT_LLM_SECONDS) + margin
+
+
+def _unwrap(result):
+    if result["error"] is not None:
+        raise SingleFlightError(result["error"])
+    return result["answer"]
+
+
+def _describe(exc):
+    return f"{type(exc).__name__}: {exc}"
+
+
+class SingleFlight:
+    def __init__(self, directory=SINGLE_FLIGHT_DIR, timeout=None, logger=None):
+        self.timeout = timeout if timeout is not None else single_flight_timeout()
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._futures = {}
+        self._files = None
+        if directory and fcntl is not None:
+            try:
+                self._files = _FileFlight(directory)
+            except OSError as e:
+                self.logger.warning(f"Single flight entre workers desativado ({directory}): {e}")
+
+    @staticmethod
+    def key(question, version=None):
+        return cache_version(version, normalize_question(question))
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls) + len(self._futures)
+
+    # --- threads (Flask) ---
+    def do(self, key, fn):
+        """Executa ``fn()`` uma vez por chave entre as chamadas simultâneas."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.count_coalesced("local")
+            with metrics.stage("coalesce_wait"):
+                if not call.event.wait(self.timeout):
+                    raise SingleFlightTimeout(f"Pergunta em andamento não terminou em {self.timeout:.0f}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _lead(self, key, fn):
+        if self._files is None:
+            return fn()
+        started = time.time()
+        deadline = time.monotonic() + self.timeout
+        fd = self._files.try_lock(key)
+        if fd is None:
+            metrics.count_coalesced("worker")
+            with metrics.stage("coalesce_wait"):
+                while fd is None:
+                    if time.monotonic() >= deadline:
+                        raise SingleFlightTimeout(
+                            f"Pergunta em andamento em outro worker não terminou em {self.timeout:.0f}s"
+                        )
+                    time.sleep(self._files.poll_interval)
+                    fd = self._files.try_lock(key)
+            result = self._files.read_result(key, started)
+            if result is not None:
+                self._files.unlock(fd)
+                return _unwrap(result)
+        return self._run_locked(key, fd, fn)
+
+    def _run_locked(self, key, fd, fn):
+        try:
+            answer = fn()
+        except Exception as e:
+            self._files.write_result(key, error=_describe(e))
+            raise
+        else:
+            self._files.write_result(key, answer=answer)
+            return answer
+        finally:
+            self._files.unlock(fd)
+
+    # --- asyncio (asgi_app.py) ---
+    async def ado(self, key, coro_fn):
+        """Versão assíncrona de ``do``: ``coro_fn()`` devolve a corrotina a executar."""
+        future = self._futures.get(key)
+        if future is not None:
+            metrics.count_coalesced("local")
+            with metrics.stage("coalesce_wait"):
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+                except asyncio.TimeoutError:
+                    raise SingleFlightTimeout(
+                        f"Pergunta em andamento não terminou em {self.timeout:.0f}s"
+                    ) from None
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        try:
+            result = await self._alead(key, coro_fn)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                e = SingleFlightError("Pergunta em andamento foi cancelada")
+            future.set_exception(e)
+            # Marca a exceção como lida: sem seguidores o asyncio reclamaria no log
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
+
+    async def _alead(self, key, coro_fn):
+        if self._files is None:
+            return await coro_fn()
+        started = time.time()
+        deadline = time.monotonic() + self.timeout
+        fd = self._files.try_lock(key)
+        if fd is None:
+            metrics.count_coalesced("worker")
+            with metrics.stage("coalesce_wait"):
+                while fd is None:
+                    if time.monotonic() >= deadline:
+                        raise SingleFlightTimeout(
+                            f"Pergunta em andamento em outro worker não terminou em {self.timeout:.0f}s"
+                        )
+                    await asyncio.sleep(self._files.poll_interval)
+                    fd = self._files.try_lock(key)
+            result = self._files.read_result(key, started)
+            if result is not None:
+                self._files.unlock(fd)
+                return _unwrap(result)
+        try:
+            answer = await coro_fn()
+        except Exception as e:
+            self._files.write_result(key, error=_describe(e))
+            raise
+        else:
+            self._files.write_result(key, answer=answer)
+            return answer
+        finally:
+            self._files.unlock(fd)
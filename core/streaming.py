@@ -0,0 +1,73 @@
+"""Respostas em streaming para o endpoint /ask/stream.
+
+Formatos:
+    sse    -> text/event-stream, um evento ``data: {"token": "..."}`` por trecho,
+              terminando com ``event: done``
+    ndjson -> application/x-ndjson, uma linha JSON por trecho, terminando com
+              ``{"done": true, ...}``
+
+Erros no meio da geração viram um evento/linha ``error`` (o status HTTP já
+foi enviado). O tempo até o primeiro token (TTFT) e o tempo total são logados.
+"""
+import json
+import time
+
+from flask import Response, stream_with_context
+
+STREAM_FORMATS = ("sse", "ndjson")
+MIMETYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+
+def format_event(payload, fmt, event=None):
+    data = json.dumps(payload, ensure_ascii=False)
+    if fmt == "ndjson":
+        return data + "\n"
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n"
+
+
+def stream_format_from_request(request):
+    """Escolhe o formato por ``?format=`` ou pelo header Accept (padrão: SSE)."""
+    fmt = request.args.get("format")
+    if fmt in STREAM_FORMATS:
+        return fmt
+    if "application/x-ndjson" in request.headers.get("Accept", ""):
+        return "ndjson"
+    return "sse"
+
+
+def stream_response(tokens, fmt, logger, error_message):
+    """Envolve um iterador de trechos de texto numa resposta HTTP em streaming.
+
+    ``tokens`` deve ser preguiçoso (gerador): a recuperação e a chamada ao LLM
+    só começam no primeiro ``next``, então o TTFT inclui todo o pipeline.
+    """
+    start = time.perf_counter()
+
+    def generate():
+        ttft = None
+        n_chunks = 0
+        try:
+            for token in tokens:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                    logger.info(f"Tempo até o primeiro token: {ttft * 1000:.0f} ms")
+                n_chunks += 1
+                yield format_event({"token": token}, fmt)
+        except Exception as e:
+            logger.error(f"Erro durante o streaming da resposta: {e}", exc_info=True)
+            yield format_event({"error": error_message}, fmt, event="error")
+            return
+        total = time.perf_counter() - start
+        logger.info(f"Streaming concluído: {n_chunks} trechos em {total * 1000:.0f} ms")
+        yield format_event(
+            {"done": True, "ttft_ms": round((ttft or total) * 1000), "total_ms": round(total * 1000)},
+            fmt,
+            event="done",
+        )
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=MIMETYPES[fmt],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,248 @@
+"""Servidor de LLM falso, compatível com as APIs do Ollama e do Gemini, para benchmarks offline.
+
+Responde depois de ``--latency`` segundos e gera ``--completion-tokens``
+tokens a ``--tokens-per-second`` (no streaming, um trecho por token). Os
+servidores de core/ apontam para ele sem mudar de código:
+
+    localchatbot.py                       OLLAMA_BASE_URL=http://127.0.0.1:18000
+    geminichatbot.py / _railway.py        GEMINI_API_BASE=http://127.0.0.1:18000 (transporte REST)
+
+Rotas:
+    Ollama: POST /api/chat, POST /api/generate, POST /api/show, GET /api/tags
+    Gemini: GET /v1beta/models/{modelo}, POST ...:generateContent, ...:streamGenerateContent,
+            ...:embedContent, ...:batchEmbedContents (vetores determinísticos por texto)
+    GET /stub/stats -> chamadas atendidas por rota
+
+Os tokens de prompt informados (``prompt_eval_count`` / ``promptTokenCount``)
+são o nº de palavras do prompt, uma aproximação.
+
+Uso (a partir de core/):
+    python stub_llm_server.py --port 18000 --latency 0.5 --tokens-per-second 80 --completion-tokens 120
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+STUB_TOKEN = "cogumelo "
+
+
+class StubConfig:
+    def __init__(self, latency=0.5, tokens_per_second=80.0, completion_tokens=120, embed_dim=768):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.embed_dim = embed_dim
+
+    @property
+    def token_interval(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+def _word_count(text):
+    return len(str(text).split())
+
+
+def _embedding(text, dim):
+    seed = int.from_bytes(hashlib.sha256(str(text).encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _gemini_text(contents):
+    parts = []
+    for content in contents or []:
+        for part in content.get("parts", []):
+            parts.append(part.get("text", ""))
+    return " ".join(parts)
+
+
+def create_app(config):
+    stats = {}
+
+    def count(name):
+        stats[name] = stats.get(name, 0) + 1
+
+    async def tokens():
+        """Gera os tokens no ritmo configurado, depois da latência inicial."""
+        await asyncio.sleep(config.latency)
+        for i in range(config.completion_tokens):
+            if i:
+                await asyncio.sleep(config.token_interval)
+            yield STUB_TOKEN
+
+    async def full_text():
+        await asyncio.sleep(config.latency + config.token_interval * max(0, config.completion_tokens - 1))
+        return STUB_TOKEN * config.completion_tokens
+
+    # --- Ollama ---
+    def ollama_final(body, prompt_tokens, started, extra):
+        return {
+            "model": body.get("model", "stub"),
+            "created_at": _now(),
+            **extra,
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": 0,
+            "eval_count": config.completion_tokens,
+            "eval_duration": int(config.completion_tokens * config.token_interval * 1e9),
+        }
+
+    async def ollama_respond(request, chat):
+        started = time.perf_counter()
+        body = await request.json()
+        count("ollama_chat" if chat else "ollama_generate")
+        if chat:
+            prompt_tokens = sum(_word_count(m.get("content", "")) for m in body.get("messages", []))
+        else:
+            prompt_tokens = _word_count(body.get("prompt", ""))
+
+        def piece(text):
+            if chat:
+                return {"message": {"role": "assistant", "content": text}}
+            return {"response": text}
+
+        if not body.get("stream", True):
+            text = await full_text()
+            return JSONResponse(ollama_final(body, prompt_tokens, started, piece(text)))
+
+        async def stream():
+            async for token in tokens():
+                line = {"model": body.get("model", "stub"), "created_at": _now(), **piece(token), "done": False}
+                yield json.dumps(line) + "\n"
+            yield json.dumps(ollama_final(body, prompt_tokens, started, piece(""))) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    async def ollama_chat(request):
+        return await ollama_respond(request, chat=True)
+
+    async def ollama_generate(request):
+        return await ollama_respond(request, chat=False)
+
+    async def ollama_show(request):
+        return JSONResponse({
+            "modelfile": "", "parameters": "", "template": "{{ .Prompt }}",
+            "details": {"format": "gguf", "family": "llama", "parameter_size": "3B"},
+            "model_info": {"general.architecture": "llama", "llama.context_length": 131072},
+        })
+
+    async def ollama_tags(request):
+        return JSONResponse({"models": [{"name": "stub", "model": "stub", "modified_at": _now(), "size": 0}]})
+
+    # --- Gemini ---
+    def gemini_response(text, prompt_tokens, completion_tokens, finished=True):
+        candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        if finished:
+            candidate["finishReason"] = "STOP"
+        return {
+            "candidates": [candidate],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": completion_tokens,
+                "totalTokenCount": prompt_tokens + completion_tokens,
+            },
+        }
+
+    async def gemini_models(request):
+        name, _, method = request.path_params["name"].partition(":")
+        if request.method == "GET":
+            count("gemini_get_model")
+            return JSONResponse({
+                "name": f"models/{name}", "baseModelId": name, "version": "stub", "displayName": name,
+                "inputTokenLimit": 1048576, "outputTokenLimit": 8192,
+                "supportedGenerationMethods": ["generateContent", "countTokens", "embedContent"],
+            })
+
+        body = await request.json()
+        count(f"gemini_{method}")
+        if method == "embedContent":
+            return JSONResponse({"embedding": {"values": _embedding(_gemini_text([body.get("content")]), config.embed_dim)}})
+        if method == "batchEmbedContents":
+            return JSONResponse({"embeddings": [
+                {"values": _embedding(_gemini_text([r.get("content")]), config.embed_dim)}
+                for r in body.get("requests", [])
+            ]})
+        if method == "countTokens":
+            return JSONResponse({"totalTokens": _word_count(_gemini_text(body.get("contents")))})
+
+        prompt_tokens = _word_count(_gemini_text(body.get("contents")))
+        if method == "generateContent":
+            text = await full_text()
+            return JSONResponse(gemini_response(text, prompt_tokens, config.completion_tokens))
+        if method != "streamGenerateContent":
+            return JSONResponse({"error": {"code": 404, "message": f"Método {method} não suportado"}}, 404)
+
+        sse = request.query_params.get("alt") == "sse"
+
+        async def stream():
+            # REST do google-generativeai: um array JSON enviado aos poucos; com alt=sse, eventos SSE
+            sent = 0
+            if not sse:
+                yield "["
+            async for token in tokens():
+                sent += 1
+                chunk = json.dumps(gemini_response(token, prompt_tokens, sent, sent == config.completion_tokens))
+                if sse:
+                    yield f"data: {chunk}\r\n\r\n"
+                else:
+                    yield ("," if sent > 1 else "") + chunk
+            if not sse:
+                yield "]"
+
+        return StreamingResponse(stream(), media_type="text/event-stream" if sse else "application/json")
+
+    async def root(request):
+        return PlainTextResponse("Ollama is running")
+
+    async def stub_stats(request):
+        return JSONResponse({
+            "calls": stats,
+            "latency": config.latency,
+            "tokens_per_second": config.tokens_per_second,
+            "completion_tokens": config.completion_tokens,
+        })
+
+    return Starlette(routes=[
+        Route("/", root, methods=["GET", "HEAD"]),
+        Route("/api/chat", ollama_chat, methods=["POST"]),
+        Route("/api/generate", ollama_generate, methods=["POST"]),
+        Route("/api/show", ollama_show, methods=["POST"]),
+        Route("/api/tags", ollama_tags, methods=["GET"]),
+        Route("/v1beta/models/{name:path}", gemini_models, methods=["GET", "POST"]),
+        Route("/stub/stats", stub_stats, methods=["GET"]),
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LLM stub compatível com Ollama e Gemini")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--latency", type=float, default=0.5, help="Segundos até o primeiro token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--embed-dim", type=int, default=768, help="Dimensão dos embeddings do Gemini")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    config = StubConfig(args.latency, args.tokens_per_second, args.completion_tokens, args.embed_dim)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
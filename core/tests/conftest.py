@@ -0,0 +1,5 @@
+"""Os módulos do projeto são importados a partir de core/, como nos scripts."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
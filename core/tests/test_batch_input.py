@@ -0,0 +1,66 @@
+import json
+
+import pytest
+from flask import Flask
+
+from batch_input import BatchInputError, answer_items, parse_batch_items
+
+app = Flask(__name__)
+
+
+def parse(max_items=10, **kwargs):
+    with app.test_request_context("/ask/batch", method="POST", **kwargs):
+        from flask import request
+
+        return parse_batch_items(request, max_items)
+
+
+def test_json_accepts_strings_and_objects():
+    items = parse(json={"questions": ["primeira", {"id": "x", "question": "segunda"}]})
+    assert items == [{"id": 0, "question": "primeira"}, {"id": "x", "question": "segunda"}]
+
+
+def test_jsonl_in_backlog_format():
+    lines = [
+        json.dumps({"request_id": "user-001", "title": "Título", "body": "Pergunta 1"}),
+        "",
+        json.dumps({"id": 7, "question": "Pergunta 2"}),
+    ]
+    items = parse(data="\n".join(lines), content_type="application/x-ndjson")
+    assert items == [{"id": "user-001", "question": "Pergunta 1"}, {"id": 7, "question": "Pergunta 2"}]
+
+
+def test_jsonl_by_query_string():
+    items = parse(query_string={"format": "jsonl"}, data='{"question": "q"}\n')
+    assert items == [{"id": 0, "question": "q"}]
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    ({"json": {"perguntas": []}}, "questions"),
+    ({"json": {"questions": []}}, "vazio"),
+    ({"json": {"questions": ["q"] * 11}}, "limite"),
+    ({"json": {"questions": [3]}}, "Item 0"),
+    ({"json": {"questions": [{"id": 1}]}}, "Item 0"),
+    ({"data": "{}\nnão é json", "content_type": "application/jsonl"}, "Linha 2"),
+])
+def test_invalid_input(kwargs, message):
+    with pytest.raises(BatchInputError, match=message):
+        parse(**kwargs)
+
+
+class StubService:
+    def __init__(self):
+        self.received = None
+
+    def answer_batch(self, questions, max_concurrency=4):
+        self.received = questions
+        return [{"answer": q.upper()} for q in questions]
+
+
+def test_answer_items_keeps_order_and_flags_empty_questions():
+    service = StubService()
+    items = [{"id": 1, "question": "a"}, {"id": 2, "question": "  "}, {"id": 3, "question": "b"}]
+    results = answer_items(service, items, max_concurrency=2)
+    assert service.received == ["a", "b"]
+    assert results == [{"id": 1, "answer": "A"}, {"id": 2, "error": "Pergunta não pode ser vazia"},
+                       {"id": 3, "answer": "B"}]
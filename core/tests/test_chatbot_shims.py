@@ -0,0 +1,27 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def loaded_chatbot(monkeypatch):
+    """Um ``chatbot`` já importado com o perfil gemini, sem subir modelos."""
+    module = types.ModuleType("chatbot")
+    module.CHATBOT_PROFILE = "gemini"
+    monkeypatch.setitem(sys.modules, "chatbot", module)
+    monkeypatch.setenv("CHATBOT_PROFILE", "gemini")
+    for name in ("geminichatbot", "localchatbot", "geminichatbot_railway"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    return module
+
+
+@pytest.mark.parametrize("shim", ["localchatbot", "geminichatbot_railway"])
+def test_shim_with_other_profile_raises(loaded_chatbot, shim):
+    with pytest.raises(RuntimeError, match="perfil 'gemini'"):
+        importlib.import_module(shim)
+
+
+def test_shim_with_same_profile_reuses_module(loaded_chatbot):
+    assert importlib.import_module("geminichatbot") is loaded_chatbot
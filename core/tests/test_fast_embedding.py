@@ -0,0 +1,72 @@
+import numpy as np
+
+from fast_embedding import FastEmbedding
+from rag_service import embed_queries
+
+
+class StubTokenizer:
+    pad_token_id = 0
+
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, texts, truncation=True, max_length=None):
+        self.seen.extend(texts)
+        return {"input_ids": [[1 + len(text) % 7, 2] for text in texts]}
+
+
+def make_model():
+    model = FastEmbedding.model_construct(model_name="intfloat/multilingual-e5-large", backend="onnx")
+    model._tokenizer = StubTokenizer()
+    model._run = lambda input_ids, mask: np.ones(input_ids.shape + (4,), dtype=np.float32)
+    return model
+
+
+def test_query_and_text_prompts_match_huggingface_e5():
+    model = make_model()
+    model.get_query_embedding("pergunta")
+    model.get_text_embedding("trecho")
+    assert model._tokenizer.seen == ["query: pergunta", "passage: trecho"]
+
+
+class HuggingFaceStyleEmbedding:
+    """Mesma interface de lote do HuggingFaceEmbedding: _embed(sentences, prompt_name)."""
+
+    def __init__(self):
+        self.calls = []
+
+    def _embed(self, sentences, prompt_name=None):
+        self.calls.append((list(sentences), prompt_name))
+        return [[1.0, 0.0] for _ in sentences]
+
+    def get_query_embedding(self, query):
+        raise AssertionError("o lote não deve cair no caminho por pergunta")
+
+
+class PerQueryEmbedding:
+    def __init__(self):
+        self.seen = []
+
+    def get_query_embedding(self, query):
+        self.seen.append(query)
+        return [0.0, 1.0]
+
+
+def test_embed_queries_batches_with_query_prompt():
+    model = make_model()
+    vectors = embed_queries(model, ["a", "b", "c"])
+    assert len(vectors) == 3
+    assert model._tokenizer.seen == ["query: a", "query: b", "query: c"]
+
+
+def test_embed_queries_batches_huggingface_style_model_in_one_call():
+    model = HuggingFaceStyleEmbedding()
+    vectors = embed_queries(model, ("a", "b", "c"))
+    assert len(vectors) == 3
+    assert model.calls == [(["a", "b", "c"], "query")]
+
+
+def test_embed_queries_falls_back_to_public_api_without_batch_path():
+    model = PerQueryEmbedding()
+    assert embed_queries(model, ["a", "b"]) == [[0.0, 1.0], [0.0, 1.0]]
+    assert model.seen == ["a", "b"]
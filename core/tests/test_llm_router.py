@@ -0,0 +1,186 @@
+import asyncio
+import time
+from typing import Any
+
+import pytest
+from llama_index.core.base.llms.types import CompletionResponse, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+
+import llm_router
+import metrics
+from llm_router import CircuitBreaker, LLMBackend, LLMUnavailable, RouterLLM
+
+
+class StubLLM(CustomLLM):
+    """LLM de teste: responde ``text`` depois de ``delay`` segundos, ou levanta ``error``."""
+
+    text: str = "ok"
+    delay: float = 0.0
+    error: str = ""
+    context_window: int = 4096
+    num_output: int = 256
+    calls: int = 0
+    cancelled: bool = False
+
+    @property
+    def metadata(self):
+        return LLMMetadata(context_window=self.context_window, num_output=self.num_output,
+                           model_name=f"stub-{self.text}")
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error:
+            raise RuntimeError(self.error)
+        return CompletionResponse(text=self.text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        response = self.complete(prompt, formatted=formatted)
+
+        def gen():
+            yield CompletionResponse(text=response.text, delta=response.text)
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise RuntimeError(self.error)
+        return CompletionResponse(text=self.text)
+
+
+def make_router(*llms, timeout=1.0, hedge=False, breaker=None):
+    backends = [
+        LLMBackend(llm.text, llm, timeout=timeout, breaker=breaker() if breaker else None) for llm in llms
+    ]
+    return RouterLLM(backends, hedge=hedge)
+
+
+def test_breaker_opens_after_failures_and_allows_one_probe():
+    breaker = CircuitBreaker(failures=2, cooldown=0.05)
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # só uma chamada de teste por vez
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+def test_released_probe_frees_half_open_breaker():
+    breaker = CircuitBreaker(failures=1, cooldown=0.0)
+    breaker.failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_falls_back_on_error():
+    primary, secondary = StubLLM(text="primario", error="fora do ar"), StubLLM(text="secundario")
+    router = make_router(primary, secondary)
+    assert router.complete("pergunta").text == "secundario"
+    assert router.backends[0].breaker.failures == 1
+
+
+def test_falls_back_on_timeout_without_waiting_for_the_slow_backend():
+    slow, fast = StubLLM(text="lento", delay=0.5), StubLLM(text="rapido")
+    router = make_router(slow, fast, timeout=0.1)
+    before = metrics.LLM_ROUTE.value(backend="lento", outcome="timeout")
+    started = time.perf_counter()
+    assert router.complete("pergunta").text == "rapido"
+    assert time.perf_counter() - started < 0.4
+    assert metrics.LLM_ROUTE.value(backend="lento", outcome="timeout") == before + 1
+
+
+def test_open_breaker_skips_backend():
+    primary, secondary = StubLLM(text="primario"), StubLLM(text="secundario")
+    router = make_router(primary, secondary, breaker=lambda: CircuitBreaker(failures=1, cooldown=60))
+    router.backends[0].breaker.failure()
+    assert router.complete("pergunta").text == "secundario"
+    assert primary.calls == 0
+
+
+def test_all_backends_failing_raises_unavailable():
+    router = make_router(StubLLM(text="a", error="erro a"), StubLLM(text="b", error="erro b"))
+    with pytest.raises(LLMUnavailable):
+        router.complete("pergunta")
+
+
+def test_stream_falls_back_before_first_chunk():
+    router = make_router(StubLLM(text="primario", error="fora do ar"), StubLLM(text="secundario"))
+    assert [r.delta for r in router.stream_complete("pergunta")] == ["secundario"]
+
+
+def test_hedge_fires_and_partner_wins(monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DELAY", 0.05)
+    slow, fast = StubLLM(text="lento", delay=0.5), StubLLM(text="rapido")
+    router = make_router(slow, fast, timeout=2.0, hedge=True)
+    before = metrics.LLM_ROUTE.value(backend="rapido", outcome="hedge_won")
+    started = time.perf_counter()
+    assert router.complete("pergunta").text == "rapido"
+    assert time.perf_counter() - started < 0.4
+    assert metrics.LLM_ROUTE.value(backend="rapido", outcome="hedge_won") == before + 1
+
+
+def test_async_hedge_cancels_the_losing_call(monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DELAY", 0.05)
+    slow, fast = StubLLM(text="lento", delay=1.0), StubLLM(text="rapido")
+    router = make_router(slow, fast, timeout=2.0, hedge=True)
+
+    async def main():
+        response = await router.acomplete("pergunta")
+        await asyncio.sleep(0)  # deixa o cancelamento chegar à corrotina perdedora
+        return response
+
+    assert asyncio.run(main()).text == "rapido"
+    assert slow.cancelled
+    # O perdedor não fica preso como chamada de teste do breaker
+    assert router.backends[0].breaker.allow()
+
+
+def test_reconnect_replaces_client_in_each_backend():
+    created = []
+
+    def factory():
+        created.append(StubLLM(text=f"cliente {len(created)}"))
+        return created[-1]
+
+    backend = LLMBackend("gemini", factory(), timeout=1.0, factory=factory)
+    router = RouterLLM([backend, LLMBackend("fixo", StubLLM(text="fixo"), timeout=1.0)])
+    router.reconnect()
+    assert backend.llm is created[1]
+    assert router.complete("pergunta").text == "cliente 1"
+    assert router.backends[1].llm.text == "fixo"
+
+
+def test_synthesis_through_router_with_different_context_windows():
+    from llama_index.core import get_response_synthesizer
+    from llama_index.core.schema import NodeWithScore, TextNode
+
+    gemini = StubLLM(text="gemini", context_window=1_000_000, num_output=8192)
+    ollama = StubLLM(text="ollama", context_window=3900, num_output=256)
+    router = RouterLLM([LLMBackend("gemini", gemini, timeout=1.0), LLMBackend("ollama", ollama, timeout=1.0)])
+    assert router.metadata.context_window - router.metadata.num_output > 0
+
+    synthesizer = get_response_synthesizer(llm=router)
+    nodes = [NodeWithScore(node=TextNode(text="O shiitake frutifica entre 15 e 25 graus."), score=1.0)]
+    assert str(synthesizer.synthesize("Qual a temperatura do shiitake?", nodes)) == "gemini"
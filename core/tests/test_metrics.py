@@ -0,0 +1,60 @@
+import json
+import logging
+import time
+
+from flask import Flask, Response, stream_with_context
+
+import metrics
+from rag_service import RagService
+from test_rag_service import StubEmbedding, StubQueryEngine, StubRetriever
+
+
+class SummaryHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.summaries = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith("{"):
+            self.summaries.append(json.loads(message))
+
+
+def make_app():
+    app = Flask(__name__)
+    app.logger.setLevel(logging.INFO)
+    handler = SummaryHandler()
+    app.logger.addHandler(handler)
+    metrics.register_metrics_routes(app)
+    return app, handler
+
+
+def test_stream_request_is_recorded_when_the_stream_ends():
+    app, handler = make_app()
+
+    @app.route("/ask/stream", methods=["POST"])
+    def ask_stream():
+        def generate():
+            with metrics.stage("retrieval"):
+                time.sleep(0.05)
+            yield "trecho"
+        return Response(stream_with_context(generate()))
+
+    before = metrics.REQUEST_SECONDS.count(endpoint="/ask/stream")
+    response = app.test_client().post("/ask/stream", buffered=False)
+    assert metrics.REQUEST_SECONDS.count(endpoint="/ask/stream") == before
+    assert response.get_data(as_text=True) == "trecho"
+    response.close()
+
+    assert metrics.REQUEST_SECONDS.count(endpoint="/ask/stream") == before + 1
+    summary = handler.summaries[-1]
+    assert summary["duration_ms"] >= 50
+    assert summary["stages_ms"]["retrieval"] >= 50
+
+
+def test_batch_summary_includes_synthesis_from_worker_threads():
+    metrics.new_request("lote")
+    service = RagService(StubQueryEngine(StubRetriever()), embed_model=StubEmbedding())
+    service.answer_batch(["a", "bb"], max_concurrency=2)
+    stages = metrics.request_stats()["stages"]
+    assert {"embedding", "retrieval", "synthesis", "prompt_assembly"} <= set(stages)
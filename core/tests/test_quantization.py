@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+
+from mmap_store import MmapNodeStore, normalize_rows, write_store
+from numpy_retriever import NumpyRetriever
+from quantization import QuantizedCodes, QuantizedRetriever, resolve_quantization
+
+ROWS, DIM, TOP_K = 3000, 64, 5
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    # Grupos de vizinhos próximos: a varredura grosseira precisa ordenar de fato
+    rng = np.random.default_rng(0)
+    centers = normalize_rows(rng.standard_normal((300, DIM)).astype(np.float32))
+    matrix = centers[rng.integers(0, len(centers), ROWS)]
+    matrix = matrix + rng.normal(scale=0.3 / np.sqrt(DIM), size=matrix.shape).astype(np.float32)
+    queries = matrix[rng.integers(0, ROWS, 100)] + rng.normal(scale=0.1 / np.sqrt(DIM), size=(100, DIM))
+    return matrix.astype(np.float32), queries.astype(np.float32)
+
+
+def exact_top_k(matrix, queries):
+    nodes = [TextNode(text="", id_=str(i)) for i in range(len(matrix))]
+    return NumpyRetriever(matrix, lambda rows: [nodes[i] for i in rows]).top_k(queries, TOP_K)
+
+
+def recall(got, expected):
+    return sum(len(set(g) & set(e)) for g, e in zip(got, expected)) / expected.size
+
+
+@pytest.mark.parametrize("kind, candidates, min_recall", [("int8", 20, 0.99), ("binary", 100, 0.9)])
+def test_ranking_matches_exact_search(corpus, kind, candidates, min_recall):
+    matrix, queries = corpus
+    expected, expected_scores = exact_top_k(matrix, queries)
+    retriever = QuantizedRetriever(matrix, None, kind=kind, candidates=candidates)
+    got, scores = retriever.top_k(queries, TOP_K)
+    assert recall(got, expected) >= min_recall
+    # Os scores devolvidos são os exatos (re-ranqueamento com os vetores float)
+    exact = normalize_rows(queries) @ normalize_rows(matrix).T
+    np.testing.assert_allclose(scores, np.take_along_axis(exact, got, axis=1), rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize("kind", ["int8", "binary"])
+def test_all_candidates_equals_exact_search(corpus, kind):
+    matrix, queries = corpus
+    expected, _ = exact_top_k(matrix, queries)
+    got, _ = QuantizedRetriever(matrix, None, kind=kind, candidates=ROWS).top_k(queries, TOP_K)
+    np.testing.assert_array_equal(got, expected)
+
+
+@pytest.mark.parametrize("kind", ["int8", "binary"])
+def test_store_codes_and_pread_rescoring(tmp_path, corpus, kind):
+    matrix, queries = corpus
+    nodes = [TextNode(text=f"nó {i}", id_=str(i)) for i in range(len(matrix))]
+    write_store(str(tmp_path), nodes, matrix, lexical=False, quantization=kind)
+    store = MmapNodeStore.open(str(tmp_path))
+    retriever = QuantizedRetriever.from_store(store, similarity_top_k=TOP_K, candidates=ROWS)
+    in_memory = QuantizedCodes.from_matrix(normalize_rows(matrix), kind)
+    np.testing.assert_array_equal(np.asarray(retriever.codes.codes), in_memory.codes)
+    expected, _ = exact_top_k(matrix, queries)
+    got, _ = retriever.top_k(queries, TOP_K)
+    np.testing.assert_array_equal(got, expected)
+
+
+@pytest.mark.parametrize("setting, manifest", [
+    ("binary", None),
+    ("auto", {"quantization": {"kind": "binary"}}),
+])
+def test_binary_search_requires_explicit_opt_in(setting, manifest):
+    with pytest.raises(ValueError, match="QUANT_ALLOW_BINARY"):
+        resolve_quantization(setting, manifest, allow_binary=False)
+    assert resolve_quantization(setting, manifest, allow_binary=True) == "binary"
+
+
+def test_int8_and_auto_resolve_without_opt_in():
+    assert resolve_quantization("int8", allow_binary=False) == "int8"
+    assert resolve_quantization("auto", {"quantization": {"kind": "int8"}}, allow_binary=False) == "int8"
+    assert resolve_quantization("auto", {}, allow_binary=False) is None
@@ -0,0 +1,66 @@
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from rag_service import RagService
+
+
+class StubEmbedding:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+
+    def get_query_embedding(self, question):
+        if question in self.fail:
+            raise RuntimeError("falha no embedding")
+        return [float(len(question)), 1.0]
+
+
+class StubRetriever:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+
+    def retrieve(self, bundle):
+        if bundle.query_str in self.fail:
+            raise RuntimeError("falha na recuperação")
+        return [NodeWithScore(node=TextNode(text=f"contexto de {bundle.query_str}"), score=1.0)]
+
+    def retrieve_batch(self, bundles):
+        return [self.retrieve(bundle) for bundle in bundles]
+
+
+class StubQueryEngine:
+    def __init__(self, retriever, fail=()):
+        self.retriever = retriever
+        self.fail = set(fail)
+
+    def synthesize(self, bundle, nodes):
+        if bundle.query_str in self.fail:
+            raise RuntimeError("falha no LLM")
+        return f"resposta para {bundle.query_str}"
+
+
+def make_service(embed_fail=(), retrieve_fail=(), synth_fail=()):
+    engine = StubQueryEngine(StubRetriever(retrieve_fail), synth_fail)
+    return RagService(engine, embed_model=StubEmbedding(embed_fail))
+
+
+def test_answer_batch_keeps_order():
+    results = make_service().answer_batch(["a", "bb", "ccc"])
+    assert [r["answer"] for r in results] == ["resposta para a", "resposta para bb", "resposta para ccc"]
+
+
+def test_answer_batch_isolates_embedding_failure():
+    results = make_service(embed_fail={"bb"}).answer_batch(["a", "bb", "ccc"])
+    assert results[0]["answer"] == "resposta para a"
+    assert "error" in results[1]
+    assert results[2]["answer"] == "resposta para ccc"
+
+
+def test_answer_batch_isolates_retrieval_failure():
+    results = make_service(retrieve_fail={"a"}).answer_batch(["a", "bb", "ccc"])
+    assert "error" in results[0]
+    assert [r["answer"] for r in results[1:]] == ["resposta para bb", "resposta para ccc"]
+
+
+def test_answer_batch_isolates_synthesis_failure():
+    results = make_service(synth_fail={"ccc"}).answer_batch(["a", "bb", "ccc"])
+    assert [r.get("answer") for r in results[:2]] == ["resposta para a", "resposta para bb"]
+    assert "error" in results[2]
@@ -0,0 +1,68 @@
+import json
+import os
+
+from llama_index.core import MockEmbedding
+
+from mmap_store import MANIFEST_FILE
+from reindex import reindex
+
+
+def make_data(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "a.txt").write_text("Plantio de milho no sítio. " * 20, encoding="utf-8")
+    (data_dir / "b.txt").write_text("Irrigação por gotejamento. " * 20, encoding="utf-8")
+    return str(data_dir)
+
+
+def run(data_dir, out_dir, loads, **kwargs):
+    def load_embed_model():
+        loads.append(1)
+        return MockEmbedding(embed_dim=8)
+
+    return reindex(data_dir, out_dir, "mock", load_embed_model, parse_workers=1, **kwargs)
+
+
+def read_manifest(out_dir):
+    with open(os.path.join(out_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_unchanged_run_skips_write(tmp_path):
+    data_dir, out_dir, loads = make_data(tmp_path), str(tmp_path / "idx"), []
+    first = run(data_dir, out_dir, loads)
+    assert first["chunks_embedded"] > 0
+    mtime = os.path.getmtime(os.path.join(out_dir, MANIFEST_FILE))
+
+    second = run(data_dir, out_dir, loads)
+    assert second["chunks_embedded"] == 0
+    assert os.path.getmtime(os.path.join(out_dir, MANIFEST_FILE)) == mtime
+    assert len(loads) == 1
+
+
+def test_dtype_change_rewrites_without_reembedding(tmp_path):
+    data_dir, out_dir, loads = make_data(tmp_path), str(tmp_path / "idx"), []
+    run(data_dir, out_dir, loads)
+
+    stats = run(data_dir, out_dir, loads, dtype="float16")
+    assert stats["chunks_embedded"] == 0
+    assert read_manifest(out_dir)["dtype"] == "float16"
+    assert len(loads) == 1
+
+
+def test_float16_to_float32_reembeds(tmp_path):
+    data_dir, out_dir, loads = make_data(tmp_path), str(tmp_path / "idx"), []
+    run(data_dir, out_dir, loads, dtype="float16")
+
+    stats = run(data_dir, out_dir, loads)
+    assert stats["chunks_embedded"] > 0
+    assert read_manifest(out_dir)["dtype"] == "float32"
+
+
+def test_quantization_change_rewrites(tmp_path):
+    data_dir, out_dir, loads = make_data(tmp_path), str(tmp_path / "idx"), []
+    run(data_dir, out_dir, loads)
+
+    stats = run(data_dir, out_dir, loads, quantization="int8")
+    assert stats["chunks_embedded"] == 0
+    assert read_manifest(out_dir)["quantization"]["kind"] == "int8"
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_router import LLMBackend, RouterLLM
+from single_flight import SingleFlight, SingleFlightTimeout, single_flight_timeout
+from test_llm_router import StubLLM
+
+
+def test_follower_times_out_while_leader_still_succeeds():
+    flight = SingleFlight(directory=None, timeout=0.1)
+    started = threading.Event()
+    results = {}
+
+    def slow():
+        started.set()
+        time.sleep(0.4)
+        return "resposta"
+
+    leader = threading.Thread(target=lambda: results.setdefault("leader", flight.do("k", slow)))
+    leader.start()
+    started.wait()
+    with pytest.raises(SingleFlightTimeout):
+        flight.do("k", lambda: "não deveria rodar")
+    leader.join()
+    assert results["leader"] == "resposta"
+    assert flight.in_flight() == 0
+
+
+def test_async_follower_times_out_while_leader_still_succeeds():
+    flight = SingleFlight(directory=None, timeout=0.1)
+
+    async def slow():
+        await asyncio.sleep(0.4)
+        return "resposta"
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("k", slow))
+        await asyncio.sleep(0)
+        with pytest.raises(SingleFlightTimeout):
+            await flight.ado("k", slow)
+        return await leader
+
+    assert asyncio.run(main()) == "resposta"
+
+
+def test_followers_share_the_leader_result():
+    flight = SingleFlight(directory=None, timeout=5)
+    calls = []
+    barrier = threading.Event()
+
+    def slow():
+        calls.append(1)
+        barrier.wait(1)
+        return "resposta"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    barrier.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["resposta"] * 4
+    assert len(calls) == 1
+
+
+def test_default_timeout_covers_router_worst_case():
+    router = RouterLLM([LLMBackend("a", StubLLM(), timeout=60), LLMBackend("b", StubLLM(), timeout=45)])
+    assert router.worst_case_seconds == 105
+    assert single_flight_timeout(router, setting=None, margin=30) == 135
+    assert single_flight_timeout(router, setting="20") == 20
@@ -0,0 +1,35 @@
+"""Configuração do gunicorn (lida automaticamente quando executado da raiz do repositório).
+
+Procfile:  gunicorn core.geminichatbot_railway:app
+Em core/:  gunicorn -c ../gunicorn.conf.py geminichatbot:app
+
+Com GUNICORN_PRELOAD=1 (padrão) o app é importado e inicializado (modelo de
+embedding + índice) uma vez no master, antes do fork dos workers. Os clientes
+de rede (Gemini via REST, Ollama) são recriados em cada worker no post_fork.
+"""
+import gc
+import os
+import sys
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "180"))
+
+if preload_app:
+    # Lido por boot.is_prefork() durante o import do app no master
+    os.environ["CHATBOT_PREFORK"] = "1"
+    # Sem coletas durante o carregamento: os objetos vão direto para o gc.freeze() do pre_fork
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    boot = sys.modules.get("boot")
+    if boot is not None:
+        boot.freeze_for_fork()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    boot = sys.modules.get("boot")
+    if boot is not None:
+        boot.run_post_fork_hooks()